@@ -0,0 +1,69 @@
+"""
+Batch evaluation of many Soliterm positions at once.
+
+Takes a stack of N boards as an (N, 15, 15) array in the same encoding
+as GameBoard.board_arr - 0 for an empty hole, 1 for a peg and 2 for an
+unplayable space - and works out the number of legal moves, whether any
+moves are left, whether the game is won and the number of pegs for
+every board in a few NumPy passes, instead of one GameBoard at a time.
+
+The stack is processed in chunks, so the temporary arrays never grow
+beyond a fixed size however many boards are given.
+"""
+
+import numpy as np
+from engine import jump_masks
+
+# Number of boards processed in each pass
+DEFAULT_CHUNK = 65536
+
+
+def stack_boards(game_boards):
+    """
+    Returns an (N, 15, 15) array stacking the board arrays of a list
+    of GameBoards.
+    """
+    return np.stack([game_board.board_arr for game_board in game_boards])
+
+
+def evaluate_boards(boards, chunk_size=DEFAULT_CHUNK, finish=None):
+    """
+    Evaluates a stack of boards given as an (N, rows, columns) array.
+    finish is the (row, column) of the hole the last peg must finish in,
+    defaulting to the middle of the board.
+    Returns a dictionary of arrays with one entry for each board:
+    move_counts - number of legal moves
+    has_moves - True if there are any legal moves, as eval_moves()
+    wins - True if the game is won, as check_win()
+    peg_counts - number of pegs on the board
+    """
+    boards = np.asarray(boards)
+    if boards.ndim != 3:
+        raise ValueError(f"Expected an (N, rows, columns) array of boards, "
+                         f"got shape {boards.shape}")
+
+    num_boards = boards.shape[0]
+    if finish is None:
+        finish = (boards.shape[1] // 2, boards.shape[2] // 2)
+    move_counts = np.zeros(num_boards, dtype=np.int32)
+    peg_counts = np.zeros(num_boards, dtype=np.int32)
+    finish_pegs = np.zeros(num_boards, dtype=bool)
+
+    for start in range(0, num_boards, chunk_size):
+        chunk = boards[start:start + chunk_size]
+        pegs = chunk == 1
+        end = start + chunk.shape[0]
+
+        # Count the legal jumps in each direction for every board at once
+        for (mask, _, _) in jump_masks(pegs, chunk == 0):
+            move_counts[start:end] += np.count_nonzero(mask, axis=(1, 2))
+
+        peg_counts[start:end] = np.count_nonzero(pegs, axis=(1, 2))
+        finish_pegs[start:end] = pegs[:, finish[0], finish[1]]
+
+    return {
+        "move_counts": move_counts,
+        "has_moves": move_counts > 0,
+        "wins": (peg_counts == 1) & finish_pegs,
+        "peg_counts": peg_counts
+    }
@@ -0,0 +1,528 @@
+"""
+Benchmarks for the hot paths of Soliterm.
+
+Times validate_format(), validate_move(), eval_moves(), update_stats()
+and draw_board() against a corpus of mid-game positions, drawing into a
+fake in-memory curses window so no terminal is needed, and times whole
+simulated games. The bytes curses actually sends to the terminal for
+each board drawn are measured separately, by drawing the same positions
+with real curses on a pseudo terminal and counting what comes out of it.
+Results are compared with the baselines stored in bench_baseline.json,
+and the run fails if anything is slower, or sends more bytes, than its
+baseline by more than the threshold.
+
+Baselines depend on the machine, so record them on a machine like the
+one the game is deployed to.
+
+Usage:
+python3 bench.py
+python3 bench.py --update-baseline
+python3 bench.py --threshold 1.5
+"""
+
+import argparse
+import copy
+import curses
+import fcntl
+import json
+import os
+import pty
+import random
+import struct
+import sys
+import termios
+import time
+from unittest import mock
+import numpy as np
+import engine
+from engine import (validate_format, validate_move, eval_moves, legal_moves,
+                    apply_jump, jump_to_text)
+from run import TermManager, draw_board
+from batch import stack_boards, evaluate_boards
+from prefork import TERM_NAME, TERM_ROWS, TERM_COLS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "bench_baseline.json")
+
+# A benchmark fails if it takes longer than its baseline times this
+DEFAULT_THRESHOLD = 1.5
+
+# Number of runs of the whole suite used to record a baseline - the
+# fastest time for each benchmark is kept
+BASELINE_RUNS = 3
+
+# Seed for the random games used to build the corpus, so every run
+# measures the same positions
+CORPUS_SEED = 2022
+
+# Number of games in the corpus, and the turns at which a position is
+# taken from each game
+CORPUS_GAMES = 20
+CORPUS_TURNS = (10, 25, 40, 55)
+
+# Number of times each benchmark is repeated - the fastest is used
+REPEATS = 9
+
+# Number of times very quick operations are run per repeat, so that
+# each timing is long enough to be reliable
+INNER_LOOPS = 50
+
+# Number of games played by the full game benchmarks
+SIM_GAMES = 10
+
+# Written to the pseudo terminal after each board drawn, so the output
+# can be split into frames. curses never sends a NUL byte.
+FRAME_MARKER = b"\0frame\0"
+
+# Inputs for timing validate_format(), including invalid ones
+FORMAT_INPUTS = ["h10d", "n6l", "a5r", "o15u", "H8U", "q", "i", "zz",
+                 "p10d", "h0d", "h10x", "h1", "abcd", ""]
+
+
+class FakeWindow:
+    """
+    In-memory stand in for a curses window. Counts the calls made
+    and the bytes of text drawn.
+    """
+    def __init__(self):
+        """
+        Initialise an instance of FakeWindow with zeroed counters.
+        """
+        self.calls = 0
+        self.bytes = 0
+
+    def addstr(self, row, column, string, attr=0):
+        """
+        Counts a string drawn in the window.
+        """
+        self.calls += 1
+        self.bytes += len(string.encode("utf-8"))
+
+    def clear(self):
+        """
+        Counts clearing the window.
+        """
+        self.calls += 1
+
+    def noutrefresh(self):
+        """
+        Counts refreshing the window.
+        """
+        self.calls += 1
+
+    refresh = noutrefresh
+    move = addstr
+    clrtoeol = clear
+
+
+class FakeTermManager(TermManager):
+    """
+    TermManager with fake windows, so the drawing functions can be
+    run without a terminal.
+    """
+    def __init__(self):  # pylint: disable=super-init-not-called
+        """
+        Initialise an instance of FakeTermManager with fake windows.
+        """
+        self.stdscr = FakeWindow()
+        self.top_win = FakeWindow()
+        self.bottom_win = FakeWindow()
+        self.drawn_board = None
+        self.curses_calls = 0
+
+
+def fake_curses():
+    """
+    Returns a context manager that replaces the curses functions used
+    by draw_board() that would otherwise need a terminal.
+    """
+    return mock.patch.multiple(curses, color_pair=lambda pair: pair << 8,
+                               doupdate=lambda: None)
+
+
+def build_corpus():
+    """
+    Plays seeded random games and returns a list of the GameBoard
+    positions reached at each of CORPUS_TURNS.
+    """
+    rand = random.Random(CORPUS_SEED)
+    corpus = []
+    while len(corpus) < CORPUS_GAMES * len(CORPUS_TURNS):
+        game_board = engine.new_game()
+        while eval_moves(game_board) and game_board.num_turns < max(
+                CORPUS_TURNS):
+            apply_jump(game_board, rand.choice(sorted(game_board.moves)))
+            if game_board.num_turns in CORPUS_TURNS:
+                corpus.append(copy.deepcopy(game_board))
+
+    return corpus
+
+
+def best_time(func, count):
+    """
+    Runs func REPEATS times and returns the fastest time in seconds
+    divided by count, the number of operations func performs.
+    """
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times) / count
+
+
+def bench_validate_format():
+    """
+    Time to validate the format of one move.
+    """
+    inputs = FORMAT_INPUTS * INNER_LOOPS * 10
+
+    def run():
+        for move in inputs:
+            validate_format(move)
+
+    return best_time(run, len(inputs))
+
+
+def bench_validate_move(corpus):
+    """
+    Time to validate one move, valid or invalid, in mid-game positions.
+    """
+    checks = []
+    for game_board in corpus:
+        for move in sorted(game_board.moves)[:3]:
+            checks.append((validate_format(jump_to_text(move)), game_board))
+        for move in ("h8u", "a1d", "g6r"):
+            checks.append((validate_format(move), game_board))
+
+    checks = checks * INNER_LOOPS
+
+    def run():
+        for (formatted_move, game_board) in checks:
+            validate_move(formatted_move, game_board)
+
+    return best_time(run, len(checks))
+
+
+def bench_eval_moves(corpus):
+    """
+    Time to check whether a mid-game position has any moves left.
+    """
+    boards = corpus * INNER_LOOPS
+
+    def run():
+        for game_board in boards:
+            eval_moves(game_board)
+
+    return best_time(run, len(boards))
+
+
+def bench_legal_moves(corpus):
+    """
+    Time to list every legal move in a mid-game position.
+    """
+    def run():
+        for game_board in corpus:
+            legal_moves(game_board)
+
+    return best_time(run, len(corpus))
+
+
+def bench_evaluate_boards(corpus):
+    """
+    Time per board to evaluate a large stack of mid-game positions
+    in one batch.
+    """
+    boards = np.repeat(stack_boards(corpus), INNER_LOOPS * 10, axis=0)
+    return best_time(lambda: evaluate_boards(boards), len(boards))
+
+
+def bench_update_stats(corpus):
+    """
+    Time to update the game stats after a move.
+    """
+    boards = [copy.deepcopy(game_board) for game_board in corpus]
+    boards = boards * INNER_LOOPS
+
+    def run():
+        for game_board in boards:
+            game_board.update_stats()
+
+    return best_time(run, len(boards))
+
+
+def bench_update_board(corpus):
+    """
+    Time to apply one move to a mid-game position.
+    Boards are copied outside the timed section.
+    """
+    times = []
+    for _ in range(REPEATS):
+        boards = [copy.deepcopy(game_board) for game_board in corpus]
+        moves = [min(game_board.moves) for game_board in boards]
+        start = time.perf_counter()
+        for (game_board, (from_cell, over_cell, to_cell)) in zip(boards,
+                                                                 moves):
+            game_board.update_board({"valid": True, "from": from_cell,
+                                     "to": to_cell, "remove": over_cell})
+        times.append(time.perf_counter() - start)
+
+    return min(times) / len(corpus)
+
+
+def bench_draw_board_full(corpus):
+    """
+    Time to draw a mid-game position from scratch.
+    """
+    term_manager = FakeTermManager()
+
+    def run():
+        for game_board in corpus:
+            term_manager.drawn_board = None
+            draw_board(game_board, term_manager)
+
+    with fake_curses():
+        return best_time(run, len(corpus))
+
+
+def bench_draw_board_turn(corpus):
+    """
+    Time to redraw the board after one move.
+    """
+    pairs = []
+    for game_board in corpus:
+        after = copy.deepcopy(game_board)
+        apply_jump(after, min(after.moves))
+        pairs.append((game_board.board_arr.copy(), after))
+    term_manager = FakeTermManager()
+
+    def run():
+        for (before, after) in pairs:
+            term_manager.drawn_board = before
+            draw_board(after, term_manager)
+
+    with fake_curses():
+        return best_time(run, len(pairs))
+
+
+def draw_frames(corpus):
+    """
+    Runs in a process forked onto a pseudo terminal. Draws each position
+    in the corpus from scratch and then after one more move, with real
+    curses, writing FRAME_MARKER to the terminal after each one. Never
+    returns.
+    """
+    def draw(stdscr):
+        term_manager = TermManager(stdscr)
+        stdscr.refresh()
+        os.write(sys.stdout.fileno(), FRAME_MARKER)
+        for game_board in corpus:
+            after = copy.deepcopy(game_board)
+            apply_jump(after, min(after.moves))
+            term_manager.drawn_board = None
+            for position in (game_board, after):
+                draw_board(position, term_manager)
+                os.write(sys.stdout.fileno(), FRAME_MARKER)
+
+    status = 1
+    try:
+        os.environ["TERM"] = TERM_NAME
+        fcntl.ioctl(sys.stdin.fileno(), termios.TIOCSWINSZ,
+                    struct.pack("HHHH", TERM_ROWS, TERM_COLS, 0, 0))
+        curses.wrapper(draw)
+        status = 0
+    finally:
+        os._exit(status)  # pylint: disable=protected-access
+
+
+def measure_terminal_bytes(corpus):
+    """
+    Bytes sent to the terminal to draw a position from scratch, and to
+    redraw it after one move, on average over the corpus.
+    Returns a dictionary of name: bytes.
+    """
+    (pid, master_fd) = pty.fork()
+    if pid == 0:
+        draw_frames(corpus)
+
+    # Reading the terminal fails with EIO once the child has exited
+    output = []
+    while True:
+        try:
+            data = os.read(master_fd, 65536)
+        except OSError:
+            break
+        if not data:
+            break
+        output.append(data)
+    os.close(master_fd)
+    (_, status) = os.waitpid(pid, 0)
+
+    # The first part is curses starting up and the last is it ending.
+    # The frames in between alternate between full draws and turns.
+    frames = b"".join(output).split(FRAME_MARKER)[1:-1]
+    if status != 0 or len(frames) != 2 * len(corpus):
+        sys.exit("Could not draw the board on a pseudo terminal")
+    return {
+        "terminal_bytes_full": sum(map(len, frames[0::2])) / len(corpus),
+        "terminal_bytes_turn": sum(map(len, frames[1::2])) / len(corpus)
+    }
+
+
+def simulate_games(num_games, seed):
+    """
+    Plays seeded random games through the same steps as the main loop,
+    drawing to a fake window. Returns the total number of turns played.
+    """
+    rand = random.Random(seed)
+    term_manager = FakeTermManager()
+    turns = 0
+    with fake_curses():
+        for _ in range(num_games):
+            game_board = engine.new_game()
+            draw_board(game_board, term_manager)
+            while eval_moves(game_board):
+                move = jump_to_text(rand.choice(sorted(game_board.moves)))
+                validated_move = validate_move(validate_format(move),
+                                               game_board)
+                game_board.update_board(validated_move)
+                game_board.update_stats()
+                draw_board(game_board, term_manager)
+                turns += 1
+
+    return turns
+
+
+def bench_game_turn():
+    """
+    Time for one turn of a simulated game, from validating the
+    input to redrawing the board.
+    """
+    turns = simulate_games(SIM_GAMES, CORPUS_SEED)
+    return best_time(lambda: simulate_games(SIM_GAMES, CORPUS_SEED), turns)
+
+
+def bench_game():
+    """
+    Time to play a whole simulated game.
+    """
+    return best_time(lambda: simulate_games(SIM_GAMES, CORPUS_SEED),
+                     SIM_GAMES)
+
+
+# Benchmarks to run, each taking the corpus of positions
+BENCHMARKS = {
+    "validate_format": lambda corpus: bench_validate_format(),
+    "validate_move": bench_validate_move,
+    "eval_moves": bench_eval_moves,
+    "legal_moves": bench_legal_moves,
+    "evaluate_boards": bench_evaluate_boards,
+    "update_stats": bench_update_stats,
+    "update_board": bench_update_board,
+    "draw_board_full": bench_draw_board_full,
+    "draw_board_turn": bench_draw_board_turn,
+    "game_turn": lambda corpus: bench_game_turn(),
+    "game": lambda corpus: bench_game()
+}
+
+# Measurements of the bytes sent to the terminal rather than times,
+# taken from measure_terminal_bytes()
+OUTPUT_BENCHMARKS = ("terminal_bytes_full", "terminal_bytes_turn")
+
+# Number of times a benchmark slower than its baseline is run again
+# before it fails, so a busy machine does not cause false failures
+RETRIES = 2
+
+
+def run_benchmarks(baselines, threshold):
+    """
+    Runs every benchmark and returns a dictionary of
+    name: seconds per operation, or bytes for OUTPUT_BENCHMARKS.
+    Benchmarks slower than their baseline are run again, up to RETRIES
+    times, keeping the fastest time.
+    """
+    corpus = build_corpus()
+    results = {}
+    for (name, bench) in BENCHMARKS.items():
+        results[name] = bench(corpus)
+        for _ in range(RETRIES):
+            if name not in baselines or (
+                    results[name] <= baselines[name] * threshold):
+                break
+            results[name] = min(results[name], bench(corpus))
+
+    # The bytes sent are the same every run, so are only measured once
+    results.update(measure_terminal_bytes(corpus))
+    return results
+
+
+def compare(results, baselines, threshold):
+    """
+    Prints each result against its baseline.
+    Returns a list of the names of benchmarks that are slower, or send
+    more bytes, than their baseline by more than the threshold.
+    """
+    def value(name, amount):
+        if name in OUTPUT_BENCHMARKS:
+            return f"{amount:>11.0f}B"
+        return f"{amount * 1e6:>10.2f}us"
+
+    failures = []
+    print(f"{'benchmark':<20}{'result':>12}{'baseline':>12}{'ratio':>8}")
+    for (name, amount) in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<20}{value(name, amount)}{'-':>12}{'-':>8}")
+            continue
+
+        ratio = amount / baseline
+        flag = ""
+        if ratio > threshold:
+            failures.append(name)
+            flag = "  SLOWER" if name not in OUTPUT_BENCHMARKS else "  LARGER"
+        print(f"{name:<20}{value(name, amount)}{value(name, baseline)}"
+              f"{ratio:>8.2f}{flag}")
+
+    return failures
+
+
+def main():
+    """
+    Command line entry point to run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark Soliterm")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="file holding the baseline timings")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="save this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fail if slower than baseline times this")
+    args = parser.parse_args()
+
+    if args.update_baseline:
+        runs = [run_benchmarks({}, args.threshold)
+                for _ in range(BASELINE_RUNS)]
+        results = {name: min(run[name] for run in runs)
+                   for name in runs[0]}
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write("\n")
+        compare(results, {}, args.threshold)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baselines = json.load(baseline_file)
+    except FileNotFoundError:
+        baselines = {}
+
+    results = run_benchmarks(baselines, args.threshold)
+    failures = compare(results, baselines, args.threshold)
+    if failures:
+        sys.exit(f"Worse than baseline: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
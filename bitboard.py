@@ -0,0 +1,275 @@
+"""
+Packed 'bitboard' representation of the Soliterm game board.
+
+Each hole of the 15 x 15 board is stored as one bit of a Python integer.
+Rows are ROW_STRIDE (16) bits apart, so the bit for a cell is
+row * 16 + column. The 16th bit of every row is never playable, which
+stops a jump from wrapping around from the end of one row to the start of
+the next when the whole board is shifted.
+
+Two integers describe a position:
+playable = a mask with a bit set for every real hole on the board
+pegs = a bit set for every hole that contains a peg
+"""
+
+# Number of bits between the start of one row and the next
+ROW_STRIDE = 16
+
+# Size of the square grid the board sits in
+BOARD_SIZE = 15
+
+# Number of bits to move one cell in each direction
+DIRECTION_STEPS = {
+    "u": -ROW_STRIDE,
+    "d": ROW_STRIDE,
+    "l": -1,
+    "r": 1
+}
+
+
+def cell_bit(row, column):
+    """
+    Returns the bit number for the cell at row, column.
+    """
+    return row * ROW_STRIDE + column
+
+
+def bit_cell(bit):
+    """
+    Returns a (row, column) tuple for a bit number.
+    """
+    return divmod(bit, ROW_STRIDE)
+
+
+def from_array(board_arr):
+    """
+    Packs a 2D board array using the GameBoard values
+    (0 = empty hole, 1 = peg, 2 = unplayable space).
+    Returns a tuple of (pegs, playable) bitboards.
+    """
+    pegs = 0
+    playable = 0
+    for row, col_arr in enumerate(board_arr):
+        for column, cell in enumerate(col_arr):
+            if cell == 2:
+                continue
+            bit = 1 << cell_bit(row, column)
+            playable |= bit
+            if cell == 1:
+                pegs |= bit
+
+    return (pegs, playable)
+
+
+def popcount(bits):
+    """
+    Returns the number of set bits, i.e. the number of pegs
+    in a pegs bitboard.
+    """
+    return bin(bits).count("1")
+
+
+def shift_back(bits, step):
+    """
+    Shifts a whole bitboard so the bit that was step places ahead of
+    each cell lands on that cell. This lets every cell 'look' at its
+    neighbour in one operation.
+    """
+    if step > 0:
+        return bits >> step
+    return bits << -step
+
+
+def jump_sources(pegs, playable, direction):
+    """
+    Returns a bitboard of every peg that can legally jump
+    in the given direction ('u', 'd', 'l' or 'r').
+    A peg can jump if the next cell holds a peg and the cell after
+    that is an empty hole.
+    """
+    step = DIRECTION_STEPS[direction]
+    empty = playable & ~pegs
+    return pegs & shift_back(pegs, step) & shift_back(empty, 2 * step)
+
+
+def any_jumps(pegs, playable):
+    """
+    Returns True if any peg on the board can make a legal jump.
+    """
+    for direction in DIRECTION_STEPS:
+        if jump_sources(pegs, playable, direction):
+            return True
+
+    return False
+
+
+def jump_bits(row, column, direction):
+    """
+    Returns a (from, over, to) tuple of bit numbers for a jump
+    starting at row, column in the given direction.
+    Bit numbers may fall outside the board for jumps off the edge,
+    so callers should test them against a playable mask.
+    """
+    step = DIRECTION_STEPS[direction]
+    from_bit = cell_bit(row, column)
+    return (from_bit, from_bit + step, from_bit + 2 * step)
+
+
+def is_legal_jump(pegs, playable, from_bit, over_bit, to_bit):
+    """
+    Returns True if a jump given as (from, over, to) bit numbers is
+    legal in the position.
+    """
+    if from_bit < 0 or over_bit < 0 or to_bit < 0:
+        return False
+
+    # Source and jumped over cells must hold pegs,
+    # the destination must be an empty hole
+    needed = (1 << from_bit) | (1 << over_bit)
+    return (pegs & needed == needed
+            and playable >> to_bit & 1 == 1
+            and pegs >> to_bit & 1 == 0)
+
+
+def apply_jump(pegs, from_bit, over_bit, to_bit):
+    """
+    Returns a new pegs bitboard with a jump applied.
+    The from and over cells are emptied and the to cell filled,
+    which is a single exclusive or of all three bits.
+    """
+    return pegs ^ ((1 << from_bit) | (1 << over_bit) | (1 << to_bit))
+
+
+# Centre hole of the grid, where the last peg must finish on the
+# Soliterm and English boards
+CENTRE_BIT = cell_bit(BOARD_SIZE // 2, BOARD_SIZE // 2)
+
+
+def iter_bits(bits):
+    """
+    Yields the bit number of each set bit, lowest first.
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def jumps(pegs, playable):
+    """
+    Yields a (from, over, to) tuple of bit numbers for every
+    legal jump on the board.
+    """
+    for (direction, step) in DIRECTION_STEPS.items():
+        for from_bit in iter_bits(jump_sources(pegs, playable, direction)):
+            yield (from_bit, from_bit + step, from_bit + 2 * step)
+
+
+# The eight symmetries of a square board - four rotations, each with and
+# without a reflection. Each maps a (row, column) tuple to its image.
+_LAST = BOARD_SIZE - 1
+SYMMETRIES = [
+    lambda row, col: (row, col),
+    lambda row, col: (col, _LAST - row),
+    lambda row, col: (_LAST - row, _LAST - col),
+    lambda row, col: (_LAST - col, row),
+    lambda row, col: (row, _LAST - col),
+    lambda row, col: (_LAST - row, col),
+    lambda row, col: (col, row),
+    lambda row, col: (_LAST - col, _LAST - row)
+]
+
+# Number of bytes needed to hold a whole board
+BOARD_BYTES = (BOARD_SIZE * ROW_STRIDE + 7) // 8
+
+
+def _build_symmetry_tables():
+    """
+    Builds lookup tables to transform a bitboard one byte at a time.
+    For each symmetry other than the identity there is a list with an
+    entry per byte of the board. Each entry is a 256 item list giving the
+    transformed bits for every value that byte can take.
+    """
+    tables = []
+    for symmetry in SYMMETRIES[1:]:
+        byte_tables = []
+        for byte_num in range(BOARD_BYTES):
+            # Image of each single bit in this byte. The unused bit at the
+            # end of each row is never set so maps to nothing.
+            single = []
+            for i in range(8):
+                (row, col) = bit_cell(byte_num * 8 + i)
+                if col >= BOARD_SIZE or row >= BOARD_SIZE:
+                    single.append(0)
+                else:
+                    single.append(1 << cell_bit(*symmetry(row, col)))
+
+            # Each value is the image of the value with its lowest bit
+            # cleared, plus the image of that lowest bit
+            table = [0] * 256
+            for value in range(1, 256):
+                low = value & -value
+                low_num = low.bit_length() - 1
+                table[value] = table[value ^ low] | single[low_num]
+            byte_tables.append(table)
+        tables.append(byte_tables)
+
+    return tables
+
+
+_SYMMETRY_TABLES = _build_symmetry_tables()
+
+
+def symmetric_images(bits):
+    """
+    Returns a list of the bitboard transformed by each of the
+    eight symmetries of the board, starting with the bitboard itself.
+    """
+    data = bits.to_bytes(BOARD_BYTES, "little")
+    images = [bits]
+    for byte_tables in _SYMMETRY_TABLES:
+        image = 0
+        for (table, byte) in zip(byte_tables, data):
+            image |= table[byte]
+        images.append(image)
+
+    return images
+
+
+def canonical(bits):
+    """
+    Returns a canonical form of a bitboard that is the same for
+    all eight rotations and reflections of a position, so that each
+    family of equivalent positions only needs to be stored once.
+    """
+    return min(symmetric_images(bits))
+
+
+def is_symmetric(playable):
+    """
+    Returns True if a board layout looks the same under all eight
+    symmetries, in which case positions can be reduced with canonical().
+    """
+    return all(image == playable for image in symmetric_images(playable))
+
+
+def unjump_targets(pegs, playable, direction):
+    """
+    Returns a bitboard of every peg that could have just arrived by a
+    jump in the given direction, i.e. the two cells behind it are empty
+    holes. Used to work backwards from a position.
+    """
+    step = DIRECTION_STEPS[direction]
+    empty = playable & ~pegs
+    return pegs & shift_back(empty, -step) & shift_back(empty, -2 * step)
+
+
+def unjumps(pegs, playable):
+    """
+    Yields a (from, over, to) tuple of bit numbers for every jump
+    that could have led to this position.
+    Applying one with apply_jump() undoes the jump.
+    """
+    for (direction, step) in DIRECTION_STEPS.items():
+        for to_bit in iter_bits(unjump_targets(pegs, playable, direction)):
+            yield (to_bit - 2 * step, to_bit - step, to_bit)
@@ -0,0 +1,138 @@
+"""
+Local test client for the Soliterm server in server.py.
+
+Connects the terminal it is run in to the server, passing key presses
+to the server and the server's output to the screen, in the same way as
+the terminal in the web page.
+
+With --moves, it instead plays a scripted game without a terminal and
+prints how many bytes the server sent for each key press or move.
+
+Usage:
+python3 client.py --port 8765
+python3 client.py --port 8765 --moves "h10u h7d"
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import termios
+import time
+import tty
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+# Time to wait for the server to finish replying to a scripted move
+REPLY_WAIT = 0.2
+
+
+async def connect(host, port, unix_path):
+    """
+    Opens a connection to the server and returns a (reader, writer) tuple.
+    """
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+
+async def read_reply(reader):
+    """
+    Reads everything the server sends until it goes quiet.
+    Returns a tuple of the bytes received and the time in seconds
+    until the first of them arrived.
+    """
+    start = time.perf_counter()
+    first = None
+    data = b""
+    while True:
+        try:
+            chunk = await asyncio.wait_for(reader.read(65536), REPLY_WAIT)
+        except asyncio.TimeoutError:
+            break
+        if not chunk:
+            break
+        if first is None:
+            first = time.perf_counter() - start
+        data += chunk
+
+    return (data, first or 0.0)
+
+
+async def play_script(reader, writer, moves):
+    """
+    Presses a key to leave the title screen, then enters each move in
+    turn, printing the bytes received and time taken for each reply.
+    """
+    (reply, _) = await read_reply(reader)
+    print(f"title: {len(reply)} bytes")
+    for (label, keys) in [("start", b" ")] + [
+            (move, move.encode("utf-8") + b"\r") for move in moves]:
+        writer.write(keys)
+        await writer.drain()
+        (reply, latency) = await read_reply(reader)
+        print(f"{label}: {len(reply)} bytes, {latency * 1000:.1f}ms")
+    writer.close()
+
+
+async def play_interactive(reader, writer):
+    """
+    Passes key presses from this terminal to the server and the server's
+    output to this terminal until the connection is closed.
+    """
+    loop = asyncio.get_running_loop()
+    stdin = sys.stdin.fileno()
+    stdout = sys.stdout.fileno()
+
+    def send_keys():
+        writer.write(os.read(stdin, 1024))
+
+    loop.add_reader(stdin, send_keys)
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            os.write(stdout, data)
+    finally:
+        loop.remove_reader(stdin)
+        writer.close()
+
+
+async def run_client(args):
+    """
+    Connects to the server and plays either a scripted or
+    interactive game.
+    """
+    (reader, writer) = await connect(args.host, args.port, args.unix)
+    if args.moves is not None:
+        await play_script(reader, writer, args.moves.split())
+        return
+
+    # Put the terminal in raw mode so each key press is sent straight
+    # away, and put it back how it was afterwards
+    saved = termios.tcgetattr(sys.stdin)
+    tty.setraw(sys.stdin)
+    try:
+        await play_interactive(reader, writer)
+    finally:
+        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, saved)
+
+
+def main():
+    """
+    Command line entry point to run the client.
+    """
+    parser = argparse.ArgumentParser(
+        description="Connect to a Soliterm server")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address of the server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="TCP port of the server")
+    parser.add_argument("--unix", help="connect to a Unix socket instead")
+    parser.add_argument("--moves",
+                        help="play these moves instead of reading keys")
+    asyncio.run(run_client(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
 
 exports.install = function () {
 
@@ -15,13 +16,28 @@ function socket() {
 
     this.on('open', function (client) {
 
+        // If SOLITERM_SERVER is set to host:port, connect to the
+        // Python game server instead of spawning a terminal per player
+        if (process.env.SOLITERM_SERVER) {
+            client.tty = connectServer(client, process.env.SOLITERM_SERVER);
+            return;
+        }
+
+        // Pass the browser's session token to the game, so it can save
+        // the game and restore it when the browser reconnects
+        const env = Object.assign({}, process.env);
+        const session = client.query.session;
+        if (typeof session === 'string' && /^[0-9a-f]{32}$/.test(session)) {
+            env.SOLITERM_SESSION = session;
+        }
+
         // Spawn terminal
         client.tty = Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
             cwd: process.env.PWD,
-            env: process.env
+            env: env
         });
 
         client.tty.on('exit', function (code, signal) {
@@ -49,6 +65,39 @@ function socket() {
     });
 }
 
+// Connects a client to the game server in server.py, and returns an
+// object with the same write and kill methods as a spawned terminal
+function connectServer(client, address) {
+
+    const [host, port] = address.split(':');
+    const conn = net.createConnection(parseInt(port), host);
+
+    conn.on('data', function (data) {
+        client.send(data);
+    });
+
+    conn.on('close', function () {
+        if (client.tty) {
+            client.tty = null;
+            client.close();
+            console.log("Server session closed");
+        }
+    });
+
+    conn.on('error', function (err) {
+        console.log('Game server connection error: ', err);
+    });
+
+    return {
+        write: function (msg) {
+            conn.write(msg);
+        },
+        kill: function () {
+            conn.destroy();
+        }
+    };
+}
+
 if (process.env.CREDS != null) {
     console.log("Creating creds.json file.");
     fs.writeFile('creds.json', process.env.CREDS, 'utf8', function (err) {
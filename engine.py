@@ -0,0 +1,462 @@
+"""
+Game engine for Soliterm - a game of Peg Solitaire.
+
+Holds the game board and the rules of the game, with no terminal input or
+output, so that games can be played by the curses frontend in run.py, by
+tests, by batch jobs or by a server.
+
+The stable API is:
+new_game(debug, layout) - returns a GameBoard set up for a new game
+apply_move(game_board, move) - validates and applies a move entered as
+                               text, e.g. 'h10d'
+apply_jump(game_board, jump) - applies a (from, over, to) jump
+legal_moves(game_board) - returns every legal (from, over, to) jump
+status(game_board) - returns PLAYING, WON or LOST
+"""
+
+import numpy as np
+import bitboard
+from layouts import get_layout
+
+# Results returned by apply_move()
+MOVE_OK = "ok"
+INVALID_FORMAT = "invalid format"
+INVALID_MOVE = "invalid move"
+
+# Values returned by status()
+PLAYING = "playing"
+WON = "won"
+LOST = "lost"
+
+# Letters used for columns, and letters used for each direction of a jump
+# given as a (row, column) step
+COLUMN_LETTERS = [chr(n) for n in range(ord("a"), ord("p"))]
+DIRECTION_LETTERS = {
+    (-1, 0): "u",
+    (1, 0): "d",
+    (0, -1): "l",
+    (0, 1): "r"
+}
+
+
+class GameBoard:
+    """
+    Holds a 2D array representing the game board, and a packed
+    bitboard copy of the same position used for the game rules.
+    Stores number of pegs in the board, number of turns and the set of
+    legal moves, and keeps these up to date as moves are made.
+    """
+    def __init__(self, debug=False, layout=None):
+        """
+        Initialise an instance of GameBoard with a 2D array configured
+        for a new gamem and variables to hold number of pegs and turns.
+        Values inside the array:
+        0 = empty hole
+        1 = hole with a peg
+        2 = unplayable 'space' at the edge of the board
+        layout is the board Layout to play on, defaulting to the
+        Soliterm cross.
+        If debug is True, the legal moves and number of pegs are checked
+        against a full recalculation after every move.
+        """
+        self.layout = layout or get_layout()
+        self.board_arr = self.layout.start.copy()
+        # Bitboards of the board - one bit per hole for the pegs, and a
+        # mask of which holes are playable - packed when the layout
+        # was created
+        (self.pegs, self.playable) = (self.layout.pegs, self.layout.playable)
+
+        # Init number of pegs in the board and number of turns.
+        self.num_pegs = bitboard.popcount(self.pegs)
+        self.num_turns = 0
+
+        # Set of legal moves as (from, over, to) tuples of (row, column)
+        # tuples. Kept up to date by update_board() so that it never needs
+        # to be recalculated from scratch.
+        self.moves = set(
+            cells for (_, cells) in self.layout.legal_jumps(self.pegs)
+        )
+        self.debug = debug
+
+    def update_board(self, validated_move):
+        """
+        Accepts a dictionary containing a validated move as an argument,
+        extracts the values and updates the game board data model
+        """
+        # Extract the coordinates of cell the player is moving from,
+        # cell they are moving to and cell of peg to be removed
+        (from_row, from_col) = validated_move["from"]
+        (to_row, to_col) = validated_move["to"]
+        (remove_row, remove_col) = validated_move["remove"]
+
+        # Update cells with correct values
+        self.board_arr[from_row, from_col] = 0
+        self.board_arr[to_row, to_col] = 1
+        self.board_arr[remove_row, remove_col] = 0
+
+        # Keep the bitboard in step with the array
+        changed_bits = (
+            bitboard.cell_bit(from_row, from_col),
+            bitboard.cell_bit(remove_row, remove_col),
+            bitboard.cell_bit(to_row, to_col)
+        )
+        self.pegs = bitboard.apply_jump(self.pegs, *changed_bits)
+
+        # Every jump removes exactly one peg
+        self.num_pegs -= 1
+
+        self.recheck_moves(changed_bits)
+
+    def undo_board(self, validated_move):
+        """
+        Accepts a dictionary containing a move that was the last one
+        applied by update_board(), and puts the peg back where it came
+        from and the removed peg back on the board.
+        """
+        (from_row, from_col) = validated_move["from"]
+        (to_row, to_col) = validated_move["to"]
+        (remove_row, remove_col) = validated_move["remove"]
+
+        self.board_arr[from_row, from_col] = 1
+        self.board_arr[to_row, to_col] = 0
+        self.board_arr[remove_row, remove_col] = 1
+
+        # A jump changes the same three bits whichever way it is made
+        changed_bits = (
+            bitboard.cell_bit(from_row, from_col),
+            bitboard.cell_bit(remove_row, remove_col),
+            bitboard.cell_bit(to_row, to_col)
+        )
+        self.pegs = bitboard.apply_jump(self.pegs, *changed_bits)
+        self.num_pegs += 1
+
+        self.recheck_moves(changed_bits)
+
+    def recheck_moves(self, changed_bits):
+        """
+        Brings the set of legal moves up to date after the cells
+        with the given bit numbers have changed.
+        """
+        # Only jumps that touch one of the changed cells can have become
+        # legal or stopped being legal, so just re-check those
+        jumps_through = self.layout.jumps_through
+        for bit in changed_bits:
+            for (move, cells) in jumps_through[bit]:
+                if bitboard.is_legal_jump(self.pegs, self.playable, *move):
+                    self.moves.add(cells)
+                else:
+                    self.moves.discard(cells)
+
+        if self.debug:
+            self.check_state()
+
+    def set_position(self, pegs, num_turns):
+        """
+        Sets up the board with the pegs in a pegs bitboard, and
+        recalculates the number of pegs and the legal moves from scratch.
+        """
+        # Unpack one bit for each cell, dropping the unused last column
+        # of every row, and keep the unplayable spaces of the layout
+        packed = np.frombuffer(pegs.to_bytes(bitboard.BOARD_BYTES, "little"),
+                               dtype=np.uint8)
+        cells = np.unpackbits(packed, bitorder="little")[
+            :bitboard.BOARD_SIZE * bitboard.ROW_STRIDE].reshape(
+                bitboard.BOARD_SIZE, bitboard.ROW_STRIDE)
+        self.board_arr = np.where(self.layout.start == 2, self.layout.start,
+                                  cells[:, :bitboard.BOARD_SIZE])
+        self.pegs = pegs
+        self.num_pegs = bitboard.popcount(pegs)
+        self.num_turns = num_turns
+        self.moves = set(
+            cells for (_, cells) in self.layout.legal_jumps(self.pegs)
+        )
+
+        if self.debug:
+            self.check_state()
+
+    def update_stats(self):
+        """
+        Increments number of turns. The number of pegs is
+        kept up to date by update_board().
+        """
+        self.num_turns += 1
+
+    def check_state(self):
+        """
+        Checks the incrementally updated number of pegs and set of
+        legal moves against a full recalculation from the board array.
+        Raises RuntimeError if they do not match.
+        """
+        if self.num_pegs != np.count_nonzero(self.board_arr == 1):
+            raise RuntimeError(
+                f"Peg count {self.num_pegs} does not match board")
+        if self.moves != set(legal_moves(self)):
+            raise RuntimeError("Legal moves do not match board")
+
+
+def validate_format(move):
+    """
+    Validates the players move to ensure it is in the right format
+    move argument is the string input by the player.
+
+    Returns a tuple containing a bool to indicate if the move was
+    in a valid format, and the row, column and direction of the move
+    if it was valid. Also returns special values for quit,
+    instructions, hints, undo, redo and going to a turn.
+
+    Row and column are integers, direction is a string.
+    """
+
+    # If player enters q for quit return special value
+    if move.lower() == "q":
+        return(True, -1, 0, "0")
+
+    # If player enters i for instructions return special value
+    if move.lower() == "i":
+        return(True, -2, 0, "0")
+
+    # If player enters h for a hint return special value
+    if move.lower() == "h":
+        return(True, -3, 0, "0")
+
+    # If player enters u or r to undo or redo a move return special value
+    if move.lower() == "u":
+        return(True, -4, 0, "0")
+    if move.lower() == "r":
+        return(True, -5, 0, "0")
+
+    # If player enters t and a turn number return special value,
+    # with the turn number in place of the column
+    if move[:1].lower() == "t" and move[1:].isdecimal():
+        return(True, -6, int(move[1:]), "0")
+
+    # If move is not 3 or 4 characters, it is invalid.
+    if len(move) > 4 or len(move) < 3:
+        return(False, 0, 0, "0")
+
+    # Extract column from move string and ensure lower case
+    column = move[0].lower()
+
+    # If string is 3 characters, row is the second character.
+    # If string is 4 characters, slice out the second and third characters.
+    if len(move) == 3:
+        row = move[1]
+    else:
+        row = move[1:3]
+
+    # Direction is always the last character
+    direction = move[-1].lower()
+
+    # Check if column is within allowed range
+    # and if it is convert to an integer.
+    letters = [chr(n) for n in range(ord("a"), ord("p"))]
+    if column not in letters:
+        return(False, 0, 0, "0")
+    column_num = letters.index(column)
+
+    # Try to convert row to an integer
+    # and convert to zero indexed.
+    # Catch error and return if player did not
+    # enter a number.
+    try:
+        row_num = int(row) - 1
+    except ValueError:
+        return(False, 0, 0, "0")
+
+    # Check if row is in allowed range
+    if row_num not in range(0, 15):
+        return(False, 0, 0, "0")
+
+    # Check if direction is allowed
+    letters = ["u", "d", "l", "r"]
+    if direction not in letters:
+        return(False, 0, 0, "0")
+
+    # Everything checks out, return validated move
+    return(True, row_num, column_num, direction)
+
+
+def validate_move(move, game_board):
+    """
+    Check whether the player's move is valid within the rules.
+    Returns a dictionary containing  a bool to indicate if
+    move is valid, and if valid the location the player has moved
+    from, where they are moving to and which peg to remove.
+    """
+    # Unpack move
+    (_, row_num, column_num, direction) = move
+
+    # Initialise dictionary to hold details of all cells affected by move
+    validated_dict = {
+        "valid": False,
+        "from": (0, 0),
+        "to": (0, 0),
+        "remove": (0, 0)
+    }
+
+    # Moves that do not appear in the layout's jump table would leave
+    # the board or use a cell that is not a hole
+    jump = game_board.layout.jump_at.get((row_num, column_num, direction))
+    if jump is None:
+        return validated_dict
+
+    # The cell moved from and the cell jumped over must have pegs, and the
+    # cell moved to must be an empty hole
+    ((from_bit, over_bit, to_bit), (from_cell, over_cell, to_cell)) = jump
+    needed = 1 << from_bit | 1 << over_bit
+    if game_board.pegs & needed != needed or game_board.pegs >> to_bit & 1:
+        return validated_dict
+
+    validated_dict = {
+        "valid": True,
+        "from": from_cell,
+        "to": to_cell,
+        "remove": over_cell
+    }
+
+    return validated_dict
+
+
+def jump_masks(pegs, empty):
+    """
+    Accepts boolean arrays of the cells holding pegs and the empty holes,
+    either for one board or for a stack of boards with the rows and
+    columns as the last two axes.
+    Returns a list of (mask, offset, step) tuples, one for each direction,
+    where mask marks the legal jumps, offset is the (row, column) offset
+    of the mask from the top left of the board and step is the (row,
+    column) direction of the jump.
+    """
+    # For each direction, line up three overlapping slices of the board so
+    # that the same index refers to the cell moved from, the cell jumped
+    # over and the cell moved to. Slicing rather than wrapping the array
+    # means jumps can never run off one edge and onto the opposite one.
+    return [
+        (pegs[..., 2:, :] & pegs[..., 1:-1, :] & empty[..., :-2, :],
+         (2, 0), (-1, 0)),
+        (pegs[..., :-2, :] & pegs[..., 1:-1, :] & empty[..., 2:, :],
+         (0, 0), (1, 0)),
+        (pegs[..., :, 2:] & pegs[..., :, 1:-1] & empty[..., :, :-2],
+         (0, 2), (0, -1)),
+        (pegs[..., :, :-2] & pegs[..., :, 1:-1] & empty[..., :, 2:],
+         (0, 0), (0, 1))
+    ]
+
+
+def legal_moves(game_board):
+    """
+    Finds every legal jump on the board in one pass.
+    Returns a list of (from, over, to) tuples, where each item is a
+    (row, column) tuple.
+    """
+    board = game_board.board_arr
+    moves = []
+    for (mask, (row_offset, col_offset), (row_step, col_step)) in jump_masks(
+            board == 1, board == 0):
+        for (row, column) in zip(*np.nonzero(mask)):
+            from_row = int(row) + row_offset
+            from_col = int(column) + col_offset
+            moves.append((
+                (from_row, from_col),
+                (from_row + row_step, from_col + col_step),
+                (from_row + 2 * row_step, from_col + 2 * col_step)
+            ))
+
+    return moves
+
+
+def eval_moves(game_board):
+    """
+    Tests whether there are still valid moves left.
+    Returns True or False.
+    """
+    return len(game_board.moves) > 0
+
+
+def check_win(game_board):
+    """
+    Checks if the player has won and
+    returns True or False
+    """
+    # If there is only one peg left and the layout's finish hole
+    # has a peg player must have won.
+    finish_bit = 1 << game_board.layout.finish_bit
+    if game_board.num_pegs == 1 and game_board.pegs & finish_bit:
+        return True
+
+    return False
+
+
+def new_game(debug=False, layout=None):
+    """
+    Returns a GameBoard set up for a new game on a Layout,
+    defaulting to the Soliterm cross.
+    """
+    return GameBoard(debug, layout)
+
+
+def apply_move(game_board, move):
+    """
+    Validates a move entered as text in the same format as the player
+    uses, e.g. 'h10d', and applies it to the game board if it is valid.
+    Returns MOVE_OK, INVALID_FORMAT or INVALID_MOVE.
+    """
+    formatted_move = validate_format(move)
+
+    # Quit, instructions, hints, undo and redo are not moves
+    if formatted_move[0] is False or formatted_move[1] < 0:
+        return INVALID_FORMAT
+
+    validated_move = validate_move(formatted_move, game_board)
+    if validated_move["valid"] is False:
+        return INVALID_MOVE
+
+    game_board.update_board(validated_move)
+    game_board.update_stats()
+    return MOVE_OK
+
+
+def apply_jump(game_board, jump):
+    """
+    Applies a (from, over, to) jump, as returned by legal_moves(),
+    to the game board. The jump must be legal.
+    """
+    (from_cell, over_cell, to_cell) = jump
+    game_board.update_board({
+        "valid": True,
+        "from": from_cell,
+        "to": to_cell,
+        "remove": over_cell
+    })
+    game_board.update_stats()
+
+
+def cell_to_text(cell):
+    """
+    Returns the column letter and row number of a (row, column)
+    cell, e.g. 'h10'.
+    """
+    (row, column) = cell
+    return f"{COLUMN_LETTERS[column]}{row + 1}"
+
+
+def jump_to_text(jump):
+    """
+    Returns the text the player would enter to make a
+    (from, over, to) jump, e.g. 'h10d'.
+    """
+    ((from_row, from_col), (over_row, over_col), _) = jump
+    direction = DIRECTION_LETTERS[(over_row - from_row, over_col - from_col)]
+    return f"{cell_to_text((from_row, from_col))}{direction}"
+
+
+def status(game_board):
+    """
+    Returns PLAYING if there are still moves left, otherwise
+    WON or LOST depending on whether the player has won.
+    """
+    if eval_moves(game_board):
+        return PLAYING
+    if check_win(game_board):
+        return WON
+    return LOST
@@ -0,0 +1,403 @@
+"""
+Compact game records for Soliterm.
+
+Every game can be appended to a log file as a small binary record - an
+8 byte header followed by 2 bytes for each move. A move is stored as
+the (row, column, direction) returned by validate_format(), packed into
+10 bits.
+
+Logs can be replayed in bulk to check that every move was legal and to
+rebuild the final number of pegs and turns of each game. The file is
+read in memory mapped chunks, and moves are checked with precomputed
+bitboard masks, so replaying is limited by reading the file rather than
+by the Python interpreter. Replaying through the full GameBoard rules
+is also available for cross-checking.
+
+Usage to verify a log:
+python3 gamelog.py games.log
+python3 gamelog.py games.log --engine --list
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+import time
+import bitboard
+from engine import GameBoard, validate_move, cell_to_text
+from layouts import layout_by_id
+
+# Log file layout:
+# magic, followed by the records one after another.
+# Each record is a header of start time (Unix seconds), number of moves,
+# result and board layout, followed by one little endian 16 bit code for
+# each move.
+MAGIC = b"SOLIGL01"
+RECORD_HEADER = struct.Struct("<IHBB")
+MOVE_SIZE = 2
+
+# Longest game that fits in a record
+MAX_MOVES = 0xFFFF
+
+# Results stored in a record
+UNFINISHED = 0
+WON = 1
+LOST = 2
+RESULT_NAMES = {UNFINISHED: "unfinished", WON: "won", LOST: "lost"}
+
+# Layout number stored in a record for a custom layout, which cannot
+# be replayed as the layout itself is not recorded
+CUSTOM_LAYOUT = 0xFF
+
+# Cache of move tables for each board, by its playable bitboard. Custom
+# layouts are named after their file, so the name could be the same as
+# a different board's.
+_MOVE_TABLES = {}
+
+# Size of each memory mapped chunk when reading a log. Must hold the
+# longest possible record plus the mmap alignment.
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Direction letters in the order they are numbered in a move code
+DIRECTIONS = "udlr"
+
+
+def encode_move(formatted_move):
+    """
+    Packs a move, as returned by validate_format(), into a move code.
+    Bits 6-9 are the row, bits 2-5 the column and bits 0-1 the direction.
+    """
+    (_, row_num, column_num, direction) = formatted_move
+    return row_num << 6 | column_num << 2 | DIRECTIONS.index(direction)
+
+
+def decode_move(code):
+    """
+    Unpacks a move code into a move in the same format as returned by
+    validate_format().
+    """
+    return (True, code >> 6 & 0xF, code >> 2 & 0xF, DIRECTIONS[code & 3])
+
+
+def move_text(code):
+    """
+    Returns the text the player would enter for a move code, e.g. 'h10d'.
+    """
+    (_, row_num, column_num, direction) = decode_move(code)
+    return f"{cell_to_text((row_num, column_num))}{direction}"
+
+
+def _build_move_table(layout):
+    """
+    Returns a list, indexed by move code, of (needed, to, changed)
+    bitboard masks for a board Layout: the cells that must hold pegs,
+    the cell that must be an empty hole and the cells that change.
+    Codes that are not a jump in the layout's jump table are None.
+    """
+    table = [None] * (1 << 10)
+    for code in range(len(table)):
+        (_, row_num, column_num, direction) = decode_move(code)
+        jump = layout.jump_at.get((row_num, column_num, direction))
+        if jump is None:
+            continue
+        ((from_bit, over_bit, to_bit), _) = jump
+        needed = 1 << from_bit | 1 << over_bit
+        table[code] = (needed, 1 << to_bit, needed | 1 << to_bit)
+
+    return table
+
+
+def _get_move_table(layout):
+    """
+    Returns the move table for a board Layout, building it the first
+    time each board is seen.
+    """
+    if layout.playable not in _MOVE_TABLES:
+        _MOVE_TABLES[layout.playable] = _build_move_table(layout)
+    return _MOVE_TABLES[layout.playable]
+
+
+def pack_record(moves, result, started=None, layout_id=0):
+    """
+    Returns the bytes of a record for a game, given its list of move
+    codes, its result, the Unix time it started and the number of its
+    registered board layout, or None for a custom layout.
+    """
+    if len(moves) > MAX_MOVES:
+        raise ValueError(f"Too many moves for one record: {len(moves)}")
+    if started is None:
+        started = time.time()
+    if layout_id is None:
+        layout_id = CUSTOM_LAYOUT
+    header = RECORD_HEADER.pack(int(started) & 0xFFFFFFFF, len(moves),
+                                result, layout_id)
+    return header + struct.pack(f"<{len(moves)}H", *moves)
+
+
+class GameLog:
+    """
+    Log file that game records are appended to. Each record is written
+    with a single write to a file opened for appending, so several
+    processes can log to the same file.
+    """
+    def __init__(self, path):
+        """
+        Initialise an instance of GameLog, creating the file
+        if it does not exist.
+        """
+        if not os.path.exists(path):
+            _create_log(path)
+        self.log_fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def write(self, moves, result, started=None, layout_id=0):
+        """
+        Appends a record for a game to the log.
+        """
+        os.write(self.log_fd, pack_record(moves, result, started,
+                                          layout_id))
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        os.close(self.log_fd)
+
+
+def _create_log(path):
+    """
+    Creates an empty log file holding just the magic. The file is
+    written to a temporary name and linked into place, so another
+    process can never append to a log without its magic.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    (temp_fd, temp_path) = tempfile.mkstemp(dir=directory)
+    try:
+        os.write(temp_fd, MAGIC)
+        os.close(temp_fd)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temp_path)
+
+
+def open_game_log(path=None):
+    """
+    Opens the log at path, or at the path in the SOLITERM_LOG
+    environment variable if path is not given.
+    Returns a GameLog, or None if no path is set or the file cannot
+    be opened.
+    """
+    if path is None:
+        path = os.environ.get("SOLITERM_LOG")
+    if not path:
+        return None
+
+    try:
+        return GameLog(path)
+    except OSError:
+        return None
+
+
+def iter_records(path, chunk_size=CHUNK_SIZE):
+    """
+    Reads a log file in memory mapped chunks, yielding a
+    (started, result, layout, moves) tuple for each record, where moves
+    is a tuple of move codes.
+    Raises ValueError if the file is not a log or ends part way
+    through a record.
+    """
+    chunk_size = max(chunk_size, RECORD_HEADER.size + MAX_MOVES * MOVE_SIZE
+                     + mmap.ALLOCATIONGRANULARITY)
+
+    with open(path, "rb") as log_file:
+        if log_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Soliterm game log")
+        size = os.fstat(log_file.fileno()).st_size
+        position = len(MAGIC)
+
+        while position < size:
+            # Chunks must start on a multiple of the mmap alignment
+            map_start = position - position % mmap.ALLOCATIONGRANULARITY
+            length = min(chunk_size, size - map_start)
+            with mmap.mmap(log_file.fileno(), length, access=mmap.ACCESS_READ,
+                           offset=map_start) as chunk:
+                offset = position - map_start
+
+                # Read every record that lies wholly within this chunk
+                while offset + RECORD_HEADER.size <= length:
+                    (started, num_moves, result, layout) = (
+                        RECORD_HEADER.unpack_from(chunk, offset))
+                    end = offset + RECORD_HEADER.size + num_moves * MOVE_SIZE
+                    if end > length:
+                        break
+                    moves = struct.unpack_from(f"<{num_moves}H", chunk,
+                                               offset + RECORD_HEADER.size)
+                    yield (started, result, layout, moves)
+                    offset = end
+
+            # A chunk this size always holds a whole record, so if none
+            # was read the file must end part way through one
+            if map_start + offset == position:
+                raise ValueError(f"{path} ends part way through a record "
+                                 f"at byte {position}")
+            position = map_start + offset
+
+
+def replay_moves(moves, layout, pegs=None):
+    """
+    Replays a game's move codes from the start of a board Layout, or from
+    the pegs bitboard if given, using bitboard masks. Returns a dictionary
+    containing a bool to indicate if every move was legal, the final pegs
+    bitboard, the number of pegs left and the number of turns taken.
+    Replay stops at the first illegal move.
+    """
+    move_table = _get_move_table(layout)
+    if pegs is None:
+        pegs = layout.pegs
+    num_turns = 0
+    valid = True
+    for code in moves:
+        masks = move_table[code] if code < len(move_table) else None
+        if masks is None:
+            valid = False
+            break
+        (needed, to_mask, changed) = masks
+        if pegs & needed != needed or pegs & to_mask:
+            valid = False
+            break
+        pegs ^= changed
+        num_turns += 1
+
+    return {
+        "valid": valid,
+        "pegs": pegs,
+        "num_pegs": bitboard.popcount(pegs),
+        "num_turns": num_turns
+    }
+
+
+def replay_engine(moves, layout):
+    """
+    Replays a game's move codes on a new GameBoard for a board Layout
+    using the same validate_move() and update_board() calls as the game.
+    Returns a dictionary in the same format as replay_moves().
+    """
+    game_board = GameBoard(layout=layout)
+    valid = True
+    for code in moves:
+        validated_move = validate_move(decode_move(code), game_board)
+        if validated_move["valid"] is False:
+            valid = False
+            break
+        game_board.update_board(validated_move)
+        game_board.update_stats()
+
+    return {
+        "valid": valid,
+        "pegs": game_board.pegs,
+        "num_pegs": game_board.num_pegs,
+        "num_turns": game_board.num_turns
+    }
+
+
+def final_result(pegs, layout):
+    """
+    Returns WON, LOST or UNFINISHED for the final position of a game
+    on a board Layout.
+    """
+    if bitboard.any_jumps(pegs, layout.playable):
+        return UNFINISHED
+    if pegs == 1 << layout.finish_bit:
+        return WON
+    return LOST
+
+
+def verify_log(path, engine=False, on_record=None, chunk_size=CHUNK_SIZE):
+    """
+    Replays every record in a log, checking that every move is legal
+    and that the stored result matches the final position.
+    If engine is True, games are replayed through GameBoard instead of
+    the bitboard masks. on_record is an optional function called with
+    (index, record, replayed) for each record that is replayed.
+    Records of games on custom or unknown layouts cannot be replayed and
+    are counted as skipped.
+    Returns a dictionary of totals.
+    """
+    totals = {"records": 0, "moves": 0, "invalid": 0, "mismatched": 0,
+              "skipped": 0, "unfinished": 0, "won": 0, "lost": 0}
+    for record in iter_records(path, chunk_size):
+        (_, result, layout_id, moves) = record
+        try:
+            layout = layout_by_id(layout_id)
+        except ValueError:
+            totals["skipped"] += 1
+            continue
+
+        if engine:
+            replayed = replay_engine(moves, layout)
+        else:
+            replayed = replay_moves(moves, layout)
+
+        if not replayed["valid"]:
+            totals["invalid"] += 1
+        elif final_result(replayed["pegs"], layout) != result:
+            totals["mismatched"] += 1
+
+        if on_record is not None:
+            on_record(totals["records"], record, replayed)
+        totals["records"] += 1
+        totals["moves"] += len(moves)
+        name = RESULT_NAMES.get(result, "unknown")
+        totals[name] = totals.get(name, 0) + 1
+
+    return totals
+
+
+def main():
+    """
+    Command line entry point to verify a game log.
+    """
+    parser = argparse.ArgumentParser(description="Verify a Soliterm game log")
+    parser.add_argument("path", help="game log to verify")
+    parser.add_argument("--engine", action="store_true",
+                        help="replay through GameBoard instead of bitboards")
+    parser.add_argument("--list", action="store_true",
+                        help="print the outcome of every game")
+    parser.add_argument("--moves", action="store_true",
+                        help="also print the moves of every game, in the "
+                             "format they are entered in the game")
+    args = parser.parse_args()
+
+    def print_record(index, record, replayed):
+        (started, result, _, moves) = record
+        print(f"{index}: started {time.ctime(started)}, {len(moves)} moves, "
+              f"{RESULT_NAMES.get(result, result)}, "
+              f"{replayed['num_pegs']} pegs left after "
+              f"{replayed['num_turns']} turns"
+              f"{'' if replayed['valid'] else ', ILLEGAL MOVE'}")
+        if args.moves:
+            print(" ".join(move_text(code) for code in moves))
+
+    started = time.perf_counter()
+    totals = verify_log(args.path, args.engine,
+                        print_record if args.list or args.moves else None)
+    elapsed = time.perf_counter() - started
+
+    print(f"{totals['records']} games, {totals['moves']} moves in "
+          f"{elapsed:.2f}s ({totals['moves'] / max(elapsed, 1e-9):,.0f} "
+          f"moves/s)")
+    print(f"won {totals['won']}, lost {totals['lost']}, "
+          f"unfinished {totals['unfinished']}")
+    print(f"illegal moves in {totals['invalid']} games, "
+          f"wrong result in {totals['mismatched']} games")
+    if totals["skipped"]:
+        print(f"skipped {totals['skipped']} games on custom layouts")
+    if totals["invalid"] or totals["mismatched"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Undo and redo history for Soliterm.
+
+Rather than copying the board after every move, the history keeps the
+moves themselves, packed into 2 byte move codes in the same format as
+game records, in an array. A jump empties and fills the same three
+holes whichever way it is made, so each move is all that is needed to
+step the board forwards or backwards.
+
+To keep a jump to a far away turn quick, a snapshot of the pegs bitboard
+is also kept every SNAPSHOT_INTERVAL turns, packed into a single
+bytearray. Going to any turn starts from the nearest snapshot, so it
+never takes more than SNAPSHOT_INTERVAL moves however long the game.
+"""
+
+from array import array
+import bitboard
+from gamelog import encode_move, decode_move
+
+# Number of turns between snapshots of the board
+SNAPSHOT_INTERVAL = 32
+
+
+class History:
+    """
+    Moves played in a game, with snapshots of the board, and the turn
+    the game board is currently showing. Moves after the current turn
+    can be redone until a different move is played.
+    """
+    def __init__(self, game_board):
+        """
+        Initialise an instance of History for a GameBoard
+        at the start of a game.
+        """
+        self.layout = game_board.layout
+        self.moves = array("H")
+        self.turn = 0
+        self.snapshots = bytearray(self._pack(game_board.pegs))
+
+    @staticmethod
+    def _pack(pegs):
+        """
+        Returns a pegs bitboard packed into bytes.
+        """
+        return pegs.to_bytes(bitboard.BOARD_BYTES, "little")
+
+    def _snapshot(self, index):
+        """
+        Returns the pegs bitboard of a snapshot.
+        """
+        start = index * bitboard.BOARD_BYTES
+        return int.from_bytes(
+            self.snapshots[start:start + bitboard.BOARD_BYTES], "little")
+
+    def _jump(self, turn):
+        """
+        Returns the (bits, cells) jump from the layout's jump table
+        for the move played in a turn, counting from 1.
+        """
+        (_, row_num, column_num, direction) = decode_move(
+            self.moves[turn - 1])
+        return self.layout.jump_at[(row_num, column_num, direction)]
+
+    def record(self, formatted_move, game_board):
+        """
+        Records a move, as returned by validate_format(), that has just
+        been applied to the game board. Any moves that had been undone
+        can no longer be redone.
+        """
+        del self.moves[self.turn:]
+        del self.snapshots[
+            (self.turn // SNAPSHOT_INTERVAL + 1) * bitboard.BOARD_BYTES:]
+
+        self.moves.append(encode_move(formatted_move))
+        self.turn += 1
+        if self.turn % SNAPSHOT_INTERVAL == 0:
+            self.snapshots += self._pack(game_board.pegs)
+
+    def moves_played(self):
+        """
+        Returns a list of the move codes played up to the current turn,
+        as written to game records.
+        """
+        return self.moves[:self.turn].tolist()
+
+    def can_undo(self):
+        """
+        Returns True if there is a move to undo.
+        """
+        return self.turn > 0
+
+    def can_redo(self):
+        """
+        Returns True if there is an undone move to redo.
+        """
+        return self.turn < len(self.moves)
+
+    def undo(self, game_board):
+        """
+        Takes back the last move on the game board.
+        Returns False if there was no move to undo.
+        """
+        if not self.can_undo():
+            return False
+
+        (_, (from_cell, over_cell, to_cell)) = self._jump(self.turn)
+        game_board.undo_board({
+            "valid": True,
+            "from": from_cell,
+            "to": to_cell,
+            "remove": over_cell
+        })
+        self.turn -= 1
+        game_board.num_turns = self.turn
+        return True
+
+    def redo(self, game_board):
+        """
+        Plays the next undone move again on the game board.
+        Returns False if there was no move to redo.
+        """
+        if not self.can_redo():
+            return False
+
+        self.turn += 1
+        (_, (from_cell, over_cell, to_cell)) = self._jump(self.turn)
+        game_board.update_board({
+            "valid": True,
+            "from": from_cell,
+            "to": to_cell,
+            "remove": over_cell
+        })
+        game_board.num_turns = self.turn
+        return True
+
+    def go_to(self, game_board, turn):
+        """
+        Moves the game board backwards or forwards to the position after
+        a turn, limited to the turns that have been played.
+        Returns the turn the board is now at.
+        """
+        turn = min(max(turn, 0), len(self.moves))
+
+        # Nearby turns are reached by undoing or redoing moves, which
+        # keeps the legal moves up to date as they go
+        if abs(turn - self.turn) <= SNAPSHOT_INTERVAL // 2:
+            while self.turn > turn:
+                self.undo(game_board)
+            while self.turn < turn:
+                self.redo(game_board)
+            return self.turn
+
+        # Otherwise start from the nearest snapshot, step the pegs
+        # bitboard to the turn and set up the board from scratch
+        index = min((turn + SNAPSHOT_INTERVAL // 2) // SNAPSHOT_INTERVAL,
+                    len(self.snapshots) // bitboard.BOARD_BYTES - 1)
+        pegs = self._snapshot(index)
+        snapshot_turn = index * SNAPSHOT_INTERVAL
+        for step in range(min(turn, snapshot_turn), max(turn, snapshot_turn)):
+            ((from_bit, over_bit, to_bit), _) = self._jump(step + 1)
+            pegs = bitboard.apply_jump(pegs, from_bit, over_bit, to_bit)
+
+        game_board.set_position(pegs, turn)
+        self.turn = turn
+        return self.turn
@@ -0,0 +1,368 @@
+"""
+Per turn latency tracing for Soliterm.
+
+Tracing is off unless the SOLITERM_TRACE environment variable is set to
+a file path. When it is on, the main loop in run.py marks the end of
+each phase of a turn - waiting for input, validate_format(),
+validate_move(), updating the board, draw_board(), eval_moves() and the
+dead position check - and one JSON line is appended to the file for
+every turn, with the time spent in each phase in milliseconds, the
+number of curses calls made through the game's TermManager and the
+bytes sent to the terminal. Time between the last mark and the end of
+the turn, such as working out a hint, is counted as "other".
+
+The bytes are those curses actually writes, with its cursor movement
+and colour changes, rather than the text the game draws. To count them
+the tracer puts a pseudo terminal between curses and the real terminal
+and copies everything written to it across, as bench.py does for
+draw_board(). If the game's output is not a terminal, the bytes are
+left out of the trace.
+
+When tracing is off the main loop only checks that there is no tracer,
+so there is no measurable cost.
+
+Run this module with one or more trace files to summarise them:
+
+python3 latency.py soliterm-trace.jsonl
+
+which prints the 50th, 95th and 99th percentile of every phase across
+all of the sessions in the files.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pty
+import termios
+import threading
+import time
+import tty
+import numpy as np
+
+# Percentiles reported by the summary
+PERCENTILES = (50, 95, 99)
+
+# Phases in the order they happen in a turn, used to order the summary.
+# Any other phases found in a trace are listed after these. "work" is
+# the total of every phase except waiting for input.
+PHASES = ("input", "validate_format", "validate_move", "update",
+          "play_moves", "draw_board", "eval_moves", "dead_check", "other",
+          "work")
+
+# Written after the game's output to find how much of it has been sent
+# to the terminal. It is taken out before the output reaches the
+# terminal.
+OUTPUT_MARKER = b"\0soliterm-sent\0"
+
+# Longest wait for the marker to come through, in seconds
+MARKER_TIMEOUT = 1.0
+
+# Counts recorded for each turn, after the phase times
+COUNTS = ("curses_calls", "terminal_bytes")
+
+
+class OutputCounter:
+    """
+    Counts the bytes the game sends to the terminal. Standard output is
+    replaced by a pseudo terminal, which curses sets up and draws on as
+    if it were the real terminal, and a thread copies everything written
+    to it across to the real terminal, counting the bytes. curses reads
+    keys from standard input, which is still the real terminal, so that
+    is put in raw mode here instead.
+    """
+    def __init__(self):
+        """
+        Initialise an instance of OutputCounter, putting a pseudo
+        terminal the same size as the real one in place of standard
+        output. Raises OSError if standard input or output is not a
+        terminal.
+        """
+        if not (os.isatty(0) and os.isatty(1)):
+            raise OSError("Standard input and output must be a terminal")
+        self.terminal_fd = os.dup(1)
+        self.terminal_modes = termios.tcgetattr(0)
+        (self.master_fd, slave_fd) = pty.openpty()
+        fcntl.ioctl(slave_fd, termios.TIOCSWINSZ,
+                    fcntl.ioctl(self.terminal_fd, termios.TIOCGWINSZ,
+                                b"\0" * 8))
+        os.dup2(slave_fd, 1)
+        os.close(slave_fd)
+
+        # Keys are passed straight to curses, except that Ctrl+C still
+        # interrupts the game as it does in curses' cbreak mode
+        tty.setraw(0)
+        modes = termios.tcgetattr(0)
+        modes[3] |= termios.ISIG
+        termios.tcsetattr(0, termios.TCSANOW, modes)
+
+        self.sent = 0
+        self.marked = threading.Event()
+        self.thread = threading.Thread(target=self._copy, daemon=True)
+        self.thread.start()
+
+    def _copy(self):
+        """
+        Copies the game's output to the real terminal until the pseudo
+        terminal is closed, counting the bytes and taking out markers.
+        """
+        pending = b""
+        while True:
+            # Reading fails with EIO once the pseudo terminal is closed
+            try:
+                data = os.read(self.master_fd, 65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            pending += data
+
+            # Hold back the end of the output if it could be the start
+            # of a marker split between reads
+            while True:
+                index = pending.find(OUTPUT_MARKER)
+                if index < 0:
+                    break
+                self._send(pending[:index])
+                pending = pending[index + len(OUTPUT_MARKER):]
+                self.marked.set()
+            keep = 0
+            for size in range(len(OUTPUT_MARKER) - 1, 0, -1):
+                if pending.endswith(OUTPUT_MARKER[:size]):
+                    keep = size
+                    break
+            self._send(pending[:len(pending) - keep])
+            pending = pending[len(pending) - keep:]
+
+        self._send(pending)
+
+    def _send(self, data):
+        """
+        Writes output to the real terminal and counts it.
+        """
+        while data:
+            written = os.write(self.terminal_fd, data)
+            self.sent += written
+            data = data[written:]
+
+    def total(self):
+        """
+        Returns the number of bytes sent to the terminal so far. Output
+        still on its way through the pseudo terminal is waited for by
+        writing a marker after it.
+        """
+        self.marked.clear()
+        os.write(1, OUTPUT_MARKER)
+        self.marked.wait(MARKER_TIMEOUT)
+        return self.sent
+
+    def close(self):
+        """
+        Puts the real terminal back as standard output, once the rest of
+        the output has been copied to it, and restores its modes.
+        """
+        os.dup2(self.terminal_fd, 1)
+        self.thread.join(MARKER_TIMEOUT)
+        termios.tcsetattr(0, termios.TCSADRAIN, self.terminal_modes)
+        os.close(self.master_fd)
+        os.close(self.terminal_fd)
+
+
+class Tracer:
+    """
+    Times the phases of each turn and appends one JSON line per turn to
+    a trace file. Each line is written with a single write to a file
+    opened for appending, so several processes can share one file.
+    """
+    def __init__(self, path, output=None):
+        """
+        Initialise an instance of Tracer, creating the file if it
+        does not exist. output is an optional OutputCounter counting
+        the bytes sent to the terminal.
+        """
+        self.trace_fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                0o644)
+        self.output = output
+        self.session = f"{os.getpid()}-{int(time.time())}"
+        self.turn = 0
+        self.phases = None
+        self.last_mark = 0
+        self.counts = {}
+
+    def read_counts(self, term_manager):
+        """
+        Returns a dictionary of the running totals of the counts in
+        COUNTS, leaving out the bytes if they are not being counted.
+        """
+        counts = {"curses_calls": term_manager.curses_calls}
+        if self.output is not None:
+            counts["terminal_bytes"] = self.output.total()
+        return counts
+
+    def start_turn(self, term_manager):
+        """
+        Writes out the turn being traced, if there is one, and starts
+        timing a new turn.
+        """
+        # The counts at the end of a turn are those at the start of the
+        # next, so they are only read again after a break in tracing
+        if self.phases is None:
+            self.counts = self.read_counts(term_manager)
+        else:
+            self.end_turn(term_manager)
+        self.phases = {}
+        self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        Adds the time since the last mark to a phase of the turn.
+        """
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def end_turn(self, term_manager):
+        """
+        Appends the turn being traced to the trace file, if there is one.
+        """
+        if self.phases is None:
+            return
+
+        self.mark("other")
+        self.turn += 1
+        counts = self.read_counts(term_manager)
+        record = {
+            "session": self.session,
+            "turn": self.turn,
+            "time": round(time.time(), 3),
+            "phases": {phase: round(seconds * 1000, 4)
+                       for (phase, seconds) in self.phases.items()}
+        }
+        for (name, total) in counts.items():
+            record[name] = total - self.counts[name]
+        os.write(self.trace_fd, (json.dumps(record) + "\n").encode("utf-8"))
+        self.counts = counts
+        self.phases = None
+
+    def close(self):
+        """
+        Closes the trace file, and puts the terminal back if the bytes
+        sent to it were being counted.
+        """
+        os.close(self.trace_fd)
+        if self.output is not None:
+            self.output.close()
+
+
+def open_tracer(path=None):
+    """
+    Opens the trace file at path, or at the path in the SOLITERM_TRACE
+    environment variable if path is not given.
+    Returns a Tracer, or None if no path is set or the file cannot
+    be opened. The bytes sent to the terminal are counted if standard
+    output is a terminal, so the tracer must be opened before curses
+    starts.
+    """
+    if path is None:
+        path = os.environ.get("SOLITERM_TRACE")
+    if not path:
+        return None
+
+    try:
+        tracer = Tracer(path)
+    except OSError:
+        return None
+
+    try:
+        tracer.output = OutputCounter()
+    except (OSError, termios.error):
+        pass
+    return tracer
+
+
+def read_traces(paths):
+    """
+    Reads the turns from trace files, skipping any lines that are not
+    complete JSON records.
+    Returns a list of dictionaries, one for each turn.
+    """
+    turns = []
+    for path in paths:
+        with open(path, encoding="utf-8") as trace_file:
+            for line in trace_file:
+                try:
+                    turn = json.loads(line)
+                except ValueError:
+                    continue
+                turns.append(turn)
+
+    return turns
+
+
+def summarise(turns):
+    """
+    Works out percentiles of the time spent in each phase, and of the
+    curses calls made and bytes sent to the terminal, over a list of
+    turns.
+    Returns a dictionary containing:
+    sessions - number of sessions the turns came from
+    turns - number of turns
+    phases - list of (phase, count, percentiles) tuples, where count is
+             the number of turns that included the phase and percentiles
+             a list of the milliseconds at each of PERCENTILES, ending
+             with the total work done in each turn
+    counts - list of (name, count, percentiles) tuples for each of
+             COUNTS, where count is the number of turns that recorded it
+    """
+    times = {}
+    for turn in turns:
+        for (phase, milliseconds) in turn["phases"].items():
+            times.setdefault(phase, []).append(milliseconds)
+        times.setdefault("work", []).append(sum(
+            milliseconds for (phase, milliseconds) in turn["phases"].items()
+            if phase != "input"))
+
+    order = [phase for phase in PHASES if phase in times]
+    order += sorted(phase for phase in times if phase not in PHASES)
+
+    def percentiles(values):
+        if not values:
+            return [0.0] * len(PERCENTILES)
+        return [float(value) for value in np.percentile(values, PERCENTILES)]
+
+    return {
+        "sessions": len({turn["session"] for turn in turns}),
+        "turns": len(turns),
+        "phases": [(phase, len(times[phase]), percentiles(times[phase]))
+                   for phase in order],
+        "counts": [(name, len(values), percentiles(values))
+                   for (name, values) in (
+                       (name, [turn[name] for turn in turns if name in turn])
+                       for name in COUNTS)]
+    }
+
+
+def main():
+    """
+    Command line entry point to summarise trace files.
+    """
+    parser = argparse.ArgumentParser(
+        description="Summarise Soliterm turn latency traces")
+    parser.add_argument("paths", nargs="+", help="trace files to summarise")
+    args = parser.parse_args()
+
+    summary = summarise(read_traces(args.paths))
+    print(f"{summary['turns']} turns from {summary['sessions']} sessions")
+
+    headings = "".join(f"{'p' + str(pct):>12}" for pct in PERCENTILES)
+    print(f"{'phase':<18}{'turns':>7}{headings}")
+    for (phase, count, values) in summary["phases"]:
+        print(f"{phase:<18}{count:>7}"
+              + "".join(f"{value:>10.3f}ms" for value in values))
+    for (name, count, values) in summary["counts"]:
+        print(f"{name:<18}{count:>7}"
+              + "".join(f"{value:>12.0f}" for value in values))
+
+
+if __name__ == "__main__":
+    main()
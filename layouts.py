@@ -0,0 +1,228 @@
+"""
+Board layouts for Soliterm.
+
+A layout is drawn as rows of characters - * for a hole with a peg, . for
+an empty hole and a space where there is no hole - and is centred on the
+15 x 15 grid used by the game. Layouts up to the size of the grid can be
+used, including custom ones loaded from a text file in the same format.
+
+When a layout is created it builds a table of every (from, over, to)
+triple of holes that a jump can use, an index of the jumps touching each
+hole, and a lookup from a (row, column, direction) move to its jump. The
+game rules in engine.py use these tables, so checking a move, finding
+the legal moves and spotting a win need no bounds checks on any board.
+"""
+
+import os
+import numpy as np
+import bitboard
+
+# Characters used to draw layouts
+PEG = "*"
+HOLE = "."
+
+# Layout used when none is chosen
+DEFAULT_LAYOUT = "soliterm"
+
+# Registered layouts, by name and in the order they were registered.
+# The position in LAYOUT_IDS is the number stored in game records.
+LAYOUTS = {}
+LAYOUT_IDS = []
+
+
+class Layout:
+    """
+    A board layout with its starting position, the hole the last peg
+    must finish in and tables of every jump that can be made on it.
+    """
+    def __init__(self, name, title, rows, finish=None):
+        """
+        Initialise an instance of Layout from rows of characters.
+        finish is the (row, column) within the rows of the hole the last
+        peg must finish in, defaulting to the middle of the rows.
+        Raises ValueError if the layout does not fit on the grid or the
+        finish is not a hole.
+        """
+        self.name = name
+        self.title = title
+        self.layout_id = None
+
+        # Centre the rows on the grid
+        height = len(rows)
+        width = max((len(row) for row in rows), default=0)
+        if not 0 < height <= bitboard.BOARD_SIZE or not (
+                0 < width <= bitboard.BOARD_SIZE):
+            raise ValueError(f"Layout {name} must be between 1 x 1 and "
+                             f"{bitboard.BOARD_SIZE} x {bitboard.BOARD_SIZE}")
+        top = (bitboard.BOARD_SIZE - height) // 2
+        left = (bitboard.BOARD_SIZE - width) // 2
+
+        # Board array in the same encoding as GameBoard.board_arr
+        self.start = np.full((bitboard.BOARD_SIZE, bitboard.BOARD_SIZE), 2)
+        for (row, line) in enumerate(rows):
+            for (column, char) in enumerate(line):
+                if char == PEG:
+                    self.start[top + row, left + column] = 1
+                elif char == HOLE:
+                    self.start[top + row, left + column] = 0
+        (self.pegs, self.playable) = bitboard.from_array(self.start)
+
+        if finish is None:
+            finish = (height // 2, width // 2)
+        self.finish = (top + finish[0], left + finish[1])
+        self.finish_bit = bitboard.cell_bit(*self.finish)
+        if not self.playable >> self.finish_bit & 1:
+            raise ValueError(f"Layout {name} must have a hole to finish in")
+
+        self._build_jump_tables()
+
+    def _build_jump_tables(self):
+        """
+        Builds the table of every jump on the layout.
+        jumps is a list of (bits, cells) tuples, where bits is the
+        (from, over, to) tuple of bit numbers and cells the matching
+        tuple of (row, column) tuples.
+        jumps_through maps the bit number of each hole to a list of the
+        jumps that start at, pass over or land on it.
+        jump_at maps a (row, column, direction) move to its jump.
+        jump_bits maps the (from, over, to) tuple of bit numbers of each
+        jump to its jump.
+        """
+        self.jumps = []
+        self.jump_bits = {}
+        self.jumps_through = {bit: [] for bit in bitboard.iter_bits(
+            self.playable)}
+        self.jump_at = {}
+
+        for from_bit in bitboard.iter_bits(self.playable):
+            (row, column) = bitboard.bit_cell(from_bit)
+            for direction in bitboard.DIRECTION_STEPS:
+                bits = bitboard.jump_bits(row, column, direction)
+                if min(bits) < 0 or any(
+                        not self.playable >> bit & 1 for bit in bits):
+                    continue
+                jump = (bits, tuple(bitboard.bit_cell(bit) for bit in bits))
+                self.jumps.append(jump)
+                self.jump_at[(row, column, direction)] = jump
+                self.jump_bits[bits] = jump
+                for bit in bits:
+                    self.jumps_through[bit].append(jump)
+
+    def legal_jumps(self, pegs):
+        """
+        Returns a list of the jumps from the jump table
+        that are legal in a position.
+        """
+        # Find the pegs that can jump in each direction with a few
+        # operations on the whole board, then look up their jumps
+        return [self.jump_bits[bits]
+                for bits in bitboard.jumps(pegs, self.playable)]
+
+
+def register(layout):
+    """
+    Adds a layout to the registry, giving it the next layout number.
+    Returns the layout.
+    """
+    layout.layout_id = len(LAYOUT_IDS)
+    LAYOUTS[layout.name] = layout
+    LAYOUT_IDS.append(layout)
+    return layout
+
+
+def get_layout(name=None):
+    """
+    Returns the registered layout with the given name,
+    or the default layout if name is None.
+    Raises ValueError for an unknown name.
+    """
+    try:
+        return LAYOUTS[name or DEFAULT_LAYOUT]
+    except KeyError:
+        raise ValueError(f"Unknown layout {name}") from None
+
+
+def layout_by_id(layout_id):
+    """
+    Returns the registered layout with the given layout number.
+    Raises ValueError for an unknown number.
+    """
+    if not 0 <= layout_id < len(LAYOUT_IDS):
+        raise ValueError(f"Unknown board layout {layout_id}")
+    return LAYOUT_IDS[layout_id]
+
+
+def load_layout(path):
+    """
+    Reads a custom layout from a text file, drawn in the same way as
+    the registered layouts. The last peg must finish in the middle.
+    Returns a Layout, which is not registered.
+    """
+    with open(path, encoding="utf-8") as layout_file:
+        rows = [line.rstrip("\r\n") for line in layout_file]
+
+    # Ignore blank lines before and after the board
+    while rows and not rows[-1].strip():
+        rows.pop()
+    while rows and not rows[0].strip():
+        rows.pop(0)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    return Layout(name, f"Custom layout {name}", rows)
+
+
+def find_layout(spec=None):
+    """
+    Returns the registered layout named spec, the custom layout in the
+    file at path spec, or the default layout if spec is None.
+    Raises ValueError if there is no such layout, or OSError if the
+    file cannot be read.
+    """
+    if spec is None or spec in LAYOUTS:
+        return get_layout(spec)
+    if os.path.exists(spec):
+        return load_layout(spec)
+    raise ValueError(f"Unknown layout {spec}")
+
+
+# The 124 peg cross used by Soliterm
+register(Layout("soliterm", "Soliterm 124 peg cross", [
+    "     *****     ",
+    "     *****     ",
+    "     *****     ",
+    "     *****     ",
+    "     *****     ",
+    "***************",
+    "***************",
+    "*******.*******",
+    "***************",
+    "***************",
+    "     *****     ",
+    "     *****     ",
+    "     *****     ",
+    "     *****     ",
+    "     *****     "
+]))
+
+# The English board with 33 holes
+register(Layout("english", "English 33 hole board", [
+    "  ***  ",
+    "  ***  ",
+    "*******",
+    "***.***",
+    "*******",
+    "  ***  ",
+    "  ***  "
+]))
+
+# The European board with 37 holes. No game that starts with the centre
+# empty can finish there, so it starts and finishes off centre.
+register(Layout("european", "European 37 hole board", [
+    "  ***  ",
+    " **.** ",
+    "*******",
+    "*******",
+    "*******",
+    " ***** ",
+    "  ***  "
+], finish=(5, 3)))
@@ -0,0 +1,478 @@
+"""
+Load test for Soliterm.
+
+Finds out how many players one host can handle. For each number of
+sessions asked for, it starts that many games at once, each running
+python3 run.py on its own pseudo terminal in the same way as
+controllers/default.js does for each player, and types a scripted game
+into every one of them a key at a time, pausing between keys as a
+player would. With --in-process, the games are GameSession objects from
+server.py in this process instead, as in the game server, and every
+session is sent its next key at the same moment.
+
+For each number of sessions it reports:
+echo - milliseconds from typing a key until the game echoes it
+redraw - milliseconds from pressing enter until the board has been
+         redrawn
+startup - milliseconds from starting a game until its title screen has
+          been drawn, for pseudo terminals only
+bytes - bytes sent to the terminal for each turn
+rss - resident memory of each session in MB
+cpu - CPU time used by the games for each turn, and the number of CPU
+      cores kept busy
+
+Linux only, as it reads memory use from /proc.
+
+Usage:
+python3 loadtest.py --sessions 1,10,50 --turns 20
+python3 loadtest.py --sessions 100,1000 --in-process --json load.json
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import pty
+import random
+import resource
+import signal
+import struct
+import sys
+import termios
+import time
+import numpy as np
+from engine import (new_game, legal_moves, apply_jump, jump_to_text,
+                    apply_move, eval_moves)
+from layouts import DEFAULT_LAYOUT, find_layout
+from latency import PERCENTILES
+from prefork import TERM_NAME, TERM_ROWS, TERM_COLS
+from server import GameSession
+
+# Path of the game run in each pseudo terminal
+RUN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "run.py")
+
+# Numbers of sessions tested by default, and turns played in each
+DEFAULT_SESSIONS = "1,5,10,20"
+DEFAULT_TURNS = 20
+
+# Average pause between keys in seconds, varied by half either way so
+# that sessions do not all type in step
+DEFAULT_KEY_DELAY = 0.05
+
+# The game has finished a reply once it has sent nothing for this long
+QUIET_TIME = 0.05
+
+# Longest wait for a reply, in seconds, before a session is abandoned
+REPLY_TIMEOUT = 30.0
+
+# Seed for the scripted games, each session playing a different one
+SCRIPT_SEED = 2022
+
+
+def script_moves(layout, turns, seed):
+    """
+    Returns a list of up to turns moves from a random game on a board
+    Layout, as text in the format the player enters them.
+    """
+    rand = random.Random(seed)
+    game_board = new_game(layout=layout)
+    moves = []
+    jumps = legal_moves(game_board)
+    while jumps and len(moves) < turns:
+        jump = rand.choice(jumps)
+        moves.append(jump_to_text(jump))
+        apply_jump(game_board, jump)
+        jumps = legal_moves(game_board)
+
+    return moves
+
+
+def process_rss(pid):
+    """
+    Returns the resident memory of a process in bytes, or None if it
+    cannot be read.
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def cpu_seconds(who):
+    """
+    Returns the user and system CPU time used by this process, or by
+    its finished children, in seconds.
+    """
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class PtySession:
+    """
+    A copy of run.py on its own pseudo terminal, with the times and
+    sizes of its output.
+    """
+    def __init__(self, env):
+        """
+        Initialise an instance of PtySession, starting the game.
+        """
+        self.started = time.perf_counter()
+        (self.pid, self.master_fd) = pty.fork()
+        if self.pid == 0:
+            os.execve(sys.executable, [sys.executable, RUN_PATH], env)
+        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ,
+                    struct.pack("HHHH", TERM_ROWS, TERM_COLS, 0, 0))
+
+        self.bytes = 0
+        self.first_output = None
+        self.last_output = None
+        self.output = asyncio.Event()
+        self.closed = False
+        self.game_over = False
+        asyncio.get_running_loop().add_reader(self.master_fd, self._read)
+
+    def _read(self):
+        """
+        Reads output from the game as it arrives.
+        """
+        # Reading the terminal fails with EIO once the game has exited
+        try:
+            data = os.read(self.master_fd, 65536)
+        except OSError:
+            data = b""
+        if not data:
+            asyncio.get_running_loop().remove_reader(self.master_fd)
+            self.closed = True
+            self.output.set()
+            return
+
+        now = time.perf_counter()
+        self.bytes += len(data)
+        if self.first_output is None:
+            self.first_output = now
+        self.last_output = now
+        self.output.set()
+
+    def send(self, key):
+        """
+        Types a key, and returns the time it was typed.
+        """
+        self.first_output = None
+        self.output.clear()
+        sent = time.perf_counter()
+        os.write(self.master_fd, key)
+        return sent
+
+    async def reply_started(self):
+        """
+        Waits for output after the last key typed.
+        Returns the time the output started.
+        """
+        while self.first_output is None and not self.closed:
+            await asyncio.wait_for(self.output.wait(), REPLY_TIMEOUT)
+            self.output.clear()
+        if self.first_output is None:
+            raise EOFError("Game exited")
+        return self.first_output
+
+    async def reply_finished(self):
+        """
+        Waits for output after the last key typed to stop.
+        Returns the time of the last output.
+        """
+        await self.reply_started()
+        while not self.closed:
+            self.output.clear()
+            try:
+                await asyncio.wait_for(self.output.wait(), QUIET_TIME)
+            except asyncio.TimeoutError:
+                break
+        return self.last_output
+
+    async def close(self):
+        """
+        Quits the game, or kills it if it does not quit, and waits for
+        it to exit. Returns True if the game quit, or False if it had to
+        be killed.
+        """
+        # Once a game is over, one key leaves the end of game message
+        # and another the title screen before the game can be quit
+        if not self.closed:
+            try:
+                os.write(self.master_fd,
+                         b"  q\r" if self.game_over else b"q\r")
+            except OSError:
+                pass
+
+        quit_game = True
+        deadline = time.perf_counter() + REPLY_TIMEOUT
+        while True:
+            (pid, _) = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                os.kill(self.pid, signal.SIGKILL)
+                os.waitpid(self.pid, 0)
+                quit_game = False
+                break
+            await asyncio.sleep(QUIET_TIME)
+
+        if not self.closed:
+            asyncio.get_running_loop().remove_reader(self.master_fd)
+        os.close(self.master_fd)
+        return quit_game
+
+
+async def play_pty(session, moves, layout, key_delay, rand, results):
+    """
+    Plays a scripted game on a board Layout in a PtySession, adding the
+    timings and output sizes to the lists in results. The moves are
+    also played on a board here, so the session knows when the game is
+    over.
+    """
+    # Wait for the title screen, then start the game
+    session.first_output = None
+    finished = await session.reply_finished()
+    results["startup"].append(finished - session.started)
+    session.send(b" ")
+    await session.reply_finished()
+
+    game_board = new_game(layout=layout)
+    for move in moves:
+        turn_start = session.bytes
+        for key in move.encode("ascii"):
+            await asyncio.sleep(key_delay * rand.uniform(0.5, 1.5))
+            sent = session.send(bytes([key]))
+            results["echo"].append(await session.reply_started() - sent)
+
+        await asyncio.sleep(key_delay * rand.uniform(0.5, 1.5))
+        sent = session.send(b"\r")
+        results["redraw"].append(await session.reply_finished() - sent)
+        results["bytes"].append(session.bytes - turn_start)
+        apply_move(game_board, move)
+        session.game_over = not eval_moves(game_board)
+
+    results["rss"].append(process_rss(session.pid))
+
+
+async def run_pty(scripts, layout_name, key_delay):
+    """
+    Plays one scripted game for each list of moves in scripts at the
+    same time, each in its own PtySession.
+    Returns a dictionary of lists of the timings and output sizes, and
+    the number of sessions that failed, including any that had to be
+    killed as they did not quit.
+    """
+    env = dict(os.environ, TERM=TERM_NAME, SOLITERM_LAYOUT=layout_name)
+    layout = find_layout(layout_name)
+    results = {"echo": [], "redraw": [], "startup": [], "bytes": [],
+               "rss": [], "failed": 0}
+    sessions = [PtySession(env) for _ in scripts]
+
+    async def play(index):
+        rand = random.Random(SCRIPT_SEED + index)
+        played = False
+        try:
+            await play_pty(sessions[index], scripts[index], layout,
+                           key_delay, rand, results)
+            played = True
+        except (asyncio.TimeoutError, EOFError):
+            pass
+        finally:
+            quit_game = await sessions[index].close()
+        if not (played and quit_game):
+            results["failed"] += 1
+
+    await asyncio.gather(*(play(index) for index in range(len(scripts))))
+    return results
+
+
+def run_in_process(scripts, layout):
+    """
+    Plays one scripted game for each list of moves in scripts in
+    GameSession objects in this process. Every session is sent its next
+    key at the same moment, so each reply waits for the sessions handled
+    before it, as in the game server's event loop.
+    Returns a dictionary as described in run_pty().
+    """
+    results = {"echo": [], "redraw": [], "startup": [], "bytes": [],
+               "rss": [], "failed": 0}
+    rss_before = process_rss(os.getpid())
+
+    sessions = [GameSession(layout=layout) for _ in scripts]
+    for session in sessions:
+        session.start()
+        session.feed(b" ")
+
+    # Keys for each session, with the move each enter ends
+    keys = [[(bytes([key]), None) for move in moves
+             for key in move.encode("ascii")] for moves in scripts]
+    for (index, moves) in enumerate(scripts):
+        position = 0
+        for move in moves:
+            position += len(move)
+            keys[index].insert(position, (b"\r", move))
+            position += 1
+
+    turn_bytes = [0] * len(sessions)
+    for step in range(max((len(session_keys) for session_keys in keys),
+                          default=0)):
+        step_start = time.perf_counter()
+        for (index, session) in enumerate(sessions):
+            if step >= len(keys[index]):
+                continue
+            (key, move) = keys[index][step]
+            out = session.feed(key)
+            if session.hint_pending:
+                out += session.show_hint(session.make_hint())
+            turn_bytes[index] += len(out)
+            replied = time.perf_counter() - step_start
+            if move is None:
+                results["echo"].append(replied)
+            else:
+                results["redraw"].append(replied)
+                results["bytes"].append(turn_bytes[index])
+                turn_bytes[index] = 0
+
+    rss_after = process_rss(os.getpid())
+    if rss_before is not None and rss_after is not None and sessions:
+        results["rss"] = [(rss_after - rss_before) / len(sessions)]
+    for session in sessions:
+        session.feed(b"q\r")
+
+    return results
+
+
+def run_level(num_sessions, turns, layout_name, key_delay, in_process,
+              moves=None):
+    """
+    Runs the load test with a number of sessions, each playing turns
+    moves, or the moves given.
+    Returns a dictionary of the results - the percentiles of each
+    timing in milliseconds, output bytes and memory for each session,
+    and CPU use.
+    """
+    layout = find_layout(layout_name)
+    scripts = [moves or script_moves(layout, turns, SCRIPT_SEED + index)
+               for index in range(num_sessions)]
+
+    who = resource.RUSAGE_SELF if in_process else resource.RUSAGE_CHILDREN
+    cpu_before = cpu_seconds(who)
+    started = time.perf_counter()
+    if in_process:
+        results = run_in_process(scripts, layout)
+    else:
+        results = asyncio.run(run_pty(scripts, layout_name, key_delay))
+    wall = time.perf_counter() - started
+    cpu = cpu_seconds(who) - cpu_before
+
+    def percentiles(values, scale=1000):
+        if not values:
+            return None
+        return [float(value) * scale
+                for value in np.percentile(values, PERCENTILES)]
+
+    rss = [value for value in results["rss"] if value is not None]
+    num_turns = len(results["redraw"])
+    return {
+        "sessions": num_sessions,
+        "mode": "in-process" if in_process else "pty",
+        "turns": num_turns,
+        "failed": results["failed"],
+        "echo_ms": percentiles(results["echo"]),
+        "redraw_ms": percentiles(results["redraw"]),
+        "startup_ms": percentiles(results["startup"]),
+        "bytes_per_turn": (sum(results["bytes"]) / num_turns
+                           if num_turns else 0),
+        "rss_mb": sum(rss) / len(rss) / 2 ** 20 if rss else None,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_turn": cpu * 1000 / num_turns if num_turns else None,
+        "cores": cpu / wall,
+        "wall_seconds": wall
+    }
+
+
+def print_header():
+    """
+    Prints the headings of the results table.
+    """
+    names = "/".join(f"p{pct}" for pct in PERCENTILES)
+    print(f"{'sessions':>8} {'turns':>6} {'failed':>6}  "
+          f"{'echo ms ' + names:<22}{'redraw ms ' + names:<24}"
+          f"{'startup ms ' + names:<26}"
+          f"{'bytes/turn':>10} {'rss MB':>7} {'cpu ms/turn':>11} "
+          f"{'cores':>5}")
+
+
+def print_level(level):
+    """
+    Prints the row of the results table for one number of sessions.
+    """
+    def cell(values):
+        if values is None:
+            return "-"
+        return "/".join(f"{value:.1f}" for value in values)
+
+    rss = "-" if level["rss_mb"] is None else f"{level['rss_mb']:.2f}"
+    cpu = ("-" if level["cpu_ms_per_turn"] is None
+           else f"{level['cpu_ms_per_turn']:.2f}")
+    print(f"{level['sessions']:>8} {level['turns']:>6} "
+          f"{level['failed']:>6}  {cell(level['echo_ms']):<22}"
+          f"{cell(level['redraw_ms']):<24}"
+          f"{cell(level['startup_ms']):<26}"
+          f"{level['bytes_per_turn']:>10.0f} {rss:>7} {cpu:>11} "
+          f"{level['cores']:>5.2f}")
+
+
+def main():
+    """
+    Command line entry point to run the load test.
+    """
+    parser = argparse.ArgumentParser(
+        description="Load test Soliterm with many sessions at once")
+    parser.add_argument("--sessions", default=DEFAULT_SESSIONS,
+                        help="comma separated numbers of sessions to test")
+    parser.add_argument("--turns", type=int, default=DEFAULT_TURNS,
+                        help="moves played in each session")
+    parser.add_argument("--moves",
+                        help="moves for every session to play, e.g. "
+                        "\"h10u h7d\", instead of a different random game "
+                        "for each")
+    parser.add_argument("--key-delay", type=float, default=DEFAULT_KEY_DELAY,
+                        help="average pause between keys in seconds")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                        help="name of the board layout, or a layout file")
+    parser.add_argument("--in-process", action="store_true",
+                        help="play GameSession objects in this process "
+                        "instead of run.py on pseudo terminals")
+    parser.add_argument("--json", metavar="PATH",
+                        help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    try:
+        levels = [int(count) for count in args.sessions.split(",")]
+    except ValueError:
+        parser.error("--sessions must be numbers separated by commas")
+    moves = args.moves.split() if args.moves else None
+
+    # Print each row as soon as it is ready, as large runs take a while
+    print_header()
+    results = []
+    for num_sessions in levels:
+        results.append(run_level(num_sessions, args.turns, args.layout,
+                                 args.key_delay, args.in_process, moves))
+        print_level(results[-1])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
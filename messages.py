@@ -0,0 +1,167 @@
+"""
+Text shown to the player in Soliterm, and the in game messages worked
+out from the game board.
+
+Shared by the curses frontend in run.py and the game server in
+server.py, so nothing here uses curses or the terminal.
+"""
+
+import numpy as np
+from engine import validate_format, validate_move, eval_moves
+from playout import analyse
+
+# Strings for the title screen.
+# ASCII art logo generated using
+# https://patorjk.com/software/taag/#p=display&f=Graffiti&t=Soliterm
+LOGO = np.array([
+    r"              _________      .__  .__  __                        ",
+    r"             /   _____/ ____ |  | |__|/  |_  ___________  _____  ",
+    r"             \_____  \ /  _ \|  | |  \   __\/ __ \_  __ \/     \ ",
+    r"             /        (  <_> )  |_|  ||  | \  ___/|  | \/  Y Y  \ ",
+    r"            /_______  /\____/|____/__||__|  \___  >__|  |__|_|  / ",
+    r"                    \/                          \/            \/ "
+])
+
+TAGLINE = "******************* A game of peg solitaire for the terminal"\
+          " *******************"
+INSTRUCTIONS = np.array([
+    "The aim is to clear the board of pegs except for leaving one "
+    "in the centre hole.",
+    "Pegs can move up, down, left or right by jumping over another peg "
+    "into an empty",
+    "hole. The peg you jump over is removed - that's how you remove pegs.",
+    " ",
+    "Pegs are shown by * with a red background. "
+    "Spaces are shown in blue.",
+    "Enter your move with column, row and u, d, l or r for up, down, "
+    "left or right.",
+    "The computer will tell you if you run out of moves.",
+    "Enter h for a hint, u to undo, r to redo, or e.g. t5 to go back to "
+    "turn 5.",
+    " ",
+    "Example: h10d to move peg in hole H10 down.",
+    "Example: n6l to move peg in hole N6 left."
+])
+
+# Lines of the prompt shown in the bottom window before each move.
+# The player's input is entered after the last line.
+PROMPT = (
+    "Move format is column, row, direction, e.g. h10u, or several, "
+    "e.g. h10u h7d",
+    "or enter i for instructions, h for a hint, or q to quit",
+    "u to undo, r to redo, or t and a turn number to go to that turn",
+    "Enter next move> "
+)
+
+# Maximum number of characters the player can enter at the prompt,
+# enough for a whole game of moves separated by spaces
+MAX_INPUT = 1000
+
+# Number of characters of the player's input shown after the prompt.
+# Longer input scrolls sideways so that the end is always visible.
+INPUT_WIDTH = 80 - len(PROMPT[-1]) - 2
+
+# In game messages
+TITLE_MSG = "Press a key when ready"
+INVALID_FORMAT_MSG = "Invalid format - try again"
+INVALID_MOVE_MSG = "Invalid move - try again"
+GOOD_MOVE_MSG = "Great move! Next turn"
+WIN_MSG = "Wow, you've won! Well done!!!"
+LOSE_MSG = "There are no moves left - game over"
+CONTINUE_MSG = "Press a key to continue"
+QUIT_MSG = "Soliterm exited - please play again soon!"
+HINT_MSG = "Try {move} - this position is {difficulty}, " \
+           "about {pegs:.0f} pegs will be left"
+HINT_WIN_MSG = "Try {move} - this position can still be won"
+UNDO_MSG = "Move undone"
+REDO_MSG = "Move redone"
+NO_UNDO_MSG = "There are no moves to undo"
+NO_REDO_MSG = "There are no moves to redo"
+TURN_MSG = "Now at turn {turn}"
+SEQUENCE_MSG = "{played} of {total} moves played"
+SEQUENCE_FORMAT_MSG = "{played} of {total} moves played - " \
+                      "{move:.8} is in an invalid format"
+SEQUENCE_INVALID_MSG = "{played} of {total} moves played - " \
+                       "{move:.8} is an invalid move"
+RESUME_MSG = "Welcome back - your game has been restored"
+DEAD_MSG = "This position can no longer be won - enter u to undo, " \
+           "or clear what you can"
+DEAD_START_MSG = "This board cannot be won from the start - " \
+                 "clear as many pegs as you can"
+
+# Time allowed for working out a hint, in seconds
+HINT_BUDGET = 0.25
+
+# The string and color pair used to draw each value in the board array:
+# 0 = empty hole in blue, 1 = peg with a red background,
+# 2 = unplayable space in black
+CELL_STYLES = {
+    0: ("   ", 2),
+    1: (" * ", 1),
+    2: ("   ", 0)
+}
+
+# Width of the game stats lines to the left of the board
+STATS_WIDTH = 20
+
+
+def hint_msg(game_board, budget=HINT_BUDGET, search=None):
+    """
+    Runs playouts from the current position for up to budget seconds,
+    or uses what a BackgroundSearch has already found if one is given.
+    Returns a message suggesting the best move found, with a rating of
+    how hard the position is and the number of pegs likely to be left.
+    """
+    analysis = search.result() if search is not None else None
+    if analysis is None:
+        analysis = analyse(game_board, budget)
+
+    if analysis.get("winnable"):
+        return HINT_WIN_MSG.format(move=analysis["suggested"])
+    return HINT_MSG.format(move=analysis["suggested"],
+                           difficulty=analysis["difficulty"],
+                           pegs=analysis["moves"][0]["mean_pegs"])
+
+
+def history_msg(history, game_board, formatted_move):
+    """
+    Undoes or redoes moves on the game board for an undo, redo or go to
+    turn entry, as returned by validate_format().
+    Returns a message saying what was done.
+    """
+    if formatted_move[1] == -4:
+        return UNDO_MSG if history.undo(game_board) else NO_UNDO_MSG
+    if formatted_move[1] == -5:
+        return REDO_MSG if history.redo(game_board) else NO_REDO_MSG
+    return TURN_MSG.format(turn=history.go_to(game_board, formatted_move[2]))
+
+
+def play_moves(game_board, history, moves):
+    """
+    Validates and applies a list of moves entered as text in order,
+    stopping at the first one that is not a valid move or when there
+    are no moves left. Each move is recorded in the history, but the
+    board is not redrawn.
+    Returns a message saying how many of the moves were played.
+    """
+    played = 0
+    for move in moves:
+        # Special values such as quit are not moves
+        formatted_move = validate_format(move)
+        if formatted_move[0] is False or formatted_move[1] < 0:
+            return SEQUENCE_FORMAT_MSG.format(played=played,
+                                              total=len(moves), move=move)
+
+        validated_move = validate_move(formatted_move, game_board)
+        if validated_move["valid"] is False:
+            return SEQUENCE_INVALID_MSG.format(played=played,
+                                               total=len(moves), move=move)
+
+        game_board.update_board(validated_move)
+        game_board.update_stats()
+        history.record(formatted_move, game_board)
+        played += 1
+        if not eval_moves(game_board):
+            break
+
+    return SEQUENCE_MSG.format(played=played, total=len(moves))
@@ -0,0 +1,197 @@
+"""
+Dead position detection for Soliterm.
+
+A pagoda function gives every hole a weight such that, for every jump,
+the weights of the hole jumped from and the hole jumped over add up to
+at least the weight of the hole landed in. The total weight of the pegs
+on the board can then never go up, so a position whose total is less
+than the weight of the finish hole can never be won. Two pagoda
+functions are used, both built for any board from its finish hole:
+
+distance - the weight of a hole is the Fibonacci number counting down
+           from the finish hole by the number of steps to it, so a jump
+           towards the finish keeps the total the same and any other
+           jump loses some. Pegs left too far from the finish, or from
+           each other, are caught by this one.
+lattice - a weight of 1 on the holes an even number of rows and columns
+          from the finish hole. A peg never leaves this lattice, so if
+          there is no peg on it no peg can ever reach the finish.
+
+The position class is also checked. The holes are split into three
+classes along each set of diagonals, and every jump changes the number
+of pegs in all three classes by one, so whether each pair of counts
+adds up to an odd or even number never changes. A position whose
+pairs differ from those of a lone peg in the finish hole can never be
+won. This cannot change during a game from the start position, but it
+catches positions set up in other ways.
+
+The weights are worked out once for each board, so a position is
+checked with a few integer operations and one dot product, whether it
+is given as a pegs bitboard or as a board array.
+"""
+
+import numpy as np
+import bitboard
+
+# Checks already built, by (playable, finish_bit)
+_CHECKS = {}
+
+
+def fibonacci(count):
+    """
+    Returns a list of the first count Fibonacci numbers, from 1, 1.
+    """
+    numbers = [1, 1]
+    while len(numbers) < count:
+        numbers.append(numbers[-1] + numbers[-2])
+    return numbers[:count]
+
+
+def bits_grid(bits):
+    """
+    Returns a grid of BOARD_SIZE rows of ROW_STRIDE cells, with a 1 in
+    the cell of every bit set in a bitboard.
+    """
+    return np.unpackbits(
+        np.frombuffer(bits.to_bytes(bitboard.BOARD_BYTES, "little"),
+                      dtype=np.uint8),
+        bitorder="little").reshape(bitboard.BOARD_SIZE, bitboard.ROW_STRIDE)
+
+
+def grid_bits(grid):
+    """
+    Returns a bitboard with a bit set for every non zero cell of a grid
+    of BOARD_SIZE rows of ROW_STRIDE cells.
+    """
+    return sum(1 << int(bit) for bit in np.flatnonzero(grid))
+
+
+class DeadCheck:
+    """
+    Weights of the pagoda functions and the position class of a win
+    for one board and finish hole.
+    """
+    def __init__(self, playable, finish_bit):
+        """
+        Initialise an instance of DeadCheck for a board, given as its
+        playable bitboard, and the bit number of its finish hole.
+        """
+        self.playable = playable
+        (finish_row, finish_column) = bitboard.bit_cell(finish_bit)
+        (rows, columns) = np.indices(
+            (bitboard.BOARD_SIZE, bitboard.ROW_STRIDE))
+        holes = bits_grid(playable)
+
+        # Distance weights count down the Fibonacci numbers from the
+        # finish hole, ending with 1 at the furthest hole
+        steps = abs(rows - finish_row) + abs(columns - finish_column)
+        furthest = int(steps[holes == 1].max())
+        distance = np.array(fibonacci(furthest + 2))[
+            furthest + 1 - steps.clip(0, furthest)]
+        lattice = ((rows - finish_row) % 2 == 0) & (
+            (columns - finish_column) % 2 == 0)
+
+        # Holes in each pair of neighbouring classes along the diagonals
+        # and along the anti-diagonals
+        class_pairs = [np.isin(diagonals % 3, pair)
+                       for diagonals in (rows + columns, rows - columns)
+                       for pair in ((0, 1), (1, 2))]
+
+        # One row of weights for each bit of a pegs bitboard - the two
+        # pagoda functions, then 1 for the holes in each pair of classes
+        self.weights = (np.array([distance, lattice, *class_pairs])
+                        * holes).reshape(len(class_pairs) + 2, -1)
+        self.distance_target = int(self.weights[0, finish_bit])
+        self.lattice = grid_bits(self.weights[1])
+        self.class_pairs = [grid_bits(row) for row in self.weights[2:]]
+        self.target_class = self.position_class(1 << finish_bit)
+
+        # The same weights laid out like a board array
+        self.cell_weights = self.weights.reshape(
+            -1, bitboard.BOARD_SIZE,
+            bitboard.ROW_STRIDE)[:, :, :bitboard.BOARD_SIZE]
+
+        # Total distance weight of every value of each byte of a packed
+        # pegs bitboard, so the dot product is a lookup for each byte
+        distance_bits = self.weights[0].tolist()
+        self.byte_distances = [
+            [sum(distance_bits[8 * index + bit] for bit in range(8)
+                 if value >> bit & 1)
+             for value in range(256)]
+            for index in range(bitboard.BOARD_BYTES)
+        ]
+
+        # Change to the distance total made by each jump, so a search
+        # can keep the total up to date as it goes
+        self.jump_changes = {
+            bits: (distance_bits[bits[2]] - distance_bits[bits[0]]
+                   - distance_bits[bits[1]])
+            for bits in self._jump_bits()
+        }
+        if any(change > 0 for change in self.jump_changes.values()):
+            raise ValueError("Distance weights are not a pagoda function")
+
+    def _jump_bits(self):
+        """
+        Yields the (from, over, to) tuple of bit numbers of every jump
+        on the board.
+        """
+        for from_bit in bitboard.iter_bits(self.playable):
+            for step in bitboard.DIRECTION_STEPS.values():
+                bits = (from_bit, from_bit + step, from_bit + 2 * step)
+                if min(bits) >= 0 and all(
+                        self.playable >> bit & 1 for bit in bits):
+                    yield bits
+
+    def position_class(self, pegs):
+        """
+        Returns the position class of a pegs bitboard, as a tuple of
+        whether each pair of classes holds an odd number of pegs.
+        """
+        return tuple(bitboard.popcount(pegs & holes) & 1
+                     for holes in self.class_pairs)
+
+    def distance(self, pegs):
+        """
+        Returns the total distance weight of the pegs in a pegs bitboard.
+        """
+        return sum(map(list.__getitem__, self.byte_distances,
+                       pegs.to_bytes(bitboard.BOARD_BYTES, "little")))
+
+    def dead(self, pegs):
+        """
+        Returns True if a pegs bitboard can be proved to be unwinnable.
+        A result of False does not mean it can be won.
+        """
+        return (not pegs & self.lattice
+                or self.distance(pegs) < self.distance_target
+                or self.position_class(pegs) != self.target_class)
+
+    def dead_board(self, board_arr):
+        """
+        Returns True if a board array, in the same encoding as
+        GameBoard.board_arr, can be proved to be unwinnable.
+        """
+        totals = np.tensordot(self.cell_weights, board_arr == 1, 2)
+        return bool(totals[1] == 0 or totals[0] < self.distance_target
+                    or tuple(totals[2:] & 1) != self.target_class)
+
+
+def dead_check(playable, finish_bit):
+    """
+    Returns the DeadCheck for a board and finish hole, building it the
+    first time it is asked for.
+    """
+    key = (playable, finish_bit)
+    if key not in _CHECKS:
+        _CHECKS[key] = DeadCheck(playable, finish_bit)
+    return _CHECKS[key]
+
+
+def is_dead(game_board):
+    """
+    Returns True if the position held in a GameBoard can be proved
+    to be unwinnable.
+    """
+    return dead_check(game_board.playable,
+                      game_board.layout.finish_bit).dead(game_board.pegs)
@@ -0,0 +1,232 @@
+"""
+Monte Carlo playouts for Soliterm.
+
+Plays thousands of random games at once from a position to estimate how
+often each possible next move leads to a win and how many pegs are left
+on average. The game uses this to suggest a move and rate how hard the
+current position is.
+
+Rather than playing one game at a time, a batch of games is held as a
+2D array with one row per game and one column per playable hole. Every
+possible jump on the board is listed once in a jump table, so each step
+finds the legal jumps of every game, picks one for each and applies them
+with a few array operations.
+
+Playouts are run in rounds until a time budget is used up, so the
+analysis takes a fixed time however busy the position is.
+"""
+
+import time
+import numpy as np
+import bitboard
+from engine import jump_to_text
+
+# Default time budget for an analysis in seconds
+DEFAULT_BUDGET = 0.25
+
+# Number of playouts in the first round. Later rounds are sized to fit
+# the time left in the budget.
+ROUND_SIZE = 64
+
+# Difficulty ratings, by the lowest share of playouts that must be won
+DIFFICULTY_LEVELS = (
+    (0.25, "easy"),
+    (0.05, "medium"),
+    (0.005, "hard"),
+    (0.0, "very hard")
+)
+
+# Cache of playout arrays for each board, by (playable, finish_bit).
+# Custom layouts are named after their file, so the name could be the
+# same as a different board's.
+_JUMP_TABLES = {}
+
+
+def jump_table(layout):
+    """
+    Builds the arrays used for playouts from a board Layout's jump
+    table. Returns a dictionary containing:
+    cells - (row, column) of each playable hole, indexed by column of
+            the playout arrays
+    from, over, to - arrays of the hole indexes of each jump
+    jumps - list of (from, over, to) tuples of (row, column) tuples
+    weights - array of weights used to guide the choice of jump
+    finish - hole index of the hole the last peg must finish in
+    """
+    cells = [bitboard.bit_cell(bit)
+             for bit in bitboard.iter_bits(layout.playable)]
+    index = {cell: i for (i, cell) in enumerate(cells)}
+    jumps = [cells for (_, cells) in layout.jumps]
+    (finish_row, finish_col) = layout.finish
+
+    # Guided playouts favour jumps that land nearer the finish hole
+    distances = np.array([abs(to_row - finish_row) + abs(to_col - finish_col)
+                          for (_, _, (to_row, to_col)) in jumps])
+    weights = (1.0 + distances.max() - distances).astype(np.float32)
+
+    return {
+        "cells": cells,
+        "from": np.array([index[jump[0]] for jump in jumps]),
+        "over": np.array([index[jump[1]] for jump in jumps]),
+        "to": np.array([index[jump[2]] for jump in jumps]),
+        "jumps": jumps,
+        "weights": weights,
+        "finish": index[layout.finish]
+    }
+
+
+def _get_jump_table(game_board):
+    """
+    Returns the playout arrays for a GameBoard's layout, building them
+    the first time each board is seen.
+    """
+    layout = game_board.layout
+    key = (layout.playable, layout.finish_bit)
+    if key not in _JUMP_TABLES:
+        _JUMP_TABLES[key] = jump_table(layout)
+    return _JUMP_TABLES[key]
+
+
+def legal_jumps(pegs, table):
+    """
+    Accepts an (N, holes) boolean array of games and a jump table.
+    Returns an (N, jumps) boolean array of the legal jumps in each game.
+    """
+    return (pegs[:, table["from"]] & pegs[:, table["over"]]
+            & ~pegs[:, table["to"]])
+
+
+def apply_jumps(pegs, rows, choices, table):
+    """
+    Applies one jump, given as an index into the jump table, to each of
+    the given rows of an (N, holes) array of games.
+    """
+    pegs[rows, table["from"][choices]] = False
+    pegs[rows, table["over"][choices]] = False
+    pegs[rows, table["to"][choices]] = True
+
+
+def run_playouts(pegs, table, rng, guided=True):
+    """
+    Plays out every game in an (N, holes) boolean array until no moves
+    are left, choosing among the legal jumps at random - weighted towards
+    the finish hole if guided is True. The array is updated in place.
+    Returns a tuple of arrays of the pegs left and whether each game
+    was won.
+    """
+    if guided:
+        weights = table["weights"]
+    else:
+        weights = np.ones(len(table["jumps"]), dtype=np.float32)
+
+    live = np.arange(pegs.shape[0])
+    while live.size:
+        legal = legal_jumps(pegs[live], table)
+        has_moves = legal.any(axis=1)
+        live = live[has_moves]
+        legal = legal[has_moves]
+        if not live.size:
+            break
+
+        # Random choice of one legal jump per game: each legal jump gets
+        # a random key scaled by its weight and the largest key is picked
+        keys = rng.random(legal.shape, dtype=np.float32)
+        keys *= weights
+        keys *= legal
+        apply_jumps(pegs, live, keys.argmax(axis=1), table)
+
+    pegs_left = np.count_nonzero(pegs, axis=1)
+    wins = (pegs_left == 1) & pegs[:, table["finish"]]
+
+    return (pegs_left, wins)
+
+
+def difficulty(win_rate):
+    """
+    Returns the difficulty rating for a share of playouts won.
+    """
+    for (threshold, rating) in DIFFICULTY_LEVELS:
+        if win_rate >= threshold:
+            return rating
+    return DIFFICULTY_LEVELS[-1][1]
+
+
+def analyse(game_board, budget=DEFAULT_BUDGET, guided=True, seed=None,
+            round_size=ROUND_SIZE):
+    """
+    Runs rounds of playouts from a GameBoard's position, sharing each
+    round equally between the legal next moves, until the time budget
+    in seconds is used up. At least one round is always run.
+    Returns a dictionary containing:
+    moves - list of dictionaries for each legal move, best first, with
+            the move as a (from, over, to) tuple, its text, win rate,
+            mean pegs left and number of playouts
+    suggested - text of the best move, or None if there are no moves
+    win_rate - share of all playouts that were won
+    mean_pegs - mean pegs left over all playouts
+    difficulty - difficulty rating from DIFFICULTY_LEVELS
+    playouts - total number of playouts
+    """
+    started = time.perf_counter()
+    table = _get_jump_table(game_board)
+    rng = np.random.default_rng(seed)
+    start = np.array([game_board.board_arr[cell] == 1
+                      for cell in table["cells"]])
+
+    first_moves = np.flatnonzero(legal_jumps(start[np.newaxis], table)[0])
+    if not first_moves.size:
+        won = game_board.num_pegs == 1 and start[table["finish"]]
+        return {
+            "moves": [],
+            "suggested": None,
+            "win_rate": 1.0 if won else 0.0,
+            "mean_pegs": float(game_board.num_pegs),
+            "difficulty": difficulty(1.0 if won else 0.0),
+            "playouts": 0
+        }
+
+    per_move = max(1, round_size // first_moves.size)
+    wins = np.zeros(first_moves.size)
+    pegs_left = np.zeros(first_moves.size)
+    playouts = 0
+
+    while per_move:
+        round_started = time.perf_counter()
+        choices = np.repeat(first_moves, per_move)
+        pegs = np.repeat(start[np.newaxis], choices.size, axis=0)
+        apply_jumps(pegs, np.arange(choices.size), choices, table)
+        (round_pegs, round_wins) = run_playouts(pegs, table, rng, guided)
+
+        # Playouts for each first move are next to each other
+        wins += round_wins.reshape(first_moves.size, per_move).sum(axis=1)
+        pegs_left += round_pegs.reshape(first_moves.size, per_move).sum(
+            axis=1)
+        playouts += per_move
+
+        # Size the next round to fit in the rest of the budget, at most
+        # doubling it, and stop if not even one playout per move fits
+        now = time.perf_counter()
+        scale = (budget - (now - started)) / (now - round_started)
+        per_move = int(per_move * min(max(scale, 0.0), 2.0))
+
+    moves = [
+        {
+            "move": table["jumps"][jump],
+            "text": jump_to_text(table["jumps"][jump]),
+            "win_rate": float(wins[i] / playouts),
+            "mean_pegs": float(pegs_left[i] / playouts),
+            "playouts": playouts
+        }
+        for (i, jump) in enumerate(first_moves)
+    ]
+    moves.sort(key=lambda move: (-move["win_rate"], move["mean_pegs"]))
+    win_rate = float(wins.sum() / (playouts * first_moves.size))
+
+    return {
+        "moves": moves,
+        "suggested": moves[0]["text"],
+        "win_rate": win_rate,
+        "mean_pegs": float(pegs_left.sum() / (playouts * first_moves.size)),
+        "difficulty": difficulty(win_rate),
+        "playouts": playouts * first_moves.size
+    }
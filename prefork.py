@@ -0,0 +1,236 @@
+"""
+Pre-forked launcher for Soliterm.
+
+Starting a new python3 process and importing numpy for every player
+takes hundreds of milliseconds before the title screen appears. This
+launcher imports the game once, then keeps a pool of warm worker
+processes forked from it. Each worker has already forked a copy of the
+game onto its own pseudo terminal, which waits until a player connects.
+
+When a player connects, a ready worker starts its game and passes bytes
+between the connection and the game's terminal, and the launcher forks
+a new worker to take its place. Players connect in the same way as to
+server.py, so the web page can use it by setting SOLITERM_SERVER.
+
+Linux only, as it relies on fork().
+
+Usage:
+python3 prefork.py --port 8765 --workers 4
+"""
+
+import argparse
+import fcntl
+import os
+import pty
+import select
+import signal
+import socket
+import struct
+import sys
+import termios
+import time
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+
+# Terminal type and size given to each game, matching the terminal
+# spawned for each player by controllers/default.js
+TERM_NAME = "xterm-color"
+TERM_ROWS = 24
+TERM_COLS = 80
+
+
+def run_game(game_main, go_fd):
+    """
+    Runs in the forked game process. Waits until a player has connected,
+    then plays the game on the pseudo terminal. Never returns.
+    """
+    # The pipe is closed without a byte if the worker is stopped first
+    if not os.read(go_fd, 1):
+        os._exit(0)  # pylint: disable=protected-access
+
+    os.environ["TERM"] = TERM_NAME
+    try:
+        game_main()
+    except SystemExit as error:
+        # Show the quit message in the same way as Python would
+        if isinstance(error.code, str):
+            sys.stderr.write(error.code + "\n")
+            sys.stderr.flush()
+    finally:
+        os._exit(0)  # pylint: disable=protected-access
+
+
+def relay(conn, master_fd, started):
+    """
+    Passes bytes between a player's connection and the game's terminal
+    until either side closes. Returns the time in seconds from started
+    until the game sent its first output.
+    """
+    first_output = None
+    while True:
+        (readable, _, _) = select.select([conn, master_fd], [], [])
+
+        if conn in readable:
+            data = conn.recv(4096)
+            if not data:
+                break
+            os.write(master_fd, data)
+
+        if master_fd in readable:
+            # Reading the terminal fails with EIO once the game has exited
+            try:
+                data = os.read(master_fd, 65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            if first_output is None:
+                first_output = time.perf_counter() - started
+            conn.sendall(data)
+
+    return first_output
+
+
+def run_worker(listener, notify_fd, game_main):
+    """
+    Runs in a forked worker process. Forks a game onto a new pseudo
+    terminal, waits for a player to connect, then starts the game and
+    relays its terminal to the player. Never returns.
+    """
+    (go_read, go_write) = os.pipe()
+    (game_pid, master_fd) = pty.fork()
+    if game_pid == 0:
+        listener.close()
+        os.close(go_write)
+        run_game(game_main, go_read)
+    os.close(go_read)
+
+    fcntl.ioctl(master_fd, termios.TIOCSWINSZ,
+                struct.pack("HHHH", TERM_ROWS, TERM_COLS, 0, 0))
+
+    (conn, _) = listener.accept()
+    listener.close()
+
+    # Tell the launcher this worker is busy so it can fork a replacement
+    os.write(notify_fd, b"x")
+
+    started = time.perf_counter()
+    os.write(go_write, b"g")
+    first_output = relay(conn, master_fd, started)
+    if first_output is not None:
+        print(f"Worker {os.getpid()}: first frame after "
+              f"{first_output * 1000:.1f}ms", flush=True)
+
+    # Stop the game if the player disconnected, as controllers/default.js
+    # does for a spawned terminal
+    try:
+        os.kill(game_pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    os.waitpid(game_pid, 0)
+    conn.close()
+    os._exit(0)  # pylint: disable=protected-access
+
+
+def fork_worker(listener, notify_fd, game_main):
+    """
+    Forks a new worker process and returns its process id.
+    """
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        run_worker(listener, notify_fd, game_main)
+    return pid
+
+
+def serve(listener, num_workers, game_main):
+    """
+    Keeps num_workers warm workers waiting for players, forking a new
+    one each time a worker is handed a player. Runs until interrupted,
+    then stops all the workers.
+    """
+    (notify_read, notify_write) = os.pipe()
+    workers = set()
+    for _ in range(num_workers):
+        workers.add(fork_worker(listener, notify_write, game_main))
+
+    try:
+        serve_forever(listener, notify_read, notify_write, game_main,
+                      workers)
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def serve_forever(listener, notify_read, notify_write, game_main, workers):
+    """
+    Forks replacement workers as workers are handed players, and clears
+    up workers that have finished. workers is the set of worker process
+    ids, which is kept up to date.
+    """
+    while True:
+        (readable, _, _) = select.select([notify_read], [], [], 1.0)
+        if readable:
+            # One byte is sent for each worker that has been handed a player
+            for _ in os.read(notify_read, 1024):
+                started = time.perf_counter()
+                workers.add(fork_worker(listener, notify_write, game_main))
+                print(f"Forked replacement worker in "
+                      f"{(time.perf_counter() - started) * 1000:.1f}ms",
+                      flush=True)
+
+        # Clear up workers that have finished their session
+        try:
+            while True:
+                (pid, _) = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                workers.discard(pid)
+        except ChildProcessError:
+            pass
+
+
+def main():
+    """
+    Command line entry point to run the launcher.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run Soliterm with a pool of pre-forked workers")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="TCP port to listen on")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of warm workers to keep ready")
+    args = parser.parse_args()
+
+    # Import the game once here, so every worker starts with it loaded
+    started = time.perf_counter()
+    # pylint: disable=import-outside-toplevel
+    import run
+    print(f"Imported game in {(time.perf_counter() - started) * 1000:.1f}ms",
+          flush=True)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen()
+    print(f"Soliterm launcher listening on {args.port} with "
+          f"{args.workers} workers", flush=True)
+
+    # Stop the workers on Ctrl+C or when asked to terminate
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(listener, args.workers, run.play)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Puzzle packs for Soliterm.
+
+A puzzle is a position with only a few pegs that can be won. Puzzles
+are generated backwards from the winning position - a single peg in
+the finish hole - by applying random reverse jumps, so each one comes
+with the moves that win it and is solvable by construction. Puzzles
+that are the same as one already found under the symmetries of the
+board are dropped.
+
+A pack file holds the winning moves of each puzzle rather than its
+position, as the position is just the winning position with every
+jump of the solution undone. Each puzzle is a fixed size record of
+2 byte move codes, in the same format as game records, padded to the
+longest solution in the pack, so any puzzle can be read straight from
+its place in the file.
+
+Usage to generate a pack of puzzles, e.g. a daily set:
+python3 puzzles.py --count 5000 --seed 2026-10-18 --output puzzles.pack
+
+and to check that every puzzle in a pack can be won:
+python3 puzzles.py --check puzzles.pack
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+import bitboard
+from engine import GameBoard
+from gamelog import CUSTOM_LAYOUT, encode_move, decode_move
+from layouts import DEFAULT_LAYOUT, find_layout
+
+# Default location of the pack file, next to this module
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "puzzles.pack")
+
+# Default number of puzzles generated, and the range of pegs in them
+DEFAULT_COUNT = 1000
+DEFAULT_MIN_PEGS = 6
+DEFAULT_MAX_PEGS = 10
+
+# Generation gives up after this many attempts for each puzzle asked
+# for, as there are only so many different puzzles with few pegs
+MAX_TRIES_PER_PUZZLE = 20
+
+# File layout:
+# magic, layout number, finish bit, maximum pegs, number of puzzles,
+# then the playable mask, padded to HEADER_SIZE bytes, followed by the
+# puzzles. Each puzzle is maximum pegs - 1 little endian move codes,
+# with the solution first and NO_MOVE after it.
+MAGIC = b"SOLIPZ01"
+HEADER_FORMAT = "<8sBBBxI"
+HEADER_SIZE = 64
+NO_MOVE = 0xFFFF
+
+# Direction of each step between neighbouring holes
+STEP_DIRECTIONS = {step: direction for (direction, step)
+                   in bitboard.DIRECTION_STEPS.items()}
+
+
+def jump_code(bits):
+    """
+    Returns the move code for a (from, over, to) tuple of bit numbers.
+    """
+    (row_num, column_num) = bitboard.bit_cell(bits[0])
+    return encode_move((True, row_num, column_num,
+                        STEP_DIRECTIONS[bits[1] - bits[0]]))
+
+
+def code_jump(code):
+    """
+    Returns the (from, over, to) tuple of bit numbers for a move code.
+    """
+    (_, row_num, column_num, direction) = decode_move(code)
+    from_bit = bitboard.cell_bit(row_num, column_num)
+    step = bitboard.DIRECTION_STEPS[direction]
+    return (from_bit, from_bit + step, from_bit + 2 * step)
+
+
+def layout_symmetries(layout):
+    """
+    Returns a list of the indexes, in bitboard.SYMMETRIES, of the
+    symmetries that leave a board Layout and its finish hole the same.
+    """
+    board_images = bitboard.symmetric_images(layout.playable)
+    finish_images = bitboard.symmetric_images(1 << layout.finish_bit)
+    return [index for index in range(len(bitboard.SYMMETRIES))
+            if board_images[index] == layout.playable
+            and finish_images[index] == 1 << layout.finish_bit]
+
+
+def puzzle_key(pegs, symmetries):
+    """
+    Returns a key for a pegs bitboard that is the same for every
+    position it can be turned into by a list of symmetry indexes, as
+    returned by layout_symmetries().
+    """
+    if len(symmetries) == 1:
+        return pegs
+    images = bitboard.symmetric_images(pegs)
+    return min(images[index] for index in symmetries)
+
+
+def generate(layout, count, min_pegs=DEFAULT_MIN_PEGS,
+             max_pegs=DEFAULT_MAX_PEGS, seed=None):
+    """
+    Generates up to count different puzzles with between min_pegs and
+    max_pegs pegs on a board Layout. seed makes the puzzles the same
+    every time, e.g. for a daily set.
+    Returns a list of (pegs, solution) tuples ordered by the number of
+    pegs, where solution is a list of the (from, over, to) tuples of bit
+    numbers that win the puzzle. Fewer than count puzzles are returned
+    if no more different ones could be found.
+    """
+    rand = random.Random(seed)
+    playable = layout.playable
+    target = 1 << layout.finish_bit
+    symmetries = layout_symmetries(layout)
+    found = {}
+
+    for _ in range(count * MAX_TRIES_PER_PUZZLE):
+        if len(found) == count:
+            break
+
+        # Walk backwards from the win, adding one peg with each reverse
+        # jump, and start again if a walk gets stuck
+        pegs = target
+        path = []
+        for _ in range(rand.randint(min_pegs, max_pegs) - 1):
+            moves = list(bitboard.unjumps(pegs, playable))
+            if not moves:
+                break
+            move = rand.choice(moves)
+            pegs = bitboard.apply_jump(pegs, *move)
+            path.append(move)
+        else:
+            key = puzzle_key(pegs, symmetries)
+            if key not in found:
+                found[key] = (pegs, path[::-1])
+
+    return sorted(found.values(),
+                  key=lambda puzzle: (len(puzzle[1]), puzzle[0]))
+
+
+def write_pack(path, layout, puzzles):
+    """
+    Writes a list of (pegs, solution) puzzles, as returned by
+    generate(), to a pack file for a board Layout.
+    """
+    moves_per_puzzle = max((len(solution) for (_, solution) in puzzles),
+                           default=0)
+    codes = array("H")
+    for (_, solution) in puzzles:
+        codes.extend(jump_code(move) for move in solution)
+        codes.extend([NO_MOVE] * (moves_per_puzzle - len(solution)))
+    if sys.byteorder == "big":
+        codes.byteswap()
+
+    layout_id = layout.layout_id
+    header = struct.pack(HEADER_FORMAT, MAGIC,
+                         CUSTOM_LAYOUT if layout_id is None else layout_id,
+                         layout.finish_bit, moves_per_puzzle + 1,
+                         len(puzzles))
+    header += layout.playable.to_bytes(bitboard.BOARD_BYTES, "little")
+    with open(path, "wb") as pack_file:
+        pack_file.write(header.ljust(HEADER_SIZE, b"\0"))
+        pack_file.write(codes.tobytes())
+
+
+class PuzzlePack:
+    """
+    Puzzles read from a pack file.
+    """
+    def __init__(self, path):
+        """
+        Initialise an instance of PuzzlePack by reading the file at path.
+        Raises ValueError if the file is not a puzzle pack.
+        """
+        with open(path, "rb") as pack_file:
+            data = pack_file.read()
+
+        if len(data) < HEADER_SIZE:
+            raise ValueError(f"{path} is not a Soliterm puzzle pack")
+        (magic, self.layout_id, self.finish_bit, self.max_pegs,
+         self.count) = struct.unpack_from(HEADER_FORMAT, data)
+        self.moves_per_puzzle = self.max_pegs - 1
+        if (magic != MAGIC or len(data) != HEADER_SIZE
+                + 2 * self.count * self.moves_per_puzzle):
+            raise ValueError(f"{path} is not a Soliterm puzzle pack")
+
+        start = struct.calcsize(HEADER_FORMAT)
+        self.playable = int.from_bytes(
+            data[start:start + bitboard.BOARD_BYTES], "little")
+        self.codes = array("H", data[HEADER_SIZE:])
+        if sys.byteorder == "big":
+            self.codes.byteswap()
+
+    def __len__(self):
+        """
+        Returns the number of puzzles in the pack.
+        """
+        return self.count
+
+    def covers(self, layout):
+        """
+        Returns True if the puzzles were generated for a board Layout.
+        """
+        return (self.playable == layout.playable
+                and self.finish_bit == layout.finish_bit)
+
+    def solution(self, index):
+        """
+        Returns a list of the move codes that win a puzzle.
+        """
+        start = index * self.moves_per_puzzle
+        codes = self.codes[start:start + self.moves_per_puzzle]
+        return [code for code in codes if code != NO_MOVE]
+
+    def pegs(self, index):
+        """
+        Returns the pegs bitboard of a puzzle, by undoing each jump of
+        its solution from the winning position.
+        """
+        pegs = 1 << self.finish_bit
+        for code in self.solution(index):
+            pegs = bitboard.apply_jump(pegs, *code_jump(code))
+        return pegs
+
+    def new_game(self, layout, debug=False, index=None):
+        """
+        Returns a GameBoard set up with a puzzle on a board Layout,
+        chosen at random unless an index is given.
+        """
+        if index is None:
+            index = random.randrange(self.count)
+        game_board = GameBoard(debug, layout)
+        game_board.set_position(self.pegs(index), 0)
+        return game_board
+
+    def verify(self):
+        """
+        Plays the solution of every puzzle, checking every jump is legal.
+        Returns a list of the indexes of any puzzles that are not won.
+        """
+        target = 1 << self.finish_bit
+        failed = []
+        for index in range(self.count):
+            pegs = self.pegs(index)
+            for code in self.solution(index):
+                bits = code_jump(code)
+                if not bitboard.is_legal_jump(pegs, self.playable, *bits):
+                    break
+                pegs = bitboard.apply_jump(pegs, *bits)
+            if pegs != target:
+                failed.append(index)
+
+        return failed
+
+
+def open_puzzle_pack(path=None):
+    """
+    Opens the pack at path, or at the path in the SOLITERM_PUZZLES
+    environment variable if path is not given.
+    Returns a PuzzlePack, or None if no path is set, the file is not
+    usable or it holds no puzzles.
+    """
+    if path is None:
+        path = os.environ.get("SOLITERM_PUZZLES")
+    if not path:
+        return None
+
+    try:
+        pack = PuzzlePack(path)
+    except (OSError, ValueError):
+        return None
+    return pack if len(pack) else None
+
+
+def main():
+    """
+    Command line entry point to generate or check a puzzle pack.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate a pack of Soliterm puzzles")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT,
+                        help="number of puzzles to generate")
+    parser.add_argument("--min-pegs", type=int, default=DEFAULT_MIN_PEGS,
+                        help="fewest pegs in a puzzle")
+    parser.add_argument("--max-pegs", type=int, default=DEFAULT_MAX_PEGS,
+                        help="most pegs in a puzzle")
+    parser.add_argument("--seed",
+                        help="generate the same puzzles every time, "
+                        "e.g. the date for a daily set")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                        help="name of the board layout, or a layout file")
+    parser.add_argument("--output", default=DEFAULT_PATH,
+                        help="file to write the puzzles to")
+    parser.add_argument("--check", metavar="PACK",
+                        help="check every puzzle in a pack can be won "
+                        "instead of generating one")
+    args = parser.parse_args()
+
+    if args.check:
+        pack = PuzzlePack(args.check)
+        failed = pack.verify()
+        print(f"{len(pack) - len(failed)} of {len(pack)} puzzles "
+              f"can be won")
+        sys.exit(1 if failed else 0)
+
+    if not 2 <= args.min_pegs <= args.max_pegs <= 0xFF:
+        parser.error("--min-pegs and --max-pegs must be from 2 to 255")
+
+    layout = find_layout(args.layout)
+    started = time.perf_counter()
+    puzzles = generate(layout, args.count, args.min_pegs, args.max_pegs,
+                       args.seed)
+    write_pack(args.output, layout, puzzles)
+    seconds = time.perf_counter() - started
+    print(f"Wrote {len(puzzles)} puzzles to {args.output} in "
+          f"{seconds:.2f}s ({len(puzzles) / seconds:.0f} per second)")
+
+
+if __name__ == "__main__":
+    main()
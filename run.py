@@ -1,13 +1,67 @@
 """
-Contains all Python code for Soliterm -
-a game of Peg Solitaire for the terminal
+Curses frontend for Soliterm -
+a game of Peg Solitaire for the terminal.
+The rules of the game are in engine.py.
 """
 
 # Import libraries
 import curses
 from curses import wrapper
 from sys import exit as sys_exit
+import os
+import time
 import numpy as np
+from engine import (GameBoard, validate_format, validate_move, eval_moves,
+                    check_win, cell_to_text)
+from bitboard import CENTRE_BIT
+from tablebase import open_tablebase
+from gamelog import open_game_log, UNFINISHED, WON, LOST
+from layouts import find_layout
+from history import History
+from search import BackgroundSearch
+from latency import open_tracer
+from sessions import open_session_store
+from pagoda import is_dead
+from puzzles import open_puzzle_pack
+from messages import (LOGO, TAGLINE, INSTRUCTIONS, PROMPT, MAX_INPUT,
+                      INPUT_WIDTH, TITLE_MSG, INVALID_FORMAT_MSG,
+                      INVALID_MOVE_MSG, GOOD_MOVE_MSG, WIN_MSG, LOSE_MSG,
+                      CONTINUE_MSG, QUIT_MSG, RESUME_MSG, DEAD_MSG,
+                      DEAD_START_MSG,
+                      CELL_STYLES, STATS_WIDTH, hint_msg, history_msg,
+                      play_moves)
+
+# Keys that end the player's input, and keys that delete a character
+ENTER_KEYS = ("\n", "\r", curses.KEY_ENTER)
+BACKSPACE_KEYS = ("\x7f", "\b", curses.KEY_BACKSPACE)
+
+
+class CountingWindow:
+    """
+    Wraps a curses window, counting every call made on it in the
+    TermManager that owns it.
+    """
+    def __init__(self, window, term_manager):
+        """
+        Initialise an instance of CountingWindow for a curses window.
+        """
+        self.window = window
+        self.term_manager = term_manager
+
+    def __getattr__(self, name):
+        """
+        Returns a method of the window that counts each call to it.
+        The method is kept, so later calls skip this lookup.
+        """
+        method = getattr(self.window, name)
+        term_manager = self.term_manager
+
+        def counted(*args):
+            term_manager.curses_calls += 1
+            return method(*args)
+
+        setattr(self, name, counted)
+        return counted
 
 
 class TermManager:
@@ -23,13 +77,20 @@ class TermManager:
         top and bottomm windows and stores them as top_win and bottom_win
         instance variables.  Initialises curses color pairs.
         """
+        # Number of curses calls made through the windows and doupdate(),
+        # used for latency tracing
+        self.curses_calls = 0
+
         # Get a reference to the screen and clear it
-        self.stdscr = stdscr
-        stdscr.clear()
+        self.stdscr = CountingWindow(stdscr, self)
+        self.stdscr.clear()
 
         # Define top and bottom windows
-        self.top_win = curses.newwin(19, 80, 0, 0)
-        self.bottom_win = curses.newwin(5, 80, 19, 0)
+        self.top_win = CountingWindow(curses.newwin(19, 80, 0, 0), self)
+        self.bottom_win = CountingWindow(curses.newwin(5, 80, 19, 0), self)
+
+        # Read keys such as backspace as single key codes
+        self.bottom_win.keypad(True)
 
         # Initialise curses color_pairs
         curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_RED)
@@ -39,6 +100,17 @@ class TermManager:
         curses.init_pair(5, curses.COLOR_CYAN, curses.COLOR_BLACK)
         curses.init_pair(6, curses.COLOR_RED, curses.COLOR_BLACK)
 
+        # Copy of the board array as last drawn in the top window,
+        # or None if the board needs to be drawn from scratch
+        self.drawn_board = None
+
+    def doupdate(self):
+        """
+        Sends every change made to the windows to the terminal at once.
+        """
+        self.curses_calls += 1
+        curses.doupdate()
+
     def show_msg(self, row, *strs):
         """
         Displays an in game message in the bottom window.
@@ -56,170 +128,99 @@ class TermManager:
         self.bottom_win.refresh()
 
 
-class GameBoard:
-    """
-    Holds a 2D array representing the game board.
-    Stores number of pegs in the board and number of turns, and
-    has a method to update these.
-    """
-    def __init__(self):
-        """
-        Initialise an instance of GameBoard with a 2D array configured
-        for a new gamem and variables to hold number of pegs and turns.
-        Values inside the array:
-        0 = empty hole
-        1 = hole with a peg
-        2 = unplayable 'space' at the edge of the board
-        """
-        self.board_arr = np.array(
-            # Starting layout for final game
-            [
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
-                [2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2]
-            ]
-        )
-        # Init number of pegs in the board and number of turns.
-        # Technique to count number of occurences of a value in an array from
-        # https://thispointer.com/count-occurrences-of-a-value-in-numpy-array-in-python/
-        self.num_pegs = np.count_nonzero(self.board_arr == 1)
-        self.num_turns = 0
-
-    def update_board(self, validated_move):
-        """
-        Accepts a dictionary containing a validated move as an argument,
-        extracts the values and updates the game board data model
-        """
-        # Extract the coordinates of cell the player is moving from,
-        # cell they are moving to and cell of peg to be removed
-        (from_row, from_col) = validated_move["from"]
-        (to_row, to_col) = validated_move["to"]
-        (remove_row, remove_col) = validated_move["remove"]
-
-        # Update cells with correct values
-        self.board_arr[from_row, from_col] = 0
-        self.board_arr[to_row, to_col] = 1
-        self.board_arr[remove_row, remove_col] = 0
-
-    def update_stats(self):
-        """
-        Updates number of pegs in board and
-        increments number of turns.
-        """
-        # Technique to count number of occurences of a value in an array from
-        # https://thispointer.com/count-occurrences-of-a-value-in-numpy-array-in-python/
-        self.num_pegs = np.count_nonzero(self.board_arr == 1)
-        self.num_turns += 1
-
-
 def show_title(term_manager):
     """
     Displays the title screen and instructions.
     Waits for player to press a key to start.
     """
-    # Define strings to display
-    # ASCII art logo generated using
-    # https://patorjk.com/software/taag/#p=display&f=Graffiti&t=Soliterm
-    logo = np.array([
-        r"              _________      .__  .__  __                        ",
-        r"             /   _____/ ____ |  | |__|/  |_  ___________  _____  ",
-        r"             \_____  \ /  _ \|  | |  \   __\/ __ \_  __ \/     \ ",
-        r"             /        (  <_> )  |_|  ||  | \  ___/|  | \/  Y Y  \ ",
-        r"            /_______  /\____/|____/__||__|  \___  >__|  |__|_|  / ",
-        r"                    \/                          \/            \/ "
-    ])
-
-    tagline = "******************* A game of peg solitaire for the terminal"\
-              " *******************"
-    instructions = np.array([
-        "The aim is to clear the board of pegs except for leaving one "
-        "in the centre hole.",
-        "Pegs can move up, down, left or right by jumping over another peg "
-        "into an empty",
-        "hole. The peg you jump over is removed - that's how you remove pegs.",
-        " ",
-        "Pegs are shown by * with a red background. "
-        "Spaces are shown in blue.",
-        "Enter your move with column, row and u, d, l or r for up, down, "
-        "left or right.",
-        "The computer will tell you if you run out of moves.",
-        " ",
-        "Example: h10d to move peg in hole H10 down.",
-        "Example: n6l to move peg in hole N6 left."
-    ])
-
     # Clear the top window and display the strings.
+    # The board will need to be drawn from scratch afterwards.
     term_manager.top_win.clear()
+    term_manager.drawn_board = None
     for i in range(0, 3):
-        term_manager.top_win.addstr(i, 0, logo[i], curses.color_pair(5))
+        term_manager.top_win.addstr(i, 0, LOGO[i], curses.color_pair(5))
 
-    for i in range(3, len(logo)):
-        term_manager.top_win.addstr(i, 0, logo[i], curses.color_pair(6))
+    for i in range(3, len(LOGO)):
+        term_manager.top_win.addstr(i, 0, LOGO[i], curses.color_pair(6))
 
-    term_manager.top_win.addstr(6, 0, tagline, curses.color_pair(5))
+    term_manager.top_win.addstr(6, 0, TAGLINE, curses.color_pair(5))
 
-    for i in range(0, len(instructions)):
-        term_manager.top_win.addstr(i + 8, 0, instructions[i],
+    for i in range(0, len(INSTRUCTIONS)):
+        term_manager.top_win.addstr(i + 8, 0, INSTRUCTIONS[i],
                                     curses.color_pair(4))
 
     term_manager.top_win.refresh()
 
     # Prompt player to press a key in the bottom window
     # and wait for key press.
-    term_manager.show_msg(0, "Press a key when ready", "", "", "", "")
+    term_manager.show_msg(0, TITLE_MSG, "", "", "", "")
     term_manager.bottom_win.getkey()
 
 
-def draw_board(game_board, term_manager):
+def draw_board(game_board, term_manager, tablebase=None):
     """
     Draws the game board in the top window.
     Arguments are references to the game_board object and
-    the term_manager object.
+    the term_manager object, and optionally an endgame tablebase
+    used to show whether the position can still be won.
+
+    The frame and labels are only drawn when the window has been cleared.
+    After that, only cells that differ from the last board drawn and the
+    game stats are redrawn, to keep the amount sent to the terminal
+    for each turn small.
     """
-    # Make sure window is clear
-    term_manager.top_win.clear()
+    board = game_board.board_arr
+    drawn = term_manager.drawn_board
+
+    if drawn is None or drawn.shape != board.shape:
+        # Nothing retained, so clear the window, draw the labels and
+        # treat every cell as changed
+        term_manager.top_win.clear()
+        draw_labels(term_manager)
+        changed = np.argwhere(np.ones(board.shape, dtype=bool))
+    else:
+        changed = np.argwhere(drawn != board)
+
+    # Draw each changed cell. Each cell is 3 characters wide,
+    # and the board starts at row 1, column 25.
+    for (row, column) in changed:
+        (string, pair) = CELL_STYLES[board[row, column]]
+        term_manager.top_win.addstr(int(row) + 1, int(column) * 3 + 25,
+                                    string, curses.color_pair(pair))
+
+    # Print game stats to top window. Each line is padded to a fixed
+    # width to overwrite the previous value without clearing the labels.
+    stats = [
+        f"Pegs left: {game_board.num_pegs}",
+        f"Turns taken: {game_board.num_turns}",
+        ""
+    ]
+
+    # Late in the game, look up whether the position can still be won
+    if tablebase is not None and tablebase.covers(game_board.layout):
+        winnable = tablebase.is_winnable(game_board.pegs)
+        if winnable is not None:
+            stats[2] = f"Can still win: {'yes' if winnable else 'no'}"
+
+    # Show where the last peg must finish if it is not the centre hole
+    if game_board.layout.finish_bit != CENTRE_BIT:
+        stats.append(f"Finish in: {cell_to_text(game_board.layout.finish)}")
+
+    for (row, string) in enumerate(stats):
+        term_manager.top_win.addstr(row, 0, string.ljust(STATS_WIDTH),
+                                    curses.color_pair(4))
+
+    # Remember what was drawn, and send all changes to the terminal at once
+    term_manager.drawn_board = board.copy()
+    term_manager.top_win.noutrefresh()
+    term_manager.doupdate()
+
 
-    # Counters to represent the position of each row and cell of the game board
-    row_pos = 1
-    cell_pos = 25
-
-    # Iterate through each row and cell of the game board,
-    # and draw the appropriate item in each position.
-    # Each cell is 3 characters wide.
-    for row in game_board.board_arr:
-        for cell in row:
-            if cell == 0:
-                term_manager.top_win.addstr(row_pos,
-                                            cell_pos, "   ",
-                                            curses.color_pair(2))
-            if cell == 1:
-                term_manager.top_win.addstr(row_pos,
-                                            cell_pos, " * ",
-                                            curses.color_pair(1))
-            if cell == 2:
-                term_manager.top_win.addstr(row_pos,
-                                            cell_pos, "   ",
-                                            curses.color_pair(0))
-            cell_pos += 3
-
-        # Increment the row counter and reset the cell counter for another row
-        row_pos += 1
-        cell_pos = 25
-
-    # Print out the cell position letters and numbers above
-    # and below the board.
+def draw_labels(term_manager):
+    """
+    Prints out the cell position letters and numbers above
+    and below, and to the left and right of, the board.
+    """
     cell_pos = 0
 
     # Loop through each column and print out a letter above
@@ -230,10 +231,10 @@ def draw_board(game_board, term_manager):
         # tutorial from codingem:
         # https://www.codingem.com/python-range-of-letters/
         letters = [chr(n) for n in range(ord("A"), ord("P"))]
-        term_manager.top_win.addstr(0, cell_pos * 3 + 25, f' {letters[num]} ',
-                                    curses.color_pair(4))
-        term_manager.top_win.addstr(16, cell_pos * 3 + 25, f' {letters[num]} ',
-                                    curses.color_pair(4))
+        term_manager.top_win.addstr(0, cell_pos * 3 + 25,
+                                    f' {letters[num]} ', curses.color_pair(4))
+        term_manager.top_win.addstr(16, cell_pos * 3 + 25,
+                                    f' {letters[num]} ', curses.color_pair(4))
         cell_pos += 1
 
     # Loop through each row and print out a number
@@ -244,240 +245,82 @@ def draw_board(game_board, term_manager):
         term_manager.top_win.addstr(num, 70, f' {str(num)} ',
                                     curses.color_pair(4))
 
-    # Print game stats to top window
-    term_manager.top_win.addstr(0, 0, f"Pegs left: {game_board.num_pegs}",
-                                curses.color_pair(4))
-    term_manager.top_win.addstr(1, 0, f"Turns taken: {game_board.num_turns}",
-                                curses.color_pair(4))
-
-    # Refresh window
-    term_manager.top_win.refresh()
-
 
 def get_move(term_manager):
     """
-    Prompts the player to enter their next move,
-    accepts input and returns the value entered.
+    Prompts the player to enter their next move, or several moves
+    separated by spaces, accepts input and returns the value entered.
     """
     # Print example of valid move and prompt player to enter move
-    term_manager.show_msg(0, "Move format is column, row, "
-                          "direction, e.g. h10u", "or enter i for instructions"
-                          ", or q to quit", " ", "Enter next move> ")
-
-    # Echo user input to terminal, get input and turn off echo
-    curses.echo()
-    # Using decode() on getstr() as per
-    # https://stackoverflow.com/questions/21505871/curses-window-getstr
-    player_input =\
-        term_manager.bottom_win.getstr(3, 18, 4).decode(encoding="utf=8")
-    curses.noecho()
-
-    return player_input
-
-
-def validate_format(move):
-    """
-    Validates the players move to ensure it is in the right format
-    move argument is the string input by the player.
-
-    Returns a tuple containing a bool to indicate if the move was
-    in a valid format, and the row, column and direction of the move
-    if it was valid. Also returns special values for quit or
-    instructions.
-
-    Row and column are integers, direction is a string.
-    """
-
-    # If player enters q for quit return special value
-    if move.lower() == "q":
-        return(True, -1, 0, "0")
-
-    # If player enters i for instructions return special value
-    if move.lower() == "i":
-        return(True, -2, 0, "0")
-
-    # If move is not 3 or 4 characters, it is invalid.
-    if len(move) > 4 or len(move) < 3:
-        return(False, 0, 0, "0")
-
-    # Extract column from move string and ensure lower case
-    column = move[0].lower()
-
-    # If string is 3 characters, row is the second character.
-    # If string is 4 characters, slice out the second and third characters.
-    if len(move) == 3:
-        row = move[1]
-    else:
-        row = move[1:3]
-
-    # Direction is always the last character
-    direction = move[-1].lower()
-
-    # Check if column is within allowed range
-    # and if it is convert to an integer.
-    letters = [chr(n) for n in range(ord("a"), ord("p"))]
-    if column not in letters:
-        return(False, 0, 0, "0")
-    column_num = letters.index(column)
-
-    # Try to convert row to an integer
-    # and convert to zero indexed.
-    # Catch error and return if player did not
-    # enter a number.
-    try:
-        row_num = int(row) - 1
-    except ValueError:
-        return(False, 0, 0, "0")
-
-    # Check if row is in allowed range
-    if row_num not in range(0, 15):
-        return(False, 0, 0, "0")
-
-    # Check if direction is allowed
-    letters = ["u", "d", "l", "r"]
-    if direction not in letters:
-        return(False, 0, 0, "0")
-
-    # Everything checks out, return validated move
-    return(True, row_num, column_num, direction)
-
-
-def validate_move(move, game_board):
-    """
-    Check whether the player's move is valid within the rules.
-    Returns a dictionary containing  a bool to indicate if
-    move is valid, and if valid the location the player has moved
-    from, where they are moving to and which peg to remove.
-    """
-    # Unpack move
-    (_, row_num, column_num, direction) = move
-
-    # Initialise dictionary to hold details of all cells affected by move
-    validated_dict = {
-        "valid": False,
-        "from": (0, 0),
-        "to": (0, 0),
-        "remove": (0, 0)
-    }
-
-    # Move can't be valid if an unplayable cell
-    if game_board.board_arr[row_num, column_num] == 2:
-        return validated_dict
-
-    # If player wants to move down, the cell directly below
-    # must have a peg and the cell below that must be empty
-    if direction == "d" and row_num < (len(game_board.board_arr) - 2):
-        if (game_board.board_arr[row_num + 1, column_num] == 1)\
-          and (game_board.board_arr[row_num + 2, column_num] == 0):
-            validated_dict = {
-                "valid": True,
-                "from": (row_num, column_num),
-                "to": (row_num + 2, column_num),
-                "remove": (row_num + 1, column_num)
-            }
-
-    # If player wants to move up, the cell directly above
-    # must have a peg and the cell above that must be empty
-    if direction == "u" and row_num > 1:
-        if (game_board.board_arr[row_num - 1, column_num] == 1)\
-          and (game_board.board_arr[row_num - 2, column_num] == 0):
-            validated_dict = {
-                "valid": True,
-                "from": (row_num, column_num),
-                "to": (row_num - 2, column_num),
-                "remove": (row_num - 1, column_num)
-            }
-
-    # If player wants to move left, the cell directly to the left
-    # must have a peg and the cell to the left of that must be empty
-    if direction == "l" and column_num > 1:
-        if (game_board.board_arr[row_num, column_num - 1] == 1)\
-          and (game_board.board_arr[row_num, column_num - 2] == 0):
-            validated_dict = {
-                "valid": True,
-                "from": (row_num, column_num),
-                "to": (row_num, column_num - 2),
-                "remove": (row_num, column_num - 1)
-            }
-
-    # If player wants to move right, the cell directly to the right
-    # must have a peg and the cell to the right of that must be empty
-    if direction == "r" and (column_num < len
-                             (game_board.board_arr[row_num]) - 2):
-        if (game_board.board_arr[row_num, column_num + 1] == 1)\
-          and (game_board.board_arr[row_num, column_num + 2] == 0):
-            validated_dict = {
-                "valid": True,
-                "from": (row_num, column_num),
-                "to": (row_num, column_num + 2),
-                "remove": (row_num, column_num + 1)
-            }
-
-    return validated_dict
-
-
-def eval_moves(game_board):
+    term_manager.show_msg(0, *PROMPT)
+    window = term_manager.bottom_win
+    column = len(PROMPT[-1]) + 1
+    window.move(3, column)
+    player_input = ""
+
+    # Read keys until enter is pressed, echoing them after the prompt.
+    # Keys that arrive together, such as a pasted list of moves, are all
+    # read before they are echoed, and line breaks within them are
+    # treated as spaces.
+    while True:
+        keys = [window.get_wch()]
+        window.nodelay(True)
+        try:
+            while True:
+                keys.append(window.get_wch())
+        except curses.error:
+            pass
+        window.nodelay(False)
+
+        for (i, key) in enumerate(keys):
+            if key in ENTER_KEYS:
+                if i == len(keys) - 1:
+                    return player_input
+                key = " "
+            if key in BACKSPACE_KEYS:
+                player_input = player_input[:-1]
+            elif (isinstance(key, str) and key.isprintable()
+                  and len(player_input) < MAX_INPUT):
+                player_input += key
+
+        visible = player_input[-INPUT_WIDTH:]
+        term_manager.bottom_win.addstr(3, column, visible.ljust(INPUT_WIDTH),
+                                       curses.color_pair(4))
+        window.move(3, column + len(visible))
+        window.refresh()
+
+
+def main(stdscr, tracer=None):
     """
-    Tests whether there are still valid moves left.
-    Returns True or False.
+    The main game loop. tracer is an optional Tracer timing each turn.
     """
-    board = game_board.board_arr
-
-    # Work through each cell on the board
-    for row, col_arr in enumerate(board):
-        for column, cell in enumerate(col_arr):
-
-            # If cell is empty or an unplayble space,
-            # move onto next cell
-            if cell == 0 or cell == 2:
-                continue
-
-            # If cell has a peg, test if there is a valid move in each
-            # direction in turn
-            if cell == 1:
-                if row > 1:
-                    if (board[row - 1, column] == 1) and (board[row - 2,
-                                                          column] == 0):
-                        return True
-
-                if row < (len(board) - 2):
-                    if (board[row + 1, column] == 1) and (board[row + 2,
-                                                          column] == 0):
-                        return True
-
-                if column > 2:
-                    if (board[row, column - 1] == 1) and (board[row,
-                                                          column - 2]) == 0:
-                        return True
+    term_manager = TermManager(stdscr)
 
-                if column < (len(col_arr) - 2):
-                    if (board[row, column + 1] == 1) and (board[row,
-                                                          column + 2] == 0):
-                        return True
+    # Map the endgame tablebase if one has been generated
+    tablebase = open_tablebase()
 
-    # If loop exited without finding any valid moves,
-    # there can be none left
-    return False
+    # Play on the layout named in SOLITERM_LAYOUT, or in the layout file
+    # at that path, if it is set
+    layout = find_layout(os.environ.get("SOLITERM_LAYOUT"))
 
+    # Setting SOLITERM_PUZZLES to a puzzle pack generated for the layout
+    # starts each game from one of its puzzles
+    puzzles = open_puzzle_pack()
+    if puzzles is not None and not puzzles.covers(layout):
+        puzzles = None
 
-def check_win(game_board):
-    """
-    Checks if the player has won and
-    returns True or False
-    """
-    # If there is only one peg left and middle cell has a peg
-    # player must have won.
-    if game_board.num_pegs == 1 and game_board.board_arr[7, 7] == 1:
-        return True
+    # Record every game if SOLITERM_LOG is set to a log file path. Game
+    # records are replayed from the layout's starting position, so
+    # puzzle games are not recorded.
+    game_log = open_game_log() if puzzles is None else None
 
-    return False
+    # Setting SOLITERM_SEARCH searches each position in the background
+    # while waiting for the player's move
+    search = BackgroundSearch() if "SOLITERM_SEARCH" in os.environ else None
 
-
-def main(stdscr):
-    """
-    The main game loop.
-    """
-    term_manager = TermManager(stdscr)
+    # Setting SOLITERM_SESSION to a session token saves the game after
+    # every move, so it can be carried on if the player is disconnected
+    session_store = open_session_store()
 
     #  Outer loop which encompasses the starting screen and game
     while True:
@@ -485,9 +328,33 @@ def main(stdscr):
         # Show title page
         show_title(term_manager)
 
-        # Instantiate game_board instance and draw board
-        game_board = GameBoard()
-        draw_board(game_board, term_manager)
+        # Carry on the game saved for this session if there is one,
+        # otherwise instantiate game_board instance, and draw board.
+        # Setting SOLITERM_DEBUG checks the game board after every move.
+        debug = "SOLITERM_DEBUG" in os.environ
+        restored = None
+        if session_store is not None:
+            restored = session_store.load(layout, debug)
+        if restored is None:
+            if puzzles is not None:
+                game_board = puzzles.new_game(layout, debug)
+            else:
+                game_board = GameBoard(debug=debug, layout=layout)
+            history = History(game_board)
+            game_started = time.time()
+        else:
+            (game_board, history, game_started) = restored
+        draw_board(game_board, term_manager, tablebase)
+
+        # Flag to record if the position could still be won when it was
+        # last checked, so the player is warned once when that changes.
+        # Some boards, such as the Soliterm cross, can never be won from
+        # their starting position, so the player is told that instead.
+        winnable = not is_dead(game_board)
+        if restored is not None:
+            term_manager.show_msg(4, RESUME_MSG)
+        elif not winnable:
+            term_manager.show_msg(4, DEAD_START_MSG)
 
         # Flag to record if player has any moves left
         moves_left = True
@@ -501,56 +368,161 @@ def main(stdscr):
             # Loop until player enters a valid move
             while not valid_move:
 
+                # Start timing the turn, writing out the last one
+                if tracer is not None:
+                    tracer.start_turn(term_manager)
+
+                # Search the position in the background while the player
+                # types, carrying on if the position has not changed
+                if search is not None:
+                    search.start(game_board)
+
                 # Get input from player and return to start of loop if not
                 # in valid format.
                 next_move = get_move(term_manager)
-                formatted_move = validate_format(next_move)
+                if tracer is not None:
+                    tracer.mark("input")
+
+                # Several moves are played in one go, and the board is
+                # redrawn once at the end
+                if len(next_move.split()) > 1:
+                    if search is not None:
+                        search.cancel()
+                    sequence_msg = play_moves(game_board, history,
+                                              next_move.split())
+                    if tracer is not None:
+                        tracer.mark("play_moves")
+                    draw_board(game_board, term_manager, tablebase)
+                    if tracer is not None:
+                        tracer.mark("draw_board")
+                    term_manager.show_msg(4, sequence_msg)
+                    valid_move = True
+                    continue
+
+                formatted_move = validate_format(next_move.strip())
+                if tracer is not None:
+                    tracer.mark("validate_format")
                 if formatted_move[0] is False:
-                    term_manager.show_msg(4, "Invalid format - try again")
+                    term_manager.show_msg(4, INVALID_FORMAT_MSG)
                     continue
 
                 # Check for special cases and exit or display instructions
                 if formatted_move[1] == -1:
-                    sys_exit("Soliterm exited - please play again soon!")
+                    if session_store is not None:
+                        session_store.delete()
+                    if game_log is not None:
+                        game_log.write(history.moves_played(), UNFINISHED,
+                                       game_started, layout.layout_id)
+                    if tracer is not None:
+                        tracer.end_turn(term_manager)
+                    sys_exit(QUIT_MSG)
                 elif formatted_move[1] == -2:
                     show_title(term_manager)
-                    draw_board(game_board, term_manager)
+                    if tracer is not None:
+                        tracer.mark("input")
+                    draw_board(game_board, term_manager, tablebase)
+                    continue
+                elif formatted_move[1] == -3:
+                    term_manager.show_msg(4, hint_msg(game_board,
+                                                      search=search))
+                    continue
+                elif formatted_move[1] < -3:
+                    term_manager.show_msg(
+                        4, history_msg(history, game_board, formatted_move))
+                    draw_board(game_board, term_manager, tablebase)
+                    winnable = not is_dead(game_board)
+                    if session_store is not None:
+                        session_store.save(game_board, history, game_started)
                     continue
 
                 # Check if move is valid and return to start of loop if not
                 validated_move = validate_move(formatted_move, game_board)
+                if tracer is not None:
+                    tracer.mark("validate_move")
                 if validated_move["valid"] is False:
-                    term_manager.show_msg(4, "Invalid move - try again")
+                    term_manager.show_msg(4, INVALID_MOVE_MSG)
                     continue
 
+                # Stop the background search while the board changes
+                if search is not None:
+                    search.cancel()
+
                 # Update game board with valid move, update stats and
                 # redraw board
                 game_board.update_board(validated_move)
                 game_board.update_stats()
-                draw_board(game_board, term_manager)
+                history.record(formatted_move, game_board)
+                if tracer is not None:
+                    tracer.mark("update")
+                draw_board(game_board, term_manager, tablebase)
+                if tracer is not None:
+                    tracer.mark("draw_board")
 
-                term_manager.show_msg(4, "Great move! Next turn")
+                term_manager.show_msg(4, GOOD_MOVE_MSG)
 
                 # Player has made a valid move so update flag to exit loop
                 valid_move = True
 
             # Check if there are still valid moves remaining
             moves_left = eval_moves(game_board)
+            if tracer is not None:
+                tracer.mark("eval_moves")
+
+            # Warn the player when a move leaves a position that can no
+            # longer be won, long before they run out of moves
+            if moves_left and winnable:
+                winnable = not is_dead(game_board)
+                if not winnable:
+                    term_manager.show_msg(4, DEAD_MSG)
+                if tracer is not None:
+                    tracer.mark("dead_check")
+
+            # Save the game so far, or delete it once it is over
+            if session_store is not None:
+                if moves_left:
+                    session_store.save(game_board, history, game_started)
+                else:
+                    session_store.delete()
 
         # Player is out of moves.  Check if they've won and
         # display appropriate message.
         if check_win(game_board):
-            endgame_msg = "Wow, you've won! Well done!!!"
+            endgame_msg = WIN_MSG
+            result = WON
         else:
-            endgame_msg = "There are no moves left - game over"
-
-        term_manager.show_msg(0, endgame_msg, "Press a key to continue", "",
-                              "", "")
+            endgame_msg = LOSE_MSG
+            result = LOST
+        if game_log is not None:
+            game_log.write(history.moves_played(), result, game_started,
+                           layout.layout_id)
+        if tracer is not None:
+            tracer.end_turn(term_manager)
+
+        term_manager.show_msg(0, endgame_msg, CONTINUE_MSG, "", "", "")
         term_manager.bottom_win.getkey()
 
 
-# Initialises curses display and calls main function
-# when complete, passing it a reference to
-# the terminal display.
-# Usage as per https://docs.python.org/3/howto/curses.html
-wrapper(main)
+def play():
+    """
+    Plays the game in the terminal.
+    """
+    # Setting SOLITERM_TRACE to a file path times each phase of every
+    # turn. The tracer is opened before curses starts and closed after
+    # curses has put the terminal back, as it sits between curses and
+    # the terminal to count the bytes sent.
+    tracer = open_tracer()
+    try:
+        # Initialises curses display and calls main function
+        # when complete, passing it a reference to
+        # the terminal display.
+        # Usage as per https://docs.python.org/3/howto/curses.html
+        wrapper(main, tracer)
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+
+# Only run the game when run.py is run directly, so that other
+# scripts can import GameBoard without taking over the terminal.
+if __name__ == "__main__":
+    play()
@@ -0,0 +1,220 @@
+"""
+Background search for Soliterm.
+
+The game spends most of its time waiting for the player to type their
+next move. BackgroundSearch uses that time in a worker thread, which
+searches the position on the board as soon as it has been drawn. It
+alternates short rounds of playouts, which keep a best known move up to
+date, with slices of the solver, which try to prove whether the
+position can still be won. The solver keeps its table of positions
+proved unwinnable from one slice, and one turn, to the next, so each
+slice carries on from where the last one stopped rather than starting
+again.
+
+When the position changes the search is cancelled and started again on
+the new position, and asking for a hint returns whatever has been found
+so far without waiting.
+"""
+
+import threading
+import time
+from engine import GameBoard, jump_to_text
+from playout import analyse, difficulty
+from solver import Solver
+
+# Time spent on each round of playouts, in seconds. A new position is
+# only noticed between rounds, so this also bounds how long a cancelled
+# round keeps running alongside the game.
+ROUND_BUDGET = 0.02
+
+# Number of positions searched by each solver slice, taking about the
+# same time as a round of playouts
+SOLVER_SLICE = 1000
+
+# Longest time spent searching one position, in seconds, so a player who
+# has left the game does not keep the CPU busy
+MAX_SEARCH_TIME = 30.0
+
+
+class BackgroundSearch:
+    """
+    Worker thread that searches the current position while the game
+    waits for input. start() gives it a new position, cancel() stops
+    it, and result() returns the best found so far.
+    """
+    def __init__(self, round_budget=ROUND_BUDGET, max_time=MAX_SEARCH_TIME):
+        """
+        Initialise an instance of BackgroundSearch and start its worker
+        thread, which waits until it is given a position.
+        """
+        self.round_budget = round_budget
+        self.max_time = max_time
+        self.solver = Solver()
+        self.condition = threading.Condition()
+
+        # Each position searched gets a new generation number, so results
+        # for an old position are never returned for a new one
+        self.generation = 0
+        self.position = None
+        self.pending = None
+        self.latest = None
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def start(self, game_board):
+        """
+        Starts searching the position on a GameBoard, cancelling any
+        search of a different position. Searching the same position
+        again carries on where it was.
+        """
+        position = (game_board.layout, game_board.pegs,
+                    game_board.num_turns)
+        with self.condition:
+            if position == self.position:
+                return
+            self.generation += 1
+            self.position = position
+            self.pending = (self.generation, position)
+            self.latest = None
+            self.condition.notify()
+        self.solver.cancel()
+
+    def cancel(self):
+        """
+        Stops searching, for example while a move is being made.
+        """
+        with self.condition:
+            self.generation += 1
+            self.position = None
+            self.pending = None
+            self.latest = None
+        self.solver.cancel()
+
+    def close(self):
+        """
+        Stops the search and waits for the worker thread to finish.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.cancel()
+        self.thread.join()
+
+    def result(self):
+        """
+        Returns the best found so far for the position being searched,
+        or None if nothing has been found yet. The dictionary has the
+        same contents as playout.analyse() returns, and also:
+        winnable - True or False once the solver has proved whether the
+                   position can be won, otherwise None
+        """
+        with self.condition:
+            return self.latest
+
+    def _run(self):
+        """
+        Worker thread loop, searching each new position given to it.
+        """
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                (generation, position) = self.pending
+                self.pending = None
+            self._search(generation, *position)
+
+    def _current(self, generation):
+        """
+        Returns True if a generation is still the one being searched.
+        """
+        return self.generation == generation and not self.closed
+
+    def _search(self, generation, layout, pegs, num_turns):
+        """
+        Searches one position until it is cancelled, solved or the
+        time limit is reached, publishing the results after each round.
+        """
+        started = time.perf_counter()
+        game_board = GameBoard(layout=layout)
+        game_board.set_position(pegs, num_turns)
+
+        # Running totals of wins, pegs left and playouts for each move
+        totals = {}
+        winnable = None
+        solution = []
+        self.solver.node_limit = SOLVER_SLICE
+
+        while self._current(generation):
+            analysis = analyse(game_board, self.round_budget)
+            for move in analysis["moves"]:
+                total = totals.setdefault(move["text"], [0.0, 0.0, 0])
+                total[0] += move["win_rate"] * move["playouts"]
+                total[1] += move["mean_pegs"] * move["playouts"]
+                total[2] += move["playouts"]
+            self._publish(generation, analysis, totals, winnable, solution)
+
+            # Give the solver a slice until it decides whether the
+            # position can be won
+            if winnable is None:
+                solved = self.solver.solve(game_board)
+                (winnable, solution) = (solved["winnable"], solved["moves"])
+                if winnable is not None:
+                    self._publish(generation, analysis, totals, winnable,
+                                  solution)
+
+            # A proved win gives the best move, so there is nothing more
+            # to search for
+            if (winnable or not analysis["moves"]
+                    or time.perf_counter() - started > self.max_time):
+                break
+
+    def _publish(self, generation, analysis, totals, winnable, solution):
+        """
+        Makes the results so far available to result(), as long as the
+        position has not changed in the meantime.
+        """
+        moves = [
+            {
+                "text": text,
+                "win_rate": wins / playouts,
+                "mean_pegs": pegs_left / playouts,
+                "playouts": playouts
+            }
+            for (text, (wins, pegs_left, playouts)) in totals.items()
+        ]
+        moves.sort(key=lambda move: (-move["win_rate"], move["mean_pegs"]))
+
+        playouts = sum(move["playouts"] for move in moves)
+        if playouts:
+            win_rate = sum(move["win_rate"] * move["playouts"]
+                           for move in moves) / playouts
+            mean_pegs = sum(move["mean_pegs"] * move["playouts"]
+                            for move in moves) / playouts
+        else:
+            win_rate = analysis["win_rate"]
+            mean_pegs = analysis["mean_pegs"]
+
+        # A move from a proved win is better than any playout statistics
+        if winnable and solution:
+            suggested = jump_to_text(solution[0])
+        elif moves:
+            suggested = moves[0]["text"]
+        else:
+            suggested = None
+
+        result = {
+            "moves": moves,
+            "suggested": suggested,
+            "win_rate": win_rate,
+            "mean_pegs": mean_pegs,
+            "difficulty": difficulty(win_rate),
+            "playouts": playouts,
+            "winnable": winnable
+        }
+        with self.condition:
+            if self._current(generation):
+                self.latest = result
@@ -0,0 +1,547 @@
+"""
+Asyncio game server for Soliterm.
+
+Hosts many games in a single process and event loop, instead of running
+a separate copy of run.py for every player. Each connection gets its own
+GameSession, which plays the same game as run.py and sends the same
+80 x 24 terminal screen as ANSI escape sequences, so a terminal - or the
+terminal in the web page - can be connected to it directly.
+
+Usage:
+python3 server.py --port 8765
+python3 server.py --unix /tmp/soliterm.sock
+"""
+
+import argparse
+import asyncio
+import codecs
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from engine import (GameBoard, validate_format, validate_move, eval_moves,
+                    check_win, cell_to_text)
+from bitboard import CENTRE_BIT
+from messages import (LOGO, TAGLINE, INSTRUCTIONS, PROMPT, MAX_INPUT,
+                      INPUT_WIDTH, TITLE_MSG, INVALID_FORMAT_MSG,
+                      INVALID_MOVE_MSG, GOOD_MOVE_MSG, DEAD_MSG,
+                      DEAD_START_MSG, WIN_MSG, LOSE_MSG, CONTINUE_MSG,
+                      QUIT_MSG, CELL_STYLES, STATS_WIDTH, hint_msg,
+                      history_msg, play_moves)
+from tablebase import open_tablebase
+from layouts import DEFAULT_LAYOUT, get_layout, find_layout
+from gamelog import open_game_log, UNFINISHED, WON, LOST
+from history import History
+from puzzles import open_puzzle_pack
+from pagoda import is_dead
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# ANSI colour codes matching the curses color pairs set up by TermManager
+COLOR_CODES = {
+    0: "0",
+    1: "0;37;41",
+    2: "0;37;46",
+    3: "0;37;42",
+    4: "0;37;40",
+    5: "0;36;40",
+    6: "0;31;40"
+}
+
+# First screen row of the bottom window, and number of rows in the
+# top window, as set up by TermManager
+BOTTOM_ROW = 19
+TOP_ROWS = 19
+
+# Time allowed for working out a hint, in seconds. Kept short as hints
+# share the process's CPU with every other session.
+HINT_BUDGET = 0.05
+
+# Number of hints worked out at once. Hints run in threads so the event
+# loop carries on serving other sessions, and the playouts spend most of
+# their time in NumPy, which lets other threads run.
+HINT_WORKERS = 2
+
+# Session states
+TITLE = "title"
+PLAYING = "playing"
+GAME_OVER = "game over"
+
+# Keys sent by terminals for enter and backspace
+ENTER_KEYS = ("\r", "\n")
+BACKSPACE_KEYS = ("\x7f", "\x08")
+
+
+def at(row, column, string, pair):
+    """
+    Returns the escape sequences to draw a string at a screen position
+    using one of the color pairs.
+    """
+    return f"\x1b[{row + 1};{column + 1}H\x1b[{COLOR_CODES[pair]}m{string}"
+
+
+class GameSession:
+    """
+    State for one player connected to the server - the game board, what
+    is on their screen and the move they are typing. Input bytes are
+    passed to feed(), which returns the bytes to send back to the player.
+    If the player asks for a hint, hint_pending is set and the hint must
+    be worked out with make_hint() and passed to show_hint() before any
+    more input is fed.
+    """
+    def __init__(self, tablebase=None, game_log=None, layout=None,
+                 puzzles=None):
+        """
+        Initialise an instance of GameSession. tablebase is an optional
+        endgame tablebase, and game_log an optional GameLog to record
+        games in. Both can be shared between sessions. layout is the
+        board Layout to play on, defaulting to the Soliterm cross.
+        puzzles is an optional PuzzlePack for the layout to start each
+        game from one of its puzzles, in which case games are not
+        recorded.
+        """
+        self.tablebase = tablebase
+        self.game_log = game_log if puzzles is None else None
+        self.layout = layout or get_layout()
+        self.puzzles = puzzles
+        self.game_board = None
+        self.history = None
+        self.game_started = 0
+        self.state = TITLE
+        self.input = ""
+        self.shown_input = ""
+        self.drawn_board = None
+        self.closed = False
+        self.winnable = True
+        self.hint_pending = False
+        self.held_input = ""
+
+        # Input is decoded as it arrives, so characters split between
+        # reads are kept whole, and escape sequences sent by arrow and
+        # function keys are collected until they are complete
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.escape = ""
+
+    def start(self):
+        """
+        Returns the bytes to clear the player's screen and show the
+        title screen.
+        """
+        return ("\x1b[0m\x1b[2J" + self.title()).encode("utf-8")
+
+    def feed(self, data):
+        """
+        Handles bytes typed by the player and returns the bytes to
+        send back.
+        """
+        return self.type_text(self.decoder.decode(data)).encode("utf-8")
+
+    def type_text(self, text):
+        """
+        Handles text typed by the player and returns the output as a
+        string. If the player asks for a hint, the rest of the text is
+        held back until the hint is shown.
+        """
+        out = []
+        for (i, char) in enumerate(text):
+            if self.closed:
+                break
+            if self.hint_pending:
+                self.held_input = text[i:]
+                break
+
+            key = self.escape_key(char)
+            if key is None:
+                continue
+
+            # Line breaks within pasted text join the lines into one
+            # sequence of moves, as in run.py
+            if (self.state == PLAYING and key in ENTER_KEYS
+                    and i < len(text) - 1):
+                key = " "
+            out.append(self.key(key))
+
+        # Echo what was typed once all of the text has been read
+        if self.state == PLAYING and not (self.closed or self.hint_pending):
+            out.append(self.echo_input())
+
+        return "".join(out)
+
+    def escape_key(self, char):
+        """
+        Collects the characters of an escape sequence, such as those
+        sent by arrow and function keys, so that it is handled as one
+        key rather than leaving characters like '[A' in the input.
+        Returns the key to pass to key() - the character, or a whole
+        escape sequence - or None part way through an escape sequence.
+        """
+        if not self.escape:
+            if char != "\x1b":
+                return char
+            self.escape = char
+            return None
+
+        # ESC [ starts a control sequence, which runs up to a final
+        # character from @ to ~, and ESC O is followed by one character.
+        # Anything else after ESC is taken as a key pressed with alt.
+        self.escape += char
+        if ((len(self.escape) == 2 and char in "[O")
+                or (self.escape[1] == "[" and not "@" <= char <= "~")):
+            return None
+        key = self.escape
+        self.escape = ""
+        return key
+
+    def make_hint(self):
+        """
+        Works out the hint the player asked for, which takes up to
+        HINT_BUDGET seconds. Does not change the session, so a server
+        can run it in another thread.
+        Returns the hint message.
+        """
+        return hint_msg(self.game_board, HINT_BUDGET)
+
+    def show_hint(self, hint):
+        """
+        Returns the bytes to show a hint message from make_hint(),
+        followed by the output of any input held back while it was
+        worked out.
+        """
+        self.hint_pending = False
+        held = self.held_input
+        self.held_input = ""
+        out = self.show_msg(4, hint) + self.prompt() + self.type_text(held)
+        return out.encode("utf-8")
+
+    def key(self, key):
+        """
+        Handles a single key, or an escape sequence, and returns the
+        output as a string.
+        """
+        # Any key leaves the title screen. A new game is started unless
+        # the player was just looking at the instructions. Some boards
+        # cannot be won from their starting position, so the player is
+        # told that at the start rather than warned later.
+        if self.state == TITLE:
+            msg = ""
+            if self.game_board is None:
+                if self.puzzles is not None:
+                    self.game_board = self.puzzles.new_game(self.layout)
+                else:
+                    self.game_board = GameBoard(layout=self.layout)
+                self.history = History(self.game_board)
+                self.game_started = time.time()
+                self.winnable = not is_dead(self.game_board)
+                if not self.winnable:
+                    msg = self.show_msg(4, DEAD_START_MSG)
+            self.state = PLAYING
+            return self.draw_board() + msg + self.prompt()
+
+        # Any key after the end of a game goes back to the title screen
+        if self.state == GAME_OVER:
+            self.game_board = None
+            return self.title()
+
+        # Otherwise the player is typing in their move
+        if key in ENTER_KEYS:
+            line = self.input
+            self.input = ""
+            return self.enter(line)
+
+        if key in BACKSPACE_KEYS:
+            self.input = self.input[:-1]
+            return ""
+
+        # Escape sequences are not printable, so are left out
+        if key.isprintable() and len(self.input) < MAX_INPUT:
+            self.input += key
+        return ""
+
+    def echo_input(self):
+        """
+        Returns the output to show the end of the player's input after
+        the prompt, as in get_move() in run.py. Only the characters that
+        differ from what is already shown are sent.
+        """
+        visible = self.input[-INPUT_WIDTH:]
+        if visible == self.shown_input:
+            return ""
+
+        same = len(os.path.commonprefix([visible, self.shown_input]))
+        column = len(PROMPT[-1]) + 1
+        out = at(BOTTOM_ROW + 3, column + same,
+                 visible[same:].ljust(len(self.shown_input) - same), 4)
+        if len(visible) < len(self.shown_input):
+            out += at(BOTTOM_ROW + 3, column + len(visible), "", 4)
+        self.shown_input = visible
+        return out
+
+    def enter(self, line):
+        """
+        Handles a move entered by the player, following the same steps
+        as the main loop in run.py, and returns the output as a string.
+        """
+        # Several moves are played in one go, and the board is redrawn
+        # once at the end
+        moves = line.split()
+        if len(moves) > 1:
+            return self.after_moves(
+                play_moves(self.game_board, self.history, moves))
+
+        formatted_move = validate_format(line.strip())
+        if formatted_move[0] is False:
+            return self.show_msg(4, INVALID_FORMAT_MSG) + self.prompt()
+
+        # Check for special cases and exit or display instructions
+        if formatted_move[1] == -1:
+            self.log_game(UNFINISHED)
+            self.closed = True
+            return "\x1b[0m\x1b[2J\x1b[H" + QUIT_MSG + "\r\n"
+        if formatted_move[1] == -2:
+            return self.title()
+        if formatted_move[1] == -3:
+            self.hint_pending = True
+            return ""
+        if formatted_move[1] < -3:
+            msg = history_msg(self.history, self.game_board, formatted_move)
+            self.winnable = not is_dead(self.game_board)
+            return self.draw_board() + self.show_msg(4, msg) + self.prompt()
+
+        validated_move = validate_move(formatted_move, self.game_board)
+        if validated_move["valid"] is False:
+            return self.show_msg(4, INVALID_MOVE_MSG) + self.prompt()
+
+        self.game_board.update_board(validated_move)
+        self.game_board.update_stats()
+        self.history.record(formatted_move, self.game_board)
+        return self.after_moves(GOOD_MOVE_MSG)
+
+    def after_moves(self, msg):
+        """
+        Returns the output to redraw the board after moves have been
+        played and show a message, followed by the prompt for the next
+        move or the end of game message. The player is warned instead,
+        as in run.py, when the moves leave a position that can no longer
+        be won.
+        """
+        moves_left = eval_moves(self.game_board)
+        if moves_left and self.winnable:
+            self.winnable = not is_dead(self.game_board)
+            if not self.winnable:
+                msg = DEAD_MSG
+
+        out = self.draw_board() + self.show_msg(4, msg)
+        if moves_left:
+            return out + self.prompt()
+
+        # Player is out of moves
+        self.state = GAME_OVER
+        if check_win(self.game_board):
+            endgame_msg = WIN_MSG
+            self.log_game(WON)
+        else:
+            endgame_msg = LOSE_MSG
+            self.log_game(LOST)
+        return out + self.show_msg(0, endgame_msg, CONTINUE_MSG, "", "", "")
+
+    def log_game(self, result):
+        """
+        Records the current game in the game log, if there is one.
+        Each game is only recorded once.
+        """
+        if self.game_log is not None and self.history is not None:
+            self.game_log.write(self.history.moves_played(), result,
+                                self.game_started, self.layout.layout_id)
+        self.history = None
+
+    def show_msg(self, row, *strs):
+        """
+        Returns the output to display strings on lines of the
+        bottom window, clearing each line first.
+        """
+        out = []
+        for (i, string) in enumerate(strs):
+            out.append(at(BOTTOM_ROW + row + i, 0, "\x1b[K", 0))
+            out.append(at(BOTTOM_ROW + row + i, 0, string, 4))
+        return "".join(out)
+
+    def prompt(self):
+        """
+        Returns the output to show the move prompt, leaving the cursor
+        where the player's input will appear.
+        """
+        self.shown_input = ""
+        return self.show_msg(0, *PROMPT) + at(BOTTOM_ROW + 3,
+                                              len(PROMPT[-1]) + 1, "", 4)
+
+    def title(self):
+        """
+        Returns the output to show the title screen and instructions.
+        """
+        self.state = TITLE
+        self.drawn_board = None
+        out = [at(row, 0, "\x1b[K", 0) for row in range(TOP_ROWS)]
+        for (i, line) in enumerate(LOGO):
+            out.append(at(i, 0, line, 5 if i < 3 else 6))
+        out.append(at(6, 0, TAGLINE, 5))
+        for (i, line) in enumerate(INSTRUCTIONS):
+            out.append(at(i + 8, 0, line, 4))
+        out.append(self.show_msg(0, TITLE_MSG, "", "", "", ""))
+        return "".join(out)
+
+    def draw_board(self):
+        """
+        Returns the output to draw the game board, in the same way as
+        draw_board() in run.py. Only the cells that have changed since
+        the board was last drawn are included.
+        """
+        board = self.game_board.board_arr
+        out = []
+
+        if self.drawn_board is None:
+            out.extend(at(row, 0, "\x1b[K", 0) for row in range(TOP_ROWS))
+            for num in range(15):
+                letter = chr(ord("A") + num)
+                out.append(at(0, num * 3 + 25, f" {letter} ", 4))
+                out.append(at(16, num * 3 + 25, f" {letter} ", 4))
+            for num in range(1, 16):
+                out.append(at(num, 21, f" {num} ", 4))
+                out.append(at(num, 70, f" {num} ", 4))
+            changed = [(row, column) for row in range(board.shape[0])
+                       for column in range(board.shape[1])]
+        else:
+            changed = [(int(row), int(column)) for (row, column)
+                       in zip(*(self.drawn_board != board).nonzero())]
+
+        for (row, column) in changed:
+            (string, pair) = CELL_STYLES[board[row, column]]
+            out.append(at(row + 1, column * 3 + 25, string, pair))
+
+        stats = [
+            f"Pegs left: {self.game_board.num_pegs}",
+            f"Turns taken: {self.game_board.num_turns}",
+            ""
+        ]
+        if (self.tablebase is not None
+                and self.tablebase.covers(self.game_board.layout)):
+            winnable = self.tablebase.is_winnable(self.game_board.pegs)
+            if winnable is not None:
+                stats[2] = f"Can still win: {'yes' if winnable else 'no'}"
+        if self.layout.finish_bit != CENTRE_BIT:
+            stats.append(f"Finish in: {cell_to_text(self.layout.finish)}")
+        for (row, string) in enumerate(stats):
+            out.append(at(row, 0, string.ljust(STATS_WIDTH), 4))
+
+        self.drawn_board = board.copy()
+        return "".join(out)
+
+
+class GameServer:
+    """
+    Accepts connections and runs a GameSession for each one, all in
+    one asyncio event loop.
+    """
+    def __init__(self, tablebase=None, game_log=None, layout=None,
+                 puzzles=None):
+        """
+        Initialise an instance of GameServer. tablebase is an optional
+        endgame tablebase and game_log an optional GameLog, both shared
+        by all sessions. layout is the board Layout to play on, and
+        puzzles an optional PuzzlePack to start games from.
+        """
+        self.tablebase = tablebase
+        self.game_log = game_log
+        self.layout = layout
+        self.puzzles = puzzles
+        self.sessions = 0
+        self.hint_pool = ThreadPoolExecutor(max_workers=HINT_WORKERS)
+
+    async def handle(self, reader, writer):
+        """
+        Plays a game with one connected player until they quit
+        or disconnect.
+        """
+        session = GameSession(self.tablebase, self.game_log, self.layout,
+                              self.puzzles)
+        self.sessions += 1
+        print(f"Session opened, {self.sessions} active")
+
+        loop = asyncio.get_running_loop()
+        try:
+            writer.write(session.start())
+            await writer.drain()
+            while not session.closed:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                writer.write(session.feed(data))
+
+                # Work out hints away from the event loop. No more input
+                # is read from this player until the hint is shown.
+                while session.hint_pending:
+                    await writer.drain()
+                    hint = await loop.run_in_executor(self.hint_pool,
+                                                      session.make_hint)
+                    writer.write(session.show_hint(hint))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Record a game left part way through by a disconnect
+            session.log_game(UNFINISHED)
+            self.sessions -= 1
+            print(f"Session closed, {self.sessions} active")
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                    unix_path=None):
+        """
+        Listens on a TCP port, or a Unix socket if unix_path is given,
+        and serves players until cancelled.
+        """
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """
+    Command line entry point to run the server.
+    """
+    parser = argparse.ArgumentParser(description="Run a Soliterm server")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="TCP port to listen on")
+    parser.add_argument("--unix", help="listen on a Unix socket instead")
+    parser.add_argument("--log",
+                        help="record games in this log file, instead of "
+                        "the one in SOLITERM_LOG")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                        help="name of the board layout, or a layout file")
+    parser.add_argument("--puzzles",
+                        help="start each game from a puzzle in this pack "
+                        "file, instead of the one in SOLITERM_PUZZLES")
+    args = parser.parse_args()
+
+    layout = find_layout(args.layout)
+    puzzles = open_puzzle_pack(args.puzzles)
+    if puzzles is not None and not puzzles.covers(layout):
+        parser.error("The puzzle pack was not generated for this layout")
+
+    # Puzzle games are not recorded, as in run.py
+    game_log = open_game_log(args.log) if puzzles is None else None
+    game_server = GameServer(open_tablebase(), game_log, layout, puzzles)
+    print(f"Soliterm server listening on {args.unix or args.port}")
+    try:
+        asyncio.run(game_server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
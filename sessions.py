@@ -0,0 +1,289 @@
+"""
+Saved sessions for Soliterm.
+
+When a player's browser disconnects, the terminal running their game is
+killed. So that they can carry on when they reconnect, the web page
+gives each browser tab a session token, which is passed to run.py in the
+SOLITERM_SESSION environment variable, and the game saves a snapshot to
+a file named after the token after every move.
+
+A snapshot is a small binary file - a header holding the board layout,
+the turn, the number of moves in the undo history and the time the game
+started, followed by the pegs bitboard and then the move codes and board
+snapshots of the undo history, exactly as History holds them. Restoring
+one sets up the board straight from the pegs bitboard and the history
+straight from its arrays, without replaying the game. A damaged
+snapshot is still never restored into a history that undo or redo
+cannot follow, as every move code must be a jump on the board and each
+board snapshot must have one peg fewer for each move before it. Only
+the few moves since the last board snapshot are replayed, to check that
+they lead to the board.
+
+The file names in a store are session tokens, so the store directory is
+kept private to the user running the game - by default it is under
+their own $XDG_STATE_HOME, and a directory anyone else could use is
+refused.
+
+A snapshot is deleted when its game ends. Snapshots that have not been
+written for SESSION_TTL seconds are deleted whenever a store is opened,
+as are the oldest if there are more than MAX_SESSIONS, so the store
+stays bounded however many players leave without finishing.
+"""
+
+import os
+import re
+import struct
+import time
+from array import array
+import bitboard
+from engine import GameBoard
+from history import History, SNAPSHOT_INTERVAL
+from gamelog import CUSTOM_LAYOUT, encode_move, replay_moves
+
+# Snapshot header - magic, layout number, turn, number of moves in the
+# history and time the game started. The move codes and history
+# snapshots that follow are in the machine's own byte order, as the
+# store is only read on the machine that wrote it.
+MAGIC = b"SOLS"
+HEADER = struct.Struct("<4sBHHd")
+
+# Snapshots not written for this many seconds are deleted
+SESSION_TTL = 24 * 60 * 60
+
+# Most snapshots kept in a store, deleting the oldest first
+MAX_SESSIONS = 10000
+
+# Session tokens are hex strings, so they are safe to use as file names
+TOKEN_PATTERN = re.compile(r"[0-9a-f]{16,64}")
+
+# Directory used for the store if SOLITERM_SESSION_DIR is not set, in
+# the user's own state directory so other users cannot read the tokens
+DEFAULT_DIR = os.path.join(
+    os.environ.get("XDG_STATE_HOME")
+    or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "soliterm", "sessions")
+
+# File name endings of snapshots, and of snapshots being written
+SUFFIX = ".snap"
+TEMP_SUFFIX = ".tmp"
+
+# Cache of the set of move codes that are a jump on each board, by its
+# playable bitboard
+_MOVE_CODES = {}
+
+
+def pack_snapshot(game_board, history, started):
+    """
+    Returns the bytes of a snapshot of a game.
+    """
+    layout_id = game_board.layout.layout_id
+    header = HEADER.pack(MAGIC,
+                         CUSTOM_LAYOUT if layout_id is None else layout_id,
+                         history.turn, len(history.moves), started)
+    return b"".join((
+        header,
+        game_board.pegs.to_bytes(bitboard.BOARD_BYTES, "little"),
+        history.moves.tobytes(),
+        history.snapshots
+    ))
+
+
+def unpack_snapshot(data, layout, debug=False):
+    """
+    Restores a game from the bytes of a snapshot, on a board Layout.
+    Returns a tuple of (game_board, history, started), or None if the
+    snapshot is damaged or was saved on a different layout.
+    """
+    if len(data) < HEADER.size + bitboard.BOARD_BYTES:
+        return None
+    (magic, layout_id, turn, num_moves, started) = HEADER.unpack_from(data)
+    expected_id = (CUSTOM_LAYOUT if layout.layout_id is None
+                   else layout.layout_id)
+    if magic != MAGIC or layout_id != expected_id or turn > num_moves:
+        return None
+
+    # Check the snapshot holds exactly the arrays the header describes
+    moves_start = HEADER.size + bitboard.BOARD_BYTES
+    snapshots_start = moves_start + 2 * num_moves
+    num_snapshots = num_moves // SNAPSHOT_INTERVAL + 1
+    if len(data) != snapshots_start + num_snapshots * bitboard.BOARD_BYTES:
+        return None
+
+    pegs = int.from_bytes(data[HEADER.size:moves_start], "little")
+    if pegs & ~layout.playable:
+        return None
+    moves = array("H", data[moves_start:snapshots_start])
+    snapshots = data[snapshots_start:]
+    if not moves_consistent(moves, snapshots, pegs, turn, layout):
+        return None
+
+    game_board = GameBoard(debug, layout)
+    history = History(game_board)
+    game_board.set_position(pegs, turn)
+    history.moves = moves
+    history.snapshots = bytearray(snapshots)
+    history.turn = turn
+
+    return (game_board, history, started)
+
+
+def move_codes(layout):
+    """
+    Returns the set of move codes that are a jump on a board Layout,
+    building it the first time each board is seen.
+    """
+    if layout.playable not in _MOVE_CODES:
+        _MOVE_CODES[layout.playable] = frozenset(
+            encode_move((True, *move)) for move in layout.jump_at)
+    return _MOVE_CODES[layout.playable]
+
+
+def moves_consistent(moves, snapshots, pegs, turn, layout):
+    """
+    Checks the undo history of a snapshot on a board Layout without
+    replaying the game. Returns True if every move code is a jump on the
+    board, every board snapshot is on the board and has one peg fewer
+    for each move before it, and the moves since the last board snapshot
+    before the turn lead from it to the pegs bitboard.
+    """
+    if not move_codes(layout).issuperset(moves):
+        return False
+
+    boards = [
+        int.from_bytes(snapshots[start:start + bitboard.BOARD_BYTES],
+                       "little")
+        for start in range(0, len(snapshots), bitboard.BOARD_BYTES)
+    ]
+    start_pegs = bitboard.popcount(boards[0])
+    for (index, board) in enumerate(boards):
+        if (board & ~layout.playable or bitboard.popcount(board)
+                != start_pegs - index * SNAPSHOT_INTERVAL):
+            return False
+
+    start = turn - turn % SNAPSHOT_INTERVAL
+    replay = replay_moves(moves[start:turn], layout,
+                          boards[turn // SNAPSHOT_INTERVAL])
+    return replay["valid"] and replay["pegs"] == pegs
+
+
+def check_private(directory):
+    """
+    Raises PermissionError unless a store directory belongs to the user
+    running the game and no other user can read or write it.
+    """
+    status = os.stat(directory)
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not private to this user")
+
+
+def expire_sessions(directory, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+    """
+    Deletes snapshots in a store that have not been written for ttl
+    seconds, and then the oldest snapshots if more than max_sessions
+    are left. Returns the number of files deleted.
+    """
+    cutoff = time.time() - ttl
+    kept = []
+    deleted = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith((SUFFIX, TEMP_SUFFIX)):
+                continue
+            try:
+                modified = entry.stat().st_mtime
+                if modified < cutoff:
+                    os.unlink(entry.path)
+                    deleted += 1
+                elif entry.name.endswith(SUFFIX):
+                    kept.append((modified, entry.path))
+            except FileNotFoundError:
+                # Deleted by another game at the same time
+                continue
+
+    kept.sort()
+    for (_, path) in kept[:max(len(kept) - max_sessions, 0)]:
+        try:
+            os.unlink(path)
+            deleted += 1
+        except FileNotFoundError:
+            continue
+
+    return deleted
+
+
+class SessionStore:
+    """
+    Saved snapshot of the game for one session token.
+    """
+    def __init__(self, directory, token):
+        """
+        Initialise an instance of SessionStore, creating the store
+        directory if needed and expiring old snapshots in it.
+        Raises ValueError if the token is not a valid session token, or
+        PermissionError if the directory is not private to this user.
+        """
+        if not TOKEN_PATTERN.fullmatch(token):
+            raise ValueError("Invalid session token")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        check_private(directory)
+        expire_sessions(directory)
+        self.path = os.path.join(directory, token + SUFFIX)
+        self.temp_path = f"{self.path}.{os.getpid()}{TEMP_SUFFIX}"
+
+    def save(self, game_board, history, started):
+        """
+        Saves a snapshot of a game, replacing the last one. The snapshot
+        is written to a temporary file and renamed into place, so a game
+        killed part way through leaves the last snapshot whole.
+        """
+        snapshot_fd = os.open(self.temp_path,
+                              os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(snapshot_fd, pack_snapshot(game_board, history, started))
+        finally:
+            os.close(snapshot_fd)
+        os.replace(self.temp_path, self.path)
+
+    def load(self, layout, debug=False):
+        """
+        Restores the saved game, if there is one, on a board Layout.
+        Returns a tuple of (game_board, history, started), or None if
+        there is no saved game or it cannot be used.
+        """
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                data = snapshot_file.read()
+        except FileNotFoundError:
+            return None
+
+        return unpack_snapshot(data, layout, debug)
+
+    def delete(self):
+        """
+        Deletes the saved game, once it has ended.
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def open_session_store(token=None, directory=None):
+    """
+    Opens the store for a session token, or the token in the
+    SOLITERM_SESSION environment variable if token is not given, in
+    directory or the SOLITERM_SESSION_DIR environment variable.
+    Returns a SessionStore, or None if there is no valid token or the
+    store cannot be opened.
+    """
+    if token is None:
+        token = os.environ.get("SOLITERM_SESSION")
+    if not token:
+        return None
+    if directory is None:
+        directory = os.environ.get("SOLITERM_SESSION_DIR", DEFAULT_DIR)
+
+    try:
+        return SessionStore(directory, token)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,349 @@
+"""
+Solver for Soliterm positions.
+
+Searches for a sequence of jumps that leaves a single peg in the finish
+hole of the board layout - the same win condition as check_win() in
+engine.py - or proves that no such sequence exists.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+import os
+import bitboard
+from pagoda import dead_check
+
+# Default number of positions held in the transposition table.
+# Each entry costs roughly 100 bytes, so this keeps the table to about
+# 100MB. Solving the English board from the start only needs about
+# 70,000, so boards of that size are never evicted from.
+DEFAULT_MAX_POSITIONS = 1000000
+
+# When solving in parallel, opening moves are expanded until there are at
+# least this many subproblems for each worker, so that workers which finish
+# early can pick up more work and keep all cores busy.
+TASKS_PER_WORKER = 8
+
+# Maximum number of opening moves expanded before handing out subproblems
+MAX_PREFIX_PLIES = 6
+
+# Number of positions searched between checks of a stop event.
+# Checking a multiprocessing Event is relatively slow, so it is not
+# done for every position.
+STOP_CHECK_INTERVAL = 1024
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when the node limit is reached,
+    or when the search is cancelled from outside.
+    """
+
+
+class Solver:
+    """
+    Depth first search over bitboard positions with a transposition
+    table of positions already proved to be unwinnable.
+
+    Positions are stored in a canonical form under the eight rotations
+    and reflections of the board, so each family of equivalent positions
+    takes one entry. The table is held as two sets of up to half of
+    max_positions each. When the newer set is full the older one is
+    dropped, and positions found in the older set are copied back into
+    the newer one, so the positions still being used are kept without
+    the cost of tracking the order every position was used in.
+
+    Moves are tried in order of how little they lower the distance
+    pagoda total, so jumps towards the finish hole are tried first.
+    """
+    def __init__(self, max_positions=DEFAULT_MAX_POSITIONS, node_limit=None,
+                 stop_event=None):
+        """
+        Initialise an instance of Solver. max_positions bounds the size
+        of the transposition table, node_limit optionally bounds the
+        number of positions searched by each call to solve().
+        stop_event is an optional threading or multiprocessing Event,
+        checked every STOP_CHECK_INTERVAL positions, which stops the
+        search when set.
+        """
+        self.max_positions = max_positions
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        self.dead = set()
+        self.old_dead = set()
+        self.playable = None
+        self.target = 1 << bitboard.CENTRE_BIT
+        self.check = None
+        self.nodes = 0
+        self.cancelled = False
+
+    def solve(self, game_board):
+        """
+        Searches for a win from the position held in a GameBoard.
+        Returns a dictionary as described in solve_position().
+        """
+        return self.solve_position(game_board.pegs, game_board.playable,
+                                   game_board.layout.finish_bit)
+
+    def solve_position(self, pegs, playable, finish_bit=bitboard.CENTRE_BIT):
+        """
+        Searches for a win from a position given as bitboards, where a
+        win is a single peg on finish_bit.
+        Returns a dictionary containing:
+        winnable = True if a win was found, False if it was proved that
+                   there is none, None if the search was stopped early
+        moves = list of (from, over, to) tuples of (row, column) tuples
+                leading to the win, empty if no win was found
+        nodes = number of positions searched
+        """
+        self.nodes = 0
+        self.cancelled = False
+        path = []
+
+        # Positions in a different class from a win can never reach one,
+        # and positions whose pagoda totals fall below those of a win are
+        # pruned during the search
+        check = dead_check(playable, finish_bit)
+        if check.dead(pegs):
+            return {"winnable": False, "moves": [], "nodes": 0}
+        self.check = check
+
+        # Positions proved unwinnable on another board, or for another
+        # finish hole, may be winnable on this one
+        if (playable, 1 << finish_bit) != (self.playable, self.target):
+            self.dead.clear()
+            self.old_dead.clear()
+            self.playable = playable
+            self.target = 1 << finish_bit
+
+        # The canonical form is only valid if the board itself, and the
+        # finish hole, look the same under every symmetry
+        symmetric = (bitboard.is_symmetric(playable)
+                     and finish_bit == bitboard.CENTRE_BIT)
+
+        try:
+            winnable = self._search(pegs, playable, symmetric, path,
+                                    check.distance(pegs))
+        except SearchAborted:
+            winnable = None
+            path = []
+
+        moves = [
+            tuple(bitboard.bit_cell(bit) for bit in move) for move in path
+        ]
+        return {"winnable": winnable, "moves": moves, "nodes": self.nodes}
+
+    def cancel(self):
+        """
+        Asks a running search to stop at the next position.
+        Safe to call from another thread.
+        """
+        self.cancelled = True
+
+    def _key(self, pegs, symmetric):
+        """
+        Returns the transposition table key for a position.
+        """
+        if symmetric:
+            return bitboard.canonical(pegs)
+        return pegs
+
+    def _search(self, pegs, playable, symmetric, path, distance):
+        """
+        Recursive depth first search. distance is the total of the
+        distance pagoda function for the position, kept up to date move
+        by move. Appends the winning moves to path and returns True if
+        the position can be won, otherwise returns False with path
+        unchanged.
+        """
+        if pegs == self.target:
+            return True
+
+        # No peg can reach the finish hole, or the pegs are too far away
+        if (not pegs & self.check.lattice
+                or distance < self.check.distance_target):
+            return False
+
+        self.nodes += 1
+        if self.cancelled or (self.node_limit is not None
+                              and self.nodes > self.node_limit):
+            raise SearchAborted()
+        if (self.stop_event is not None
+                and self.nodes % STOP_CHECK_INTERVAL == 0
+                and self.stop_event.is_set()):
+            raise SearchAborted()
+
+        # Skip positions already proved to be unwinnable, keeping those
+        # from the older set as they are still being used
+        key = self._key(pegs, symmetric)
+        if key in self.dead:
+            return False
+        if key in self.old_dead:
+            self.dead.add(key)
+            return False
+
+        jump_changes = self.check.jump_changes
+        for move in sorted(bitboard.jumps(pegs, playable),
+                           key=jump_changes.__getitem__, reverse=True):
+            path.append(move)
+            if self._search(bitboard.apply_jump(pegs, *move), playable,
+                            symmetric, path, distance + jump_changes[move]):
+                return True
+            path.pop()
+
+        # Every move has been tried without a win, so remember this
+        # position, dropping the older set if the newer one is full
+        self.dead.add(key)
+        if len(self.dead) > self.max_positions // 2:
+            self.old_dead = self.dead
+            self.dead = set()
+
+        return False
+
+
+def solve(game_board, max_positions=DEFAULT_MAX_POSITIONS, node_limit=None):
+    """
+    Convenience function to search a GameBoard position with a new
+    Solver. Returns a dictionary as described in Solver.solve_position().
+    """
+    return Solver(max_positions, node_limit).solve(game_board)
+
+
+def expand_prefixes(pegs, playable, min_tasks, max_plies=MAX_PREFIX_PLIES,
+                    finish_bit=bitboard.CENTRE_BIT):
+    """
+    Expands the opening moves from a position one ply at a time until
+    there are at least min_tasks positions to search, or max_plies have
+    been expanded. Positions that are equivalent under the board's
+    symmetries are only kept once.
+    Returns a tuple of (win, tasks). win is the list of moves for a win
+    found during the expansion, or None. tasks is a list of
+    (moves, pegs) tuples, one for each position still to be searched.
+    """
+    target = 1 << finish_bit
+    if pegs == target:
+        return ([], [])
+
+    symmetric = (bitboard.is_symmetric(playable)
+                 and finish_bit == bitboard.CENTRE_BIT)
+    tasks = [([], pegs)]
+
+    for _ in range(max_plies):
+        if len(tasks) >= min_tasks:
+            break
+
+        seen = set()
+        next_tasks = []
+        for (moves, position) in tasks:
+            for move in bitboard.jumps(position, playable):
+                child = bitboard.apply_jump(position, *move)
+                child_moves = moves + [move]
+                if child == target:
+                    return (child_moves, [])
+
+                key = bitboard.canonical(child) if symmetric else child
+                if key not in seen:
+                    seen.add(key)
+                    next_tasks.append((child_moves, child))
+
+        # Stop if no position has any moves left
+        if not next_tasks:
+            return (None, [])
+        tasks = next_tasks
+
+    return (None, tasks)
+
+
+# Solver used by each worker process, created by _init_worker()
+_WORKER_SOLVER = None
+
+
+def _init_worker(stop_event, max_positions, node_limit):
+    """
+    Creates the Solver for a worker process. The solver is kept between
+    subproblems so that its transposition table can be reused.
+    """
+    global _WORKER_SOLVER  # pylint: disable=global-statement
+    _WORKER_SOLVER = Solver(max_positions, node_limit, stop_event)
+
+
+def _solve_task(pegs, playable, finish_bit):
+    """
+    Searches one subproblem in a worker process and returns the
+    result dictionary from Solver.solve_position().
+    """
+    return _WORKER_SOLVER.solve_position(pegs, playable, finish_bit)
+
+
+def parallel_solve(game_board, workers=None,
+                   max_positions=DEFAULT_MAX_POSITIONS, node_limit=None,
+                   progress=None):
+    """
+    Searches for a win from a GameBoard position using a pool of worker
+    processes. The opening moves are expanded into independent
+    subproblems which are shared out between the workers. As soon as
+    one worker finds a win, the others are told to stop.
+
+    workers is the number of processes, defaulting to the number of CPUs.
+    max_positions and node_limit apply to each worker's Solver.
+    progress is an optional function called with (done, total, nodes)
+    each time a subproblem finishes.
+
+    Returns a dictionary as described in Solver.solve_position().
+    """
+    workers = workers or os.cpu_count() or 1
+    finish_bit = game_board.layout.finish_bit
+    (win, tasks) = expand_prefixes(game_board.pegs, game_board.playable,
+                                   workers * TASKS_PER_WORKER,
+                                   finish_bit=finish_bit)
+
+    def to_cells(moves):
+        return [tuple(bitboard.bit_cell(bit) for bit in move)
+                for move in moves]
+
+    # A win or a dead end may have been found while expanding
+    if win is not None:
+        return {"winnable": True, "moves": to_cells(win), "nodes": 0}
+    if not tasks:
+        return {"winnable": False, "moves": [], "nodes": 0}
+
+    stop_event = multiprocessing.Event()
+    result = {"winnable": False, "moves": [], "nodes": 0}
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(stop_event, max_positions,
+                                       node_limit)) as executor:
+        futures = {
+            executor.submit(_solve_task, pegs, game_board.playable,
+                            finish_bit): moves
+            for (moves, pegs) in tasks
+        }
+        pending = set(futures)
+
+        while pending:
+            (finished, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.cancelled():
+                    continue
+                task_result = future.result()
+                done += 1
+                result["nodes"] += task_result["nodes"]
+
+                if task_result["winnable"] and not result["winnable"]:
+                    # Record the win and stop everything else
+                    result["winnable"] = True
+                    result["moves"] = (to_cells(futures[future])
+                                       + task_result["moves"])
+                    stop_event.set()
+                    for other in pending:
+                        other.cancel()
+                elif (task_result["winnable"] is None
+                      and result["winnable"] is False):
+                    # A subproblem was stopped early, so it can no longer
+                    # be proved that there is no win
+                    result["winnable"] = None
+
+                if progress is not None:
+                    progress(done, len(tasks), result["nodes"])
+
+    return result
@@ -0,0 +1,220 @@
+"""
+Endgame tablebase for Soliterm.
+
+The generator works backwards from the winning position - a single peg in
+the centre hole - applying reverse jumps to find every position with up to
+a given number of pegs that can still be won. Positions are stored in
+canonical form under the board's symmetries as a sorted array of fixed
+size records, so the game can open the file with mmap and look positions
+up with a binary search, without reading or parsing the whole file.
+
+Usage to generate a tablebase:
+python3 tablebase.py --pegs 9 --output tablebase.bin
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import bitboard
+from layouts import DEFAULT_LAYOUT, find_layout
+
+# Default location of the tablebase file, next to this module
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "tablebase.bin")
+
+# Default maximum number of pegs in generated positions
+DEFAULT_MAX_PEGS = 9
+
+# File layout:
+# magic, record size, maximum pegs, number of records, playable mask,
+# padded to HEADER_SIZE bytes, followed by the sorted records.
+# Each record is a canonical pegs bitboard stored big endian, so that
+# comparing records as bytes gives the same order as comparing integers.
+MAGIC = b"SOLITB01"
+HEADER_FORMAT = "<8sIIQ"
+HEADER_SIZE = 64
+RECORD_SIZE = bitboard.BOARD_BYTES
+
+
+def _to_record(bits):
+    """
+    Converts a bitboard to a fixed size record.
+    """
+    return bits.to_bytes(RECORD_SIZE, "big")
+
+
+def generate(layout, max_pegs, path, progress=None):
+    """
+    Generates a tablebase of every winnable position with up to max_pegs
+    pegs on the given board Layout, and writes it to path.
+    progress is an optional function called with (pegs, positions) as
+    each layer is finished.
+    Returns the number of positions written.
+
+    Each layer of positions with one more peg is found from the layer
+    before using reverse jumps. Only two layers are held in memory at a
+    time - finished layers are written out sorted to temporary files and
+    merged into the final file at the end.
+    """
+    # Positions are stored in canonical form, which is only valid if the
+    # board and its finish hole look the same under every symmetry
+    playable = layout.playable
+    if not bitboard.is_symmetric(playable) or (
+            layout.finish_bit != bitboard.CENTRE_BIT):
+        raise ValueError("Tablebase requires a symmetric board layout "
+                         "that finishes in the centre")
+
+    layer = {1 << layout.finish_bit}
+    layer_files = []
+    count = 0
+
+    try:
+        for num_pegs in range(1, max_pegs + 1):
+            # Write this layer out in sorted order
+            layer_file = tempfile.TemporaryFile()
+            for bits in sorted(layer):
+                layer_file.write(_to_record(bits))
+            layer_file.seek(0)
+            layer_files.append(layer_file)
+            count += len(layer)
+
+            if progress is not None:
+                progress(num_pegs, len(layer))
+
+            if num_pegs == max_pegs:
+                break
+
+            # Find every position one reverse jump away.
+            # Because the board and goal are symmetric, expanding one
+            # canonical position stands in for all its symmetric images.
+            next_layer = set()
+            for bits in layer:
+                for move in bitboard.unjumps(bits, playable):
+                    next_layer.add(bitboard.canonical(
+                        bitboard.apply_jump(bits, *move)))
+            layer = next_layer
+
+        # Write the header, then merge the sorted layers into the file
+        with open(path, "wb") as out_file:
+            header = struct.pack(HEADER_FORMAT, MAGIC, RECORD_SIZE,
+                                 max_pegs, count) + _to_record(playable)
+            out_file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+            def records(layer_file):
+                while True:
+                    record = layer_file.read(RECORD_SIZE)
+                    if not record:
+                        return
+                    yield record
+
+            for record in heapq.merge(*[records(layer_file)
+                                        for layer_file in layer_files]):
+                out_file.write(record)
+    finally:
+        for layer_file in layer_files:
+            layer_file.close()
+
+    return count
+
+
+class Tablebase:
+    """
+    Read only view of a tablebase file, opened with mmap.
+    Looking up a position is a binary search over the records,
+    so takes O(log n) time and nothing is parsed when opening.
+    """
+    def __init__(self, path):
+        """
+        Initialise an instance of Tablebase by mapping the file at path.
+        Raises ValueError if the file is not a tablebase.
+        """
+        with open(path, "rb") as tb_file:
+            self.mmap = mmap.mmap(tb_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, record_size, self.max_pegs, self.count) = struct.unpack_from(
+            HEADER_FORMAT, self.mmap)
+        header_size = struct.calcsize(HEADER_FORMAT)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a Soliterm tablebase")
+        self.playable = int.from_bytes(
+            self.mmap[header_size:header_size + RECORD_SIZE], "big")
+
+    def covers(self, layout):
+        """
+        Returns True if the tablebase was generated for a board Layout.
+        """
+        return (self.playable == layout.playable
+                and layout.finish_bit == bitboard.CENTRE_BIT)
+
+    def is_winnable(self, pegs):
+        """
+        Looks up a position given as a pegs bitboard.
+        Returns True if it can still be won, False if it cannot, or None
+        if the position has more pegs than the tablebase covers.
+        """
+        if bitboard.popcount(pegs) > self.max_pegs:
+            return None
+
+        key = _to_record(bitboard.canonical(pegs))
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            start = HEADER_SIZE + mid * RECORD_SIZE
+            record = self.mmap[start:start + RECORD_SIZE]
+            if record == key:
+                return True
+            if record < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        return False
+
+    def close(self):
+        """
+        Unmaps the tablebase file.
+        """
+        self.mmap.close()
+
+
+def open_tablebase(path=DEFAULT_PATH):
+    """
+    Opens the tablebase at path.
+    Returns a Tablebase, or None if there is no usable file.
+    """
+    try:
+        return Tablebase(path)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    """
+    Command line entry point to generate a tablebase for one of the
+    board layouts.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate a Soliterm endgame tablebase")
+    parser.add_argument("--pegs", type=int, default=DEFAULT_MAX_PEGS,
+                        help="maximum number of pegs in stored positions")
+    parser.add_argument("--output", default=DEFAULT_PATH,
+                        help="file to write the tablebase to")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                        help="name of the board layout, or a layout file")
+    args = parser.parse_args()
+
+    def show_progress(num_pegs, positions):
+        print(f"{num_pegs} pegs: {positions} positions")
+
+    count = generate(find_layout(args.layout), args.pegs, args.output,
+                     show_progress)
+    print(f"Wrote {count} positions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Shared set up for the Soliterm tests.
+
+The game's modules live at the top level of the repository rather than
+in a package, so the repository is put on the import path here so that
+the tests can be run from any directory.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
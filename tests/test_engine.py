@@ -0,0 +1,107 @@
+"""
+Tests for the legal move generators in engine.py, checked against a
+naive search of every cell of the board array.
+"""
+
+import random
+import pytest
+import bitboard
+from engine import (DIRECTION_LETTERS, new_game, legal_moves, apply_jump,
+                    validate_move, validate_format, jump_to_text)
+from layouts import LAYOUTS, get_layout
+
+# Random games played on each layout
+NUM_GAMES = 10
+
+
+def naive_moves(board_arr):
+    """
+    Returns the set of legal (from, over, to) jumps on a board array,
+    found by trying every direction from every cell holding a peg.
+    """
+    (num_rows, num_columns) = board_arr.shape
+    moves = set()
+    for row in range(num_rows):
+        for column in range(num_columns):
+            if board_arr[row, column] != 1:
+                continue
+            for (row_step, col_step) in DIRECTION_LETTERS:
+                over = (row + row_step, column + col_step)
+                to = (row + 2 * row_step, column + 2 * col_step)
+                if not (0 <= to[0] < num_rows and 0 <= to[1] < num_columns):
+                    continue
+                if board_arr[over] == 1 and board_arr[to] == 0:
+                    moves.add(((row, column), over, to))
+
+    return moves
+
+
+def check_moves(game_board):
+    """
+    Checks legal_moves() and the incrementally kept set of legal moves
+    against the naive search.
+    """
+    expected = naive_moves(game_board.board_arr)
+    found = legal_moves(game_board)
+    assert len(found) == len(set(found))
+    assert set(found) == expected
+    assert game_board.moves == expected
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_start_position(name):
+    game_board = new_game(layout=get_layout(name))
+    assert game_board.moves
+    check_moves(game_board)
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_random_games(name):
+    layout = get_layout(name)
+    for seed in range(NUM_GAMES):
+        rand = random.Random(seed)
+        game_board = new_game(layout=layout)
+        played = []
+        check_moves(game_board)
+        while game_board.moves:
+            jump = rand.choice(sorted(game_board.moves))
+            apply_jump(game_board, jump)
+            played.append(jump)
+            check_moves(game_board)
+
+        # Taking the moves back must bring back the same legal moves
+        for (from_cell, over_cell, to_cell) in reversed(played):
+            game_board.undo_board({"valid": True, "from": from_cell,
+                                   "to": to_cell, "remove": over_cell})
+            check_moves(game_board)
+        assert game_board.pegs == layout.pegs
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_set_position(name):
+    layout = get_layout(name)
+    holes = list(bitboard.iter_bits(layout.playable))
+    rand = random.Random(name)
+    game_board = new_game(layout=layout)
+    for _ in range(50):
+        pegs = sum(1 << bit for bit in holes if rand.random() < 0.5)
+        game_board.set_position(pegs, 0)
+        check_moves(game_board)
+
+
+def test_validate_move_agrees():
+    game_board = new_game()
+    expected = naive_moves(game_board.board_arr)
+    for row in range(bitboard.BOARD_SIZE):
+        for column in range(bitboard.BOARD_SIZE):
+            for ((row_step, col_step), letter) in DIRECTION_LETTERS.items():
+                to = (row + 2 * row_step, column + 2 * col_step)
+                if not (0 <= to[0] < bitboard.BOARD_SIZE
+                        and 0 <= to[1] < bitboard.BOARD_SIZE):
+                    continue
+                jump = ((row, column),
+                        (row + row_step, column + col_step), to)
+                move = validate_format(jump_to_text(jump))
+                assert move[0] is not False
+                validated = validate_move(move, game_board)
+                assert validated["valid"] == (jump in expected)
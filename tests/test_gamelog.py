@@ -0,0 +1,144 @@
+"""
+Tests for the game records in gamelog.py - packing moves and records,
+reading logs back and replaying them.
+"""
+
+import random
+import pytest
+from engine import new_game, apply_jump, jump_to_text, validate_format
+from gamelog import (MAGIC, UNFINISHED, WON, LOST, CUSTOM_LAYOUT,
+                     RECORD_HEADER, encode_move, decode_move, move_text,
+                     pack_record, open_game_log, iter_records, replay_moves,
+                     replay_engine, final_result, verify_log)
+from layouts import LAYOUTS, get_layout
+
+
+def random_game(layout, rand, max_moves=None):
+    """
+    Plays a random game on a board Layout. Returns the move codes and
+    the final GameBoard.
+    """
+    game_board = new_game(layout=layout)
+    codes = []
+    while game_board.moves and (max_moves is None
+                                or len(codes) < max_moves):
+        jump = rand.choice(sorted(game_board.moves))
+        codes.append(encode_move(validate_format(jump_to_text(jump))))
+        apply_jump(game_board, jump)
+
+    return (codes, game_board)
+
+
+def test_move_codes_round_trip():
+    for code in range(1 << 10):
+        assert encode_move(decode_move(code)) == code
+
+    # Every jump on every layout is written as the player would type it
+    for name in LAYOUTS:
+        for (row_num, column_num, direction) in get_layout(name).jump_at:
+            move = (True, row_num, column_num, direction)
+            code = encode_move(move)
+            assert decode_move(code) == move
+            assert validate_format(move_text(code)) == move
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_replay_matches_engine(name):
+    layout = get_layout(name)
+    rand = random.Random(name)
+    for _ in range(20):
+        (codes, game_board) = random_game(layout, rand)
+        replayed = replay_moves(codes, layout)
+        assert replayed == replay_engine(codes, layout)
+        assert replayed["valid"]
+        assert replayed["pegs"] == game_board.pegs
+        assert replayed["num_turns"] == len(codes)
+
+        # A move that is not legal stops both replays at the same place
+        bad = codes[:-1] + [codes[-1], codes[-1]]
+        assert replay_moves(bad, layout) == replay_engine(bad, layout)
+        assert not replay_moves(bad, layout)["valid"]
+
+
+def test_replay_rejects_unknown_codes():
+    layout = get_layout()
+    for code in (0, (1 << 10) - 1, 1 << 10, 0xFFFF):
+        assert not replay_moves([code], layout)["valid"]
+
+
+def test_replay_from_position():
+    layout = get_layout("english")
+    (codes, _) = random_game(layout, random.Random(1))
+    middle = replay_moves(codes[:10], layout)["pegs"]
+    assert (replay_moves(codes[10:], layout, middle)["pegs"]
+            == replay_moves(codes, layout)["pegs"])
+
+
+def test_log_round_trip(tmp_path):
+    path = tmp_path / "games.log"
+    game_log = open_game_log(str(path))
+    rand = random.Random(2022)
+    written = []
+    for index in range(300):
+        layout = get_layout(list(LAYOUTS)[index % len(LAYOUTS)])
+        max_moves = rand.choice((None, 5))
+        (codes, game_board) = random_game(layout, rand, max_moves)
+        result = final_result(game_board.pegs, layout)
+        game_log.write(codes, result, 1000 + index, layout.layout_id)
+        written.append((1000 + index, result, layout.layout_id,
+                        tuple(codes)))
+    game_log.write([], UNFINISHED, 0, None)
+    written.append((0, UNFINISHED, CUSTOM_LAYOUT, ()))
+    game_log.close()
+    assert list(iter_records(str(path))) == written
+
+    totals = verify_log(str(path))
+    assert totals["records"] == len(written) - 1
+    assert totals["skipped"] == 1
+    assert totals["invalid"] == totals["mismatched"] == 0
+    assert totals["moves"] == sum(len(record[3]) for record in written)
+    assert totals["won"] + totals["lost"] + totals["unfinished"] == (
+        totals["records"])
+    assert verify_log(str(path), engine=True) == totals
+
+
+def test_records_across_chunks(tmp_path):
+    # The log is several times the smallest chunk, so records are read
+    # across chunk boundaries
+    path = tmp_path / "games.log"
+    rand = random.Random(4)
+    written = [(index, LOST, 0,
+                tuple(rand.randrange(1 << 10)
+                      for _ in range(rand.randrange(2000))))
+               for index in range(500)]
+    path.write_bytes(MAGIC + b"".join(
+        pack_record(moves, result, started, layout_id)
+        for (started, result, layout_id, moves) in written))
+    assert list(iter_records(str(path), chunk_size=1)) == written
+
+
+def test_results_checked(tmp_path):
+    path = tmp_path / "games.log"
+    layout = get_layout()
+    (codes, game_board) = random_game(layout, random.Random(3))
+    result = final_result(game_board.pegs, layout)
+    wrong = WON if result == LOST else LOST
+    path.write_bytes(MAGIC + pack_record(codes, result)
+                     + pack_record(codes, wrong)
+                     + pack_record(codes + codes[-1:], result))
+    totals = verify_log(str(path))
+    assert (totals["records"], totals["mismatched"], totals["invalid"]) == (
+        3, 1, 1)
+
+
+def test_damaged_logs(tmp_path):
+    path = tmp_path / "games.log"
+    path.write_bytes(b"not a log")
+    with pytest.raises(ValueError):
+        list(iter_records(str(path)))
+
+    record = pack_record([encode_move((True, 7, 5, "r"))], UNFINISHED)
+    assert len(record) == RECORD_HEADER.size + 2
+    path.write_bytes(MAGIC + record + record[:-1])
+    with pytest.raises(ValueError):
+        list(iter_records(str(path)))
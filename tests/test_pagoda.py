@@ -0,0 +1,40 @@
+"""
+Tests for the dead position checks in pagoda.py, which must never call
+a position that can be won dead.
+"""
+
+import pytest
+import bitboard
+from engine import new_game
+from layouts import LAYOUTS, get_layout
+from pagoda import dead_check, is_dead
+from puzzles import generate
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_winnable_positions_not_dead(name):
+    layout = get_layout(name)
+    check = dead_check(layout.playable, layout.finish_bit)
+
+    # Every position on the way through a puzzle's solution can be won
+    for (pegs, solution) in generate(layout, 300, min_pegs=2, max_pegs=20,
+                                     seed=name):
+        assert not check.dead(pegs)
+        for bits in solution:
+            pegs = bitboard.apply_jump(pegs, *bits)
+            assert not check.dead(pegs)
+        assert pegs == 1 << layout.finish_bit
+
+    # The warning in the game is given for the same positions
+    game_board = new_game(layout=layout)
+    for (pegs, _) in generate(layout, 20, seed=name):
+        game_board.set_position(pegs, 0)
+        assert not is_dead(game_board)
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_lone_peg_away_from_finish_dead(name):
+    layout = get_layout(name)
+    check = dead_check(layout.playable, layout.finish_bit)
+    for bit in bitboard.iter_bits(layout.playable):
+        assert check.dead(1 << bit) == (bit != layout.finish_bit)
@@ -0,0 +1,119 @@
+"""
+Tests for the puzzle packs in puzzles.py - generating puzzles, writing
+them to a pack and reading them back.
+"""
+
+import pytest
+import bitboard
+from engine import apply_move, check_win, jump_to_text
+from gamelog import move_text
+from layouts import LAYOUTS, get_layout
+from puzzles import (NO_MOVE, jump_code, code_jump,
+                     layout_symmetries, puzzle_key, generate, write_pack,
+                     PuzzlePack, open_puzzle_pack)
+
+# Puzzles generated for each layout
+NUM_PUZZLES = 200
+
+
+@pytest.fixture(name="pack", params=list(LAYOUTS))
+def fixture_pack(request, tmp_path):
+    """
+    Returns a (layout, puzzles, pack) tuple of a board Layout, puzzles
+    generated for it, and the PuzzlePack they were written to.
+    """
+    layout = get_layout(request.param)
+    puzzles = generate(layout, NUM_PUZZLES, seed=request.param)
+    path = tmp_path / "puzzles.pack"
+    write_pack(str(path), layout, puzzles)
+    return (layout, puzzles, PuzzlePack(str(path)))
+
+
+def test_move_codes_round_trip():
+    for name in LAYOUTS:
+        for (bits, cells) in get_layout(name).jump_at.values():
+            assert code_jump(jump_code(bits)) == bits
+            assert move_text(jump_code(bits)) == jump_to_text(cells)
+
+
+def test_generate(pack):
+    (layout, puzzles, _) = pack
+    assert len(puzzles) == NUM_PUZZLES
+    assert puzzles == generate(layout, NUM_PUZZLES, seed=layout.name)
+
+    symmetries = layout_symmetries(layout)
+    keys = {puzzle_key(pegs, symmetries) for (pegs, _) in puzzles}
+    assert len(keys) == len(puzzles)
+    for (pegs, solution) in puzzles:
+        assert not pegs & ~layout.playable
+        assert bitboard.popcount(pegs) == len(solution) + 1
+
+
+def test_pack_round_trip(pack):
+    (layout, puzzles, puzzle_pack) = pack
+    assert len(puzzle_pack) == len(puzzles)
+    assert puzzle_pack.covers(layout)
+    assert puzzle_pack.verify() == []
+    for (index, (pegs, solution)) in enumerate(puzzles):
+        assert puzzle_pack.pegs(index) == pegs
+        assert puzzle_pack.solution(index) == [jump_code(bits)
+                                               for bits in solution]
+
+    # Each puzzle is won by playing its solution as the player would
+    for index in (0, len(puzzles) // 2, len(puzzles) - 1):
+        game_board = puzzle_pack.new_game(layout, index=index)
+        assert game_board.pegs == puzzles[index][0]
+        for code in puzzle_pack.solution(index):
+            apply_move(game_board, move_text(code))
+        assert check_win(game_board)
+
+
+def test_pack_only_covers_its_layout(pack):
+    (layout, _, puzzle_pack) = pack
+    for name in LAYOUTS:
+        if name != layout.name:
+            assert not puzzle_pack.covers(get_layout(name))
+
+
+def test_verify_finds_broken_puzzles(pack, tmp_path):
+    (layout, puzzles, _) = pack
+
+    # Repeating the first move of a solution leaves the first jump
+    # already made in the puzzle's position, so it cannot be played
+    (pegs, solution) = puzzles[-1]
+    broken = puzzles[:-1] + [(pegs, solution[:1] + solution)]
+    path = tmp_path / "broken.pack"
+    write_pack(str(path), layout, broken)
+    assert PuzzlePack(str(path)).verify() == [len(puzzles) - 1]
+
+
+def test_damaged_packs(tmp_path):
+    path = tmp_path / "puzzles.pack"
+    path.write_bytes(b"not a pack")
+    with pytest.raises(ValueError):
+        PuzzlePack(str(path))
+    assert open_puzzle_pack(str(path)) is None
+    assert open_puzzle_pack(str(tmp_path / "missing.pack")) is None
+
+    layout = get_layout()
+    write_pack(str(path), layout, generate(layout, 3, seed=1))
+    data = path.read_bytes()
+    path.write_bytes(data[:-2])
+    with pytest.raises(ValueError):
+        PuzzlePack(str(path))
+
+    # A pack with no puzzles cannot be played
+    write_pack(str(path), layout, [])
+    assert len(PuzzlePack(str(path))) == 0
+    assert open_puzzle_pack(str(path)) is None
+
+
+def test_short_solutions_are_padded(tmp_path):
+    layout = get_layout()
+    puzzles = generate(layout, 20, min_pegs=2, max_pegs=6, seed=2)
+    path = tmp_path / "puzzles.pack"
+    write_pack(str(path), layout, puzzles)
+    puzzle_pack = PuzzlePack(str(path))
+    assert puzzle_pack.moves_per_puzzle == 5
+    assert NO_MOVE in puzzle_pack.codes
+    assert puzzle_pack.verify() == []
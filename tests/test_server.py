@@ -0,0 +1,81 @@
+"""
+Tests for the game sessions in server.py, driven by the keys a player
+would type.
+"""
+
+import random
+import pytest
+from engine import jump_to_text
+from layouts import get_layout
+from messages import DEAD_MSG, DEAD_START_MSG
+from pagoda import is_dead
+from server import GameSession, PLAYING
+
+
+def start_game(name):
+    """
+    Returns a GameSession on the layout with a name, and the output of
+    leaving its title screen to start a game.
+    """
+    session = GameSession(layout=get_layout(name))
+    session.start()
+    return (session, session.feed(b" ").decode("utf-8"))
+
+
+def type_line(session, line):
+    """
+    Types a line into a GameSession and returns the output.
+    """
+    return session.feed(line.encode("utf-8") + b"\r").decode("utf-8")
+
+
+def losing_moves(name, seed):
+    """
+    Returns the moves of a random game on the layout with a name, up to
+    and including the first move that leaves a position that cannot be
+    won while there are still moves left.
+    """
+    (session, _) = start_game(name)
+    rand = random.Random(seed)
+    moves = []
+    while session.state == PLAYING:
+        moves.append(jump_to_text(rand.choice(sorted(
+            session.game_board.moves))))
+        type_line(session, moves[-1])
+        if is_dead(session.game_board) and session.game_board.moves:
+            return moves
+    return None
+
+
+@pytest.mark.parametrize("name", ["soliterm", "english", "european"])
+def test_unwinnable_start(name):
+    (session, out) = start_game(name)
+    assert (DEAD_START_MSG in out) == is_dead(session.game_board)
+    assert (DEAD_START_MSG in out) == (name == "soliterm")
+
+
+@pytest.mark.parametrize("name", ["english", "european"])
+def test_warned_after_losing_move(name):
+    checked = 0
+    for seed in range(10):
+        moves = losing_moves(name, seed)
+        if moves is None:
+            continue
+        (session, _) = start_game(name)
+        for move in moves[:-1]:
+            assert DEAD_MSG not in type_line(session, move)
+        assert DEAD_MSG in type_line(session, moves[-1])
+
+        # Only the move that loses the game is warned about, until it
+        # is undone and played again
+        assert DEAD_MSG not in type_line(session, "u")
+        assert DEAD_MSG in type_line(session, moves[-1])
+        next_move = jump_to_text(sorted(session.game_board.moves)[0])
+        assert DEAD_MSG not in type_line(session, next_move)
+
+        # The same goes for a sequence of moves entered in one go
+        (session, _) = start_game(name)
+        assert DEAD_MSG in type_line(session, " ".join(moves))
+        checked += 1
+
+    assert checked
@@ -0,0 +1,165 @@
+"""
+Tests for the saved sessions in sessions.py - snapshots of games and
+the store they are kept in.
+"""
+
+import os
+import random
+import struct
+import time
+import pytest
+from engine import new_game, apply_move, jump_to_text, validate_format
+from history import History, SNAPSHOT_INTERVAL
+from layouts import LAYOUTS, get_layout
+from sessions import (HEADER, SUFFIX, pack_snapshot, unpack_snapshot,
+                      expire_sessions, open_session_store)
+
+TOKEN = "0123456789abcdef" * 2
+
+
+def random_game(layout, rand):
+    """
+    Plays a random game on a board Layout, recording it in a History,
+    and then takes back a random number of moves.
+    Returns the GameBoard and History.
+    """
+    game_board = new_game(layout=layout)
+    history = History(game_board)
+    while game_board.moves:
+        move = jump_to_text(rand.choice(sorted(game_board.moves)))
+        apply_move(game_board, move)
+        history.record(validate_format(move), game_board)
+    for _ in range(rand.randrange(history.turn + 1)):
+        history.undo(game_board)
+
+    return (game_board, history)
+
+
+def same_game(first, second):
+    """
+    Checks two (game_board, history) pairs hold the same game.
+    """
+    ((board, history), (other_board, other_history)) = (first, second)
+    assert board.pegs == other_board.pegs
+    assert (board.board_arr == other_board.board_arr).all()
+    assert board.num_pegs == other_board.num_pegs
+    assert board.num_turns == other_board.num_turns
+    assert board.moves == other_board.moves
+    assert history.turn == other_history.turn
+    assert history.moves == other_history.moves
+    assert history.snapshots == other_history.snapshots
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_snapshot_round_trip(name):
+    layout = get_layout(name)
+    rand = random.Random(name)
+    for _ in range(10):
+        game = random_game(layout, rand)
+        data = pack_snapshot(*game, 1234.5)
+        (game_board, history, started) = unpack_snapshot(data, layout)
+        restored = (game_board, history)
+        assert started == 1234.5
+        same_game(game, restored)
+
+        # The restored history can be followed both ways
+        while history.redo(game_board):
+            game[1].redo(game[0])
+            same_game(game, restored)
+        history.go_to(game_board, 0)
+        assert game_board.pegs == layout.pegs
+        assert game_board.moves == new_game(layout=layout).moves
+
+
+def test_damaged_snapshots():
+    layout = get_layout()
+    (game_board, history) = random_game(layout, random.Random(5))
+    assert len(history.moves) > SNAPSHOT_INTERVAL + 8
+    history.go_to(game_board, SNAPSHOT_INTERVAL + 8)
+    data = pack_snapshot(game_board, history, 0.0)
+    assert unpack_snapshot(data, layout) is not None
+    moves_start = HEADER.size + 30
+    snapshots_start = moves_start + 2 * len(history.moves)
+    replayed_start = moves_start + 2 * SNAPSHOT_INTERVAL
+
+    def changed(start, replacement):
+        return data[:start] + replacement + data[start + len(replacement):]
+
+    damaged = [
+        b"",
+        data[:-1],
+        data + b"\0",
+        changed(0, b"XXXX"),
+        # Turn after the end of the history
+        changed(5, struct.pack("<H", len(history.moves) + 1)),
+        # Pegs bitboard outside the board, or not the one the moves reach
+        changed(HEADER.size + 29, b"\xff"),
+        changed(HEADER.size, bytes([data[HEADER.size] ^ 1])),
+        # Move codes that are not a jump on the board, whether or not
+        # they have been played
+        changed(moves_start, struct.pack("=H", 0xFFFF)),
+        changed(moves_start, struct.pack("=H", (1 << 10) - 1)),
+        changed(snapshots_start - 2, struct.pack("=H", 0)),
+        # A move played twice since the last board snapshot, so the
+        # second time it is not legal
+        changed(replayed_start + 2,
+                data[replayed_start:replayed_start + 2]),
+        # Board snapshot with the wrong number of pegs for its turn
+        changed(snapshots_start + 30, data[snapshots_start:
+                                           snapshots_start + 30]),
+    ]
+    for bad_data in damaged:
+        assert bad_data != data
+        assert unpack_snapshot(bad_data, layout) is None
+
+    # A snapshot is only restored on the layout it was saved on
+    assert unpack_snapshot(data, get_layout("english")) is None
+
+
+def test_store(tmp_path):
+    directory = tmp_path / "state" / "sessions"
+    store = open_session_store(TOKEN, str(directory))
+    layout = get_layout("english")
+    assert store.load(layout) is None
+
+    game = random_game(layout, random.Random(6))
+    store.save(*game, 99.0)
+    (game_board, history, started) = store.load(layout)
+    same_game(game, (game_board, history))
+    assert started == 99.0
+    assert os.listdir(directory) == [TOKEN + SUFFIX]
+
+    # Only the user running the game can see the tokens
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert os.stat(store.path).st_mode & 0o777 == 0o600
+
+    store.delete()
+    store.delete()
+    assert store.load(layout) is None
+
+
+def test_store_refused(tmp_path, monkeypatch):
+    assert open_session_store("../" + TOKEN, str(tmp_path)) is None
+    assert open_session_store("", str(tmp_path)) is None
+    monkeypatch.delenv("SOLITERM_SESSION", raising=False)
+    assert open_session_store(directory=str(tmp_path)) is None
+
+    # A directory other users could use is not trusted with tokens
+    tmp_path.chmod(0o755)
+    assert open_session_store(TOKEN, str(tmp_path)) is None
+    tmp_path.chmod(0o700)
+    assert open_session_store(TOKEN, str(tmp_path)) is not None
+
+
+def test_expire_sessions(tmp_path):
+    now = time.time()
+    ages = {"old": 2 * 24 * 60 * 60, "a": 30, "b": 20, "c": 10}
+    for (name, age) in ages.items():
+        path = tmp_path / (name + SUFFIX)
+        path.write_bytes(b"")
+        os.utime(path, (now - age, now - age))
+    (tmp_path / "other").write_bytes(b"")
+
+    assert expire_sessions(str(tmp_path), max_sessions=2) == 2
+    assert sorted(os.listdir(tmp_path)) == ["b" + SUFFIX, "c" + SUFFIX,
+                                            "other"]
@@ -0,0 +1,27 @@
+"""
+Tests for the solver in solver.py.
+"""
+
+from layouts import get_layout
+from puzzles import generate
+from solver import Solver
+
+
+def test_reused_on_another_board():
+    # Puzzles on the Soliterm cross that fit inside the English board
+    # but cannot be won there, as they need holes outside it. Both
+    # boards finish in the centre, so only the board tells their
+    # results apart.
+    english = get_layout("english")
+    cross = get_layout()
+    solver = Solver()
+    checked = 0
+    for (pegs, _) in generate(cross, 500, min_pegs=4, max_pegs=8, seed=1):
+        if pegs & ~english.playable:
+            continue
+        result = solver.solve_position(pegs, english.playable)
+        if result["winnable"] is False and result["nodes"]:
+            assert solver.solve_position(pegs, cross.playable)["winnable"]
+            checked += 1
+
+    assert checked